@@ -12,6 +12,8 @@ def create_app():
     # Set up configuration using environment variables
     app.config['MP3_DIRECTORY'] = os.getenv("MP3_DIRECTORY", "default/music/path")
     app.config['EXPORT_DIRECTORY'] = os.getenv("EXPORT_DIRECTORY", "app/services/metadata_exports/")
+    # Let a front-end server (nginx, Apache) send downloads itself instead of streaming them through Python
+    app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE", "False") == "True"
 
     # Ensure necessary directories exist
     initialize_directories(app.config['MP3_DIRECTORY'], app.config['EXPORT_DIRECTORY'])
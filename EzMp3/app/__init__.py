@@ -11,6 +11,8 @@ def create_app():
     # Load configuration from environment variables
     app.config['MP3_DIRECTORY'] = os.getenv("MP3_DIRECTORY", "default/path/to/music")
     app.config['EXPORT_DIRECTORY'] = os.getenv("EXPORT_DIRECTORY", "default/path/to/exports")
+    # Let a front-end server (nginx, Apache) send downloads itself instead of streaming them through Python
+    app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE", "False") == "True"
 
     # Ensure necessary directories exist
     initialize_directories(app.config['MP3_DIRECTORY'], app.config['EXPORT_DIRECTORY'])
@@ -1,9 +1,27 @@
 import logging
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, g, request, jsonify, send_file
 import os
-from EzMp3.app.services.ai_services import get_music_metadata
-from EzMp3.app.utils.music_tag_editor import change_mp3_metadata
-import json
+import time
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from EzMp3.app.services.ai_services import get_music_metadata_with_sources
+from EzMp3.app.services.album_resolver import ALBUM_MODE, group_by_album, resolve_album
+from EzMp3.app.services.artist_cache import batch_mode
+from EzMp3.app.services.metadata_cache import MetadataCache
+from EzMp3.app.services.job_queue import JobQueue
+from EzMp3.app.services.export_store import get_export_store
+from EzMp3.app.services.rate_limiter import rate_limiter
+from EzMp3.app.services.circuit_breaker import breaker_states
+from EzMp3.app.services.single_flight import single_flight_stats
+from EzMp3.app.services.ttl_cache import ttl_cache_stats
+from EzMp3.app.services.providers import provider_registry_status
+from EzMp3.app.services.query_planner import fallback_queries, query_key
+from EzMp3.app.services.tag_hints import plan_from_tags, tag_stats
+from EzMp3.app.services.metrics import registry, counter, histogram, callback_metric, SIZE_BUCKETS
+from EzMp3.app.utils.music_tag_editor import change_mp3_metadata, read_mp3_tags
+from EzMp3.app.utils.mp3_hashing import AudioHasher, tag_hash
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,42 +30,261 @@ logger = logging.getLogger(__name__)
 api = Blueprint('api', __name__)
 
 MUSIC_DIR = os.getenv("MP3_DIRECTORY", 'app/music_dir/')
-EXPORT_DIR = 'app/services/metadata_exports/'
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 8))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 500))
+BATCH_MAX_ARCHIVE_BYTES = int(os.getenv("BATCH_MAX_ARCHIVE_BYTES", 2 << 30))  # Uncompressed MP3s in one zip
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1 << 16))
+ETAG_CACHE_SIZE = 4096
 
 # Ensure directories exist
 os.makedirs(MUSIC_DIR, exist_ok=True)
-os.makedirs(EXPORT_DIR, exist_ok=True)
 
+metadata_cache = MetadataCache()
+job_queue = JobQueue()
+export_store = get_export_store()
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch")
+etag_cache = {}  # (path, size, mtime_ns) -> ETag
 
-def save_metadata(song_title, metadata):
-    """Saves the metadata to a JSON file."""
-    filename = f"{song_title.replace(' ', '_').lower()}_metadata.json"
-    file_path = os.path.join(EXPORT_DIR, filename)
+request_duration = histogram('ezmp3_http_request_duration_seconds', 'Duration of API requests.',
+                             ['endpoint', 'method', 'status'])
+upload_bytes = counter('ezmp3_upload_bytes_total', 'Bytes received in uploaded MP3 files.')
+upload_files = counter('ezmp3_uploads_total', 'Uploaded MP3 files, by whether their audio was already known.',
+                       ['result'])
+upload_size = histogram('ezmp3_upload_size_bytes', 'Size of uploaded MP3 files.', buckets=SIZE_BUCKETS)
+tag_write_duration = histogram('ezmp3_tag_write_duration_seconds', 'Time spent writing ID3 tags to a file.')
+tag_write_bytes = histogram('ezmp3_tag_write_bytes', 'Bytes written per tag update; only the tag when it fits in place.',
+                            buckets=SIZE_BUCKETS)
 
-    with open(file_path, 'w') as file:
-        json.dump(metadata, file, indent=4)
+# Read at scrape time from the components that already keep these numbers
+callback_metric('ezmp3_metadata_cache_lookups_total', 'Metadata cache lookups by result.',
+                lambda: {(result,): metadata_cache.stats[key] for result, key in
+                         (('hit', 'hits'), ('negative_hit', 'negative_hits'), ('miss', 'misses'))},
+                ['result'], type='counter')
+callback_metric('ezmp3_metadata_cache_hit_ratio', 'Share of metadata cache lookups answered from the cache.',
+                lambda: metadata_cache.get_stats()['hit_rate'])
+callback_metric('ezmp3_job_queue_jobs', 'Asynchronous upload jobs by state.',
+                lambda: {(state,): count for state, count in job_queue.depth().items()}, ['state'])
+callback_metric('ezmp3_rate_limiter_waiting', 'Provider calls waiting for a rate limit token.',
+                lambda: {(provider,): count for provider, count in rate_limiter.queue_depth().items()}, ['provider'])
+callback_metric('ezmp3_circuit_breaker_open', 'Whether a provider circuit breaker is open (1) or not (0).',
+                lambda: {(provider,): int(state['state'] == 'open') for provider, state in breaker_states().items()},
+                ['provider'])
+callback_metric('ezmp3_existing_tag_lookups_total', 'Uploads by how their existing tags were used: lookup avoided, '
+                'lookup narrowed by tag hints, or plain lookup by name.',
+                lambda: {(outcome,): count for outcome, count in tag_stats().items()}, ['outcome'], type='counter')
+callback_metric('ezmp3_export_queue_records', 'Export records waiting for the background writer.',
+                export_store.queue_depth)
+callback_metric('ezmp3_single_flight_coalesced_total', 'Lookups that waited on an identical lookup in flight.',
+                lambda: {(group,): stats['coalesced'] for group, stats in single_flight_stats().items()},
+                ['group'], type='counter')
 
-    logger.info(f"Metadata saved to {file_path}")
-    return file_path
 
+@api.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
 
-def process_metadata(file_path, song_title):
-    """Process the metadata and update MP3 file."""
-    resolved_metadata = get_music_metadata(song_title)
+
+@api.after_request
+def record_request(response):
+    request_duration.observe(time.perf_counter() - g.request_start, request.endpoint or 'unknown',
+                             request.method, response.status_code)
+    return response
+
+
+def lookup_metadata(song_title, artist=None, album=None):
+    """Resolve metadata for a title (and artist and album, when known), answering from the cache when possible."""
+    cache_title = " - ".join(part for part in (artist, album, song_title) if part)
+    found, resolved_metadata, _ = metadata_cache.get(cache_title)
+    if found:
+        logger.info(f"Metadata cache hit for '{cache_title}'.")
+        return resolved_metadata
+
+    resolved_metadata, raw_metadata = get_music_metadata_with_sources(song_title, artist, album)
+    if resolved_metadata is None and raw_metadata.get('unanswered'):
+        # Not found only because providers failed or timed out; caching that would hide the track after an outage
+        logger.info(f"No metadata for '{cache_title}', not caching the miss: "
+                    f"{', '.join(raw_metadata['unanswered'])} did not answer.")
+        return None
+    metadata_cache.put(cache_title, resolved_metadata, raw_metadata)
+    return resolved_metadata
+
+
+def lookup_query(query):
+    """lookup_metadata for a planned query (see query_planner), then for its fallbacks until one is found."""
+    for attempt in [query, *fallback_queries(query)]:
+        metadata = lookup_metadata(attempt['title'], attempt['artist'], attempt['album'])
+        if metadata:
+            return metadata
+    return None
+
+
+def store_upload(stream):
+    """Stream an upload into MUSIC_DIR in chunks, hashing its audio payload on the way.
+
+    Files are stored under their audio hash, so uploads that share a name no longer overwrite each
+    other. Returns (file_path, audio_hash, known_metadata); known_metadata is set when the same audio
+    was already tagged, in which case the new copy is dropped and the stored file is reused.
+    """
+    hasher = AudioHasher()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=MUSIC_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(chunk)
+                target.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    upload_bytes.inc(amount=size)
+    upload_size.observe(size)
+
+    audio_hash = hasher.hexdigest()
+    file_path = os.path.join(MUSIC_DIR, f"{audio_hash}.mp3")
+    known_metadata = metadata_cache.get_content(audio_hash)
+    if known_metadata is not None and os.path.exists(file_path):
+        upload_files.inc('duplicate')
+        os.remove(tmp_path)
+        logger.info(f"Audio {audio_hash} was already processed, reusing {file_path}")
+        return file_path, audio_hash, known_metadata
+
+    upload_files.inc('new')
+    os.replace(tmp_path, file_path)
+    return file_path, audio_hash, None
+
+
+def download_url(file_path, filename):
+    """Download URL for a stored file that keeps the name it was uploaded with."""
+    return f"/api/download/{os.path.basename(file_path)}?name={quote(filename)}"
+
+
+def file_etag(file_path):
+    """Strong ETag for a stored file: its audio hash (the file name) plus the hash of its current tag bytes.
+
+    It changes exactly when a tag write changes the file. Only the tag is read, and the result is
+    memoized on size and mtime so repeated downloads don't re-read it.
+    """
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_size, stat.st_mtime_ns)
+    etag = etag_cache.get(key)
+    if etag is None:
+        if len(etag_cache) >= ETAG_CACHE_SIZE:
+            etag_cache.clear()
+        audio_part = os.path.splitext(os.path.basename(file_path))[0]
+        etag = etag_cache[key] = f"{audio_part}-{tag_hash(file_path)}"
+    return etag
+
+
+def process_metadata(file_path, song_title, audio_hash=None):
+    """Process the metadata and update MP3 file.
+
+    Complete existing tags are kept as they are, without any lookup; partial ones and the file name
+    (e.g. "Artist - Title") narrow the lookup.
+    """
+    tag_metadata, query = plan_from_tags(read_mp3_tags(file_path), song_title)
+    if tag_metadata is not None:
+        logger.info(f"'{song_title}' is already fully tagged, skipping the lookup.")
+        return apply_metadata(file_path, song_title, tag_metadata, audio_hash, write_tags=False)
+    return apply_metadata(file_path, song_title, lookup_query(query), audio_hash)
+
+
+def apply_metadata(file_path, song_title, resolved_metadata, audio_hash=None, write_tags=True):
+    """Write already resolved metadata to the MP3 file and export it; returns whether there was any."""
     if resolved_metadata:
-        change_mp3_metadata(
-            file_path,
-            resolved_metadata.get('title'),
-            resolved_metadata.get('contributing_artists'),
-            resolved_metadata.get('album_artist'),
-            resolved_metadata.get('album'),
-            resolved_metadata.get('year'),
-            ', '.join(resolved_metadata.get('genres', []))
-        )
-        metadata_file_path = save_metadata(song_title, resolved_metadata)
-        return True, metadata_file_path
+        if write_tags:
+            with tag_write_duration.time():
+                bytes_written = change_mp3_metadata(
+                    file_path,
+                    resolved_metadata.get('title'),
+                    resolved_metadata.get('contributing_artists'),
+                    resolved_metadata.get('album_artist'),
+                    resolved_metadata.get('album'),
+                    resolved_metadata.get('year'),
+                    ', '.join(resolved_metadata.get('genres', []))
+                )
+            if bytes_written:
+                tag_write_bytes.observe(bytes_written)
+        export_store.append('tagged', song_title, resolved_metadata, audio_hash=audio_hash)
+        if audio_hash:
+            metadata_cache.put_content(audio_hash, resolved_metadata)
+        return True
     logger.warning(f"No metadata found for '{song_title}'.")
-    return False, None
+    return False
+
+
+def run_upload_job(file_path, song_title, audio_hash, filename):
+    """Background job body for asynchronous uploads."""
+    if not process_metadata(file_path, song_title, audio_hash):
+        raise LookupError(f"No metadata found for '{song_title}'.")
+    return {"download_url": download_url(file_path, filename)}
+
+
+def mp3_members(zf):
+    return [member for member in zf.infolist() if not member.is_dir() and member.filename.endswith('.mp3')]
+
+
+def batch_limit_error():
+    """Check a batch upload against BATCH_MAX_FILES and BATCH_MAX_ARCHIVE_BYTES before anything is stored.
+
+    Returns an error message, or None if the batch is within its limits.
+    """
+    count = sum(1 for file in request.files.getlist('files') if file.filename and file.filename.endswith('.mp3'))
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        with zipfile.ZipFile(archive.stream) as zf:
+            members = mp3_members(zf)
+        archive.stream.seek(0)
+        count += len(members)
+        # Extracting never reads past a member's declared size, so the declared sizes bound what is written
+        if sum(member.file_size for member in members) > BATCH_MAX_ARCHIVE_BYTES:
+            return f"Archive is too large, the limit is {BATCH_MAX_ARCHIVE_BYTES} bytes uncompressed."
+    if count > BATCH_MAX_FILES:
+        return f"Too many files, the limit is {BATCH_MAX_FILES}."
+    return None
+
+
+def save_batch_uploads():
+    """Store every MP3 from the multipart 'files' field and any 'archive' zip.
+
+    Returns a list of (filename, file_path, audio_hash, known_metadata, folder) tuples; folder is the
+    directory the file had in the archive or the client's relative path, e.g. for album grouping.
+    If storing fails part way, the files this batch added are removed again.
+    """
+    uploads = []
+    try:
+        for file in request.files.getlist('files'):
+            if file.filename and file.filename.endswith('.mp3'):
+                uploads.append((os.path.basename(file.filename), *store_upload(file.stream),
+                                os.path.dirname(file.filename)))
+
+        archive = request.files.get('archive')
+        if archive and archive.filename:
+            with zipfile.ZipFile(archive.stream) as zf:
+                for member in mp3_members(zf):
+                    with zf.open(member) as source:
+                        uploads.append((os.path.basename(member.filename), *store_upload(source),
+                                        os.path.dirname(member.filename)))
+    except BaseException:
+        # Duplicates point at files stored by earlier uploads, so only new files are removed
+        for _, file_path, _, known_metadata, _ in uploads:
+            if known_metadata is None and os.path.exists(file_path):
+                os.remove(file_path)
+        raise
+
+    return uploads
+
+
+def wants_album_mode():
+    """Whether files from one album should be resolved together; the 'album_mode' field overrides ALBUM_MODE."""
+    value = request.args.get('album_mode') or request.form.get('album_mode')
+    return ALBUM_MODE if value is None else value.lower() in ('1', 'true', 'yes')
+
+
+def wants_async():
+    """Whether the client asked for the upload to be processed in the background."""
+    value = request.args.get('async') or request.form.get('async') or ''
+    return value.lower() in ('1', 'true', 'yes')
 
 
 @api.route("/", methods=["GET"])
@@ -57,6 +294,39 @@ def welcome():
     return jsonify({"message": "Welcome to the Music Metadata API! Use /api/upload to upload music files."})
 
 
+@api.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Report metadata cache counters, in-memory provider caches, lookups shared with one in flight and lookups
+    avoided by existing tags."""
+    return jsonify({**metadata_cache.get_stats(), "memory_caches": ttl_cache_stats(),
+                    "single_flight": single_flight_stats(), "existing_tags": tag_stats()})
+
+
+@api.route("/providers", methods=["GET"])
+def provider_status():
+    """Report which providers are enabled and loaded, their rate limits, queued calls and circuit breaker health."""
+    return jsonify({"providers": provider_registry_status(), "rate_limits": rate_limiter.get_stats(),
+                    "circuit_breakers": breaker_states()})
+
+
+@api.route("/exports", methods=["GET"])
+def exports():
+    """Read exported metadata records back, newest first, by title and/or audio hash."""
+    title = request.args.get('title')
+    audio_hash = request.args.get('audio_hash')
+    if not title and not audio_hash:
+        return jsonify({"error": "Pass a title or an audio_hash."}), 400
+    records = export_store.query(title, audio_hash, request.args.get('kind'),
+                                 limit=min(request.args.get('limit', 20, type=int), 500))
+    return jsonify({"records": records}), 200
+
+
+@api.route("/metrics", methods=["GET"])
+def metrics():
+    """Expose request, upload, provider, cache, tag-write and queue metrics in the Prometheus text format."""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 @api.route("/upload", methods=["POST"])
 def upload_file():
     """API endpoint for Android app to upload MP3 file and analyze metadata."""
@@ -73,34 +343,165 @@ def upload_file():
     if not file.filename.endswith('.mp3'):
         return jsonify({"error": "Only MP3 files are allowed."}), 400
 
-    # Save the file to the music directory
-    file_path = os.path.join(MUSIC_DIR, file.filename)
-    file.save(file_path)
+    # Refuse a background upload the queue can't take before writing anything to disk
+    background = wants_async()
+    if background and job_queue.is_full():
+        logger.warning("Job queue is full, rejecting asynchronous upload.")
+        return jsonify({"error": "Server is busy, try again later."}), 503, {"Retry-After": "5"}
+
+    # Stream the file to the music directory, stored under the hash of its audio
+    file_path, audio_hash, known_metadata = store_upload(file.stream)
     logger.info(f"File saved to {file_path}")
 
     # Use the filename (without extension) as the song title
     song_title = os.path.splitext(file.filename)[0]
     logger.info(f"Extracted song title: {song_title}")
 
+    if known_metadata is not None:
+        return jsonify({
+            "message": f"Metadata processed for '{song_title}'.",
+            "download_url": download_url(file_path, file.filename)
+        }), 200
+
+    if background:
+        job_id = job_queue.submit(run_upload_job, file_path, song_title, audio_hash, file.filename)
+        if job_id is None:
+            # The queue filled up while the file was being stored; nothing will ever process this copy
+            logger.warning("Job queue is full, rejecting asynchronous upload.")
+            os.remove(file_path)
+            return jsonify({"error": "Server is busy, try again later."}), 503, {"Retry-After": "5"}
+
+        status_url = f"/api/jobs/{job_id}"
+        return jsonify({"job_id": job_id, "status_url": status_url}), 202, {"Location": status_url}
+
     # Process the metadata
-    success, metadata_file = process_metadata(file_path, song_title)
-    if success:
+    if process_metadata(file_path, song_title, audio_hash):
         # Respond with the download URL and the actual file name
         return jsonify({
             "message": f"Metadata processed for '{song_title}'.",
-            "download_url": f"/api/download/{os.path.basename(file_path)}"
+            "download_url": download_url(file_path, file.filename)
         }), 200
     else:
         return jsonify({"error": f"No metadata found for '{song_title}'."}), 404
 
 
+@api.route("/upload/batch", methods=["POST"])
+def upload_batch():
+    """Upload many MP3 files (multipart 'files' and/or a zip 'archive') and tag them in one request.
+
+    Files that share a folder and album (or numbered files by one artist in one folder) are resolved
+    together from the album's tracklist unless album_mode=false is passed.
+    """
+    logger.info("Received batch upload request.")
+
+    try:
+        # Limits are checked before anything is stored, so a rejected batch leaves nothing behind
+        limit_error = batch_limit_error()
+        if limit_error:
+            return jsonify({"error": limit_error}), 413
+        uploads = save_batch_uploads()
+    except zipfile.BadZipFile:
+        return jsonify({"error": "Archive is not a valid zip file."}), 400
+
+    if not uploads:
+        return jsonify({"error": "No MP3 files in request."}), 400
+    logger.info(f"Saved {len(uploads)} files for batch processing.")
+
+    # Files whose own tags are complete need no lookup; partial tags narrow it. Identical audio is stored once.
+    plans = {}
+    files = {}  # file path -> (folder, query, tags) of the files that need a lookup
+    for filename, file_path, _, known_metadata, folder in uploads:
+        if known_metadata is None and file_path not in plans:
+            tags = read_mp3_tags(file_path)
+            plans[file_path] = plan_from_tags(tags, os.path.splitext(filename)[0])
+            if plans[file_path][0] is None:
+                files[file_path] = (folder, plans[file_path][1], tags)
+
+    # Files from one album are resolved together from its tracklist, the rest one by one
+    albums, singles = group_by_album(files) if wants_album_mode() else ([], list(files))
+
+    # Look up each distinct title, artist and album only once, however many files share it
+    queries = {}
+    for file_path in singles:
+        queries.setdefault(query_key(files[file_path][1]), files[file_path][1])
+    # In batch mode the lookups' artist genres are fetched with bulk calls
+    resolved = {}  # file path -> metadata
+    with batch_mode():
+        album_jobs = [(keys, batch_pool.submit(resolve_album, {key: files[key][1] for key in keys}, lookup_query))
+                      for keys in albums]
+        lookups = {key: batch_pool.submit(lookup_query, query) for key, query in queries.items()}
+        found = {}
+        for key, future in lookups.items():
+            try:
+                found[key] = future.result()
+            except Exception as e:
+                logger.error(f"Lookup failed for '{queries[key]['title']}': {e}")
+                found[key] = None
+        for file_path in singles:
+            resolved[file_path] = found[query_key(files[file_path][1])]
+        for keys, future in album_jobs:
+            try:
+                resolved.update(future.result())
+            except Exception as e:
+                logger.error(f"Album lookup failed for {len(keys)} files: {e}")
+
+    # Tag each stored file once
+    tag_writes = {}
+    for filename, file_path, audio_hash, known_metadata, _ in uploads:
+        if known_metadata is None and file_path not in tag_writes:
+            song_title = os.path.splitext(filename)[0]
+            tag_metadata, query = plans[file_path]
+            if tag_metadata is not None:
+                tag_writes[file_path] = batch_pool.submit(apply_metadata, file_path, song_title, tag_metadata,
+                                                          audio_hash, False)
+            else:
+                tag_writes[file_path] = batch_pool.submit(apply_metadata, file_path, song_title,
+                                                          resolved.get(file_path), audio_hash)
+
+    manifest = []
+    for filename, file_path, _, known_metadata, _ in uploads:
+        song_title = os.path.splitext(filename)[0]
+        entry = {"filename": filename, "title": song_title}
+        if known_metadata is not None or tag_writes[file_path].result():
+            entry["download_url"] = download_url(file_path, filename)
+        else:
+            entry["error"] = f"No metadata found for '{song_title}'."
+        manifest.append(entry)
+
+    return jsonify({
+        "files": manifest,
+        "processed": sum(1 for entry in manifest if "download_url" in entry),
+        "lookups": len(lookups),
+        "albums": len(albums),
+        "lookups_avoided": sum(1 for tag_metadata, _ in plans.values() if tag_metadata is not None)
+    }), 200
+
+
+@api.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Report the state of an asynchronous upload and its download URL once done."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+
 @api.route("/download/<filename>", methods=["GET"])
 def download_file(filename):
-    """Serve the updated MP3 file for download."""
+    """Serve the updated MP3 file for download.
+
+    Supports Range/If-Range, If-None-Match and If-Modified-Since (answered with 206/304). Full responses
+    go through the server's wsgi.file_wrapper (sendfile on e.g. gunicorn), or X-Sendfile when
+    USE_X_SENDFILE is enabled.
+    """
     file_path = os.path.join(MUSIC_DIR, filename)
     if os.path.exists(file_path):
         logger.info(f"File {filename} found for download.")
-        return send_file(file_path, as_attachment=True, download_name=filename)
+        response = send_file(file_path, as_attachment=True, download_name=request.args.get('name') or filename,
+                             conditional=True, etag=file_etag(file_path))
+        # Advertise range support up front so clients can resume after a dropped connection
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
 
     else:
         logger.error(f"File {filename} not found.")
@@ -1,33 +1,60 @@
-from EzMp3.app.services.spotify_services import fetch_spotify_metadata
-from EzMp3.app.services.musicbrainz_services import fetch_musicbrainz_metadata
-from EzMp3.app.services.lastfm_services import fetch_lastfm_tags
-from EzMp3.app.services.deezer_services import fetch_deezer_metadata
-from EzMp3.app.services.discog_services import get_discogs_metadata
+from EzMp3.app.services.providers import get_provider
+from EzMp3.app.services.artist_cache import canonical_name
+from EzMp3.app.services.circuit_breaker import get_breaker, CircuitOpenError
+from EzMp3.app.services.rate_limiter import rate_limiter, RateLimitTimeout
+from EzMp3.app.services.metadata_cache import normalize_title
+from EzMp3.app.services.single_flight import get_group
+from EzMp3.app.services.local_catalog import get_catalog
+from EzMp3.app.services.export_store import get_export_store
+from EzMp3.app.services.metrics import counter, histogram
+from EzMp3.app.services.candidate_scoring import collect_candidates, score_candidates, clean_title
 from dotenv import load_dotenv
-from fuzzywuzzy import fuzz
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+import time
 import os
-import json
 load_dotenv()
 
+# Per-provider deadlines (seconds); anything slower is left out of the resolution
+PROVIDER_TIMEOUTS = {
+    'spotify': float(os.getenv("SPOTIFY_TIMEOUT", 5)),
+    'deezer': float(os.getenv("DEEZER_TIMEOUT", 5)),
+    'discogs': float(os.getenv("DISCOGS_TIMEOUT", 5)),
+    'musicbrainz': float(os.getenv("MUSICBRAINZ_TIMEOUT", 5)),
+    'lastfm': float(os.getenv("LASTFM_TIMEOUT", 5)),
+    'theaudiodb': float(os.getenv("THEAUDIODB_TIMEOUT", 5)),
+}
+
+# Enabled track lookups; TheAudioDB also needs an artist, which it takes from the providers that answered first
+TRACK_PROVIDERS = ('spotify', 'deezer', 'discogs', 'musicbrainz', 'theaudiodb')
+PROVIDERS = {name: get_provider(name) for name in TRACK_PROVIDERS if get_provider(name)}
+fetch_lastfm_tags = get_provider('lastfm')
+
+
+def parse_tiers(value):
+    """Parse "spotify,deezer;musicbrainz;discogs,theaudiodb" into a list of provider tiers."""
+    tiers = [[name.strip() for name in tier.split(',') if name.strip() in PROVIDERS] for tier in value.split(';')]
+    return [tier for tier in tiers if tier]
 
-def best_match(source_value, candidate_values):
-    """Return the best match from candidate values based on similarity to the source value."""
-    if not source_value or not candidate_values:
-        return None
 
-    best_candidate = None
-    highest_ratio = 0
+# Fast, reliable providers first; a later tier only runs if fields are still missing or as a hedge
+PROVIDER_TIERS = parse_tiers(os.getenv("PROVIDER_TIERS", "spotify,deezer;musicbrainz;discogs,theaudiodb"))
+PLANNER_MIN_AGREEMENT = int(os.getenv("PLANNER_MIN_AGREEMENT", 2))  # Providers that must agree on title and artist
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 1.5))  # Used until a provider has latency history
+REQUIRED_FIELDS = ('title', 'contributing_artists', 'album', 'year', 'genres')
 
-    for candidate in candidate_values:
-        if candidate:  # Ensure the candidate is not None or empty
-            ratio = fuzz.ratio(source_value.lower(), candidate.lower())
-            if ratio > highest_ratio:
-                highest_ratio = ratio
-                best_candidate = candidate
+# Shared across calls so a provider that overruns its deadline does not block the caller
+provider_pool = ThreadPoolExecutor(max_workers=int(os.getenv("PROVIDER_WORKERS", 16)),
+                                   thread_name_prefix="provider")
 
-    return best_candidate if highest_ratio >= 80 else (
-        candidate_values[0] if candidate_values else None)  # Fallback to the first candidate
+provider_latency = histogram('ezmp3_provider_request_duration_seconds',
+                             'Duration of provider lookups, including rate limiter waits.', ['provider'])
+provider_errors = counter('ezmp3_provider_errors_total', 'Provider lookups that failed, or were skipped by an open '
+                          'circuit or a rate limit backlog.', ['provider', 'kind'])
+catalog_lookups = counter('ezmp3_local_catalog_lookups_total', 'Local catalog lookups by result.', ['result'])
+
+# Concurrent lookups of the same track (e.g. a popular upload arriving from many clients) share one run
+track_lookups = get_group('track_lookups')
 
 
 def parse_year(year_string):
@@ -48,134 +75,308 @@ def parse_year(year_string):
         return None  # Return None if parsing fails
 
 
-def ai_resolve_metadata(mb_metadata, spotify_metadata, deezer_metadata, discogs_metadata, lastfm_tags):
+def ai_resolve_metadata(mb_metadata, spotify_metadata, deezer_metadata, discogs_metadata, lastfm_tags,
+                        audiodb_metadata=None, query=None):
+    """Combine provider results into one set of tags; missing providers are skipped.
+
+    Title, artist, album and year are decided by weighted consensus over every candidate the
+    providers returned, scored against the query; 'confidence' holds a 0-1 score per field.
+    """
+    spotify_metadata = spotify_metadata or {}
+    deezer_metadata = deezer_metadata or {}
+    audiodb_metadata = audiodb_metadata or {}
     final_metadata = {}
 
-    title_candidates = [
-        spotify_metadata.get('title'),
-        deezer_metadata.get('title'),
-        mb_metadata.get('title'),
-        discogs_metadata[0].get('title') if discogs_metadata else None
-    ]
-    title = next((t for t in title_candidates if t), None)
+    candidates = collect_candidates({
+        'spotify': spotify_metadata,
+        'deezer': deezer_metadata,
+        'musicbrainz': mb_metadata,
+        'discogs': discogs_metadata,
+        'theaudiodb': audiodb_metadata,
+    })
+    values, confidence = score_candidates(query, candidates)
+
+    title = values['title']
     if title:
-        title = title.split(' - ')[0]
-        title = title.split('(')[0].strip()
+        title = clean_title(title)
     final_metadata['title'] = title
 
-    artist_candidates = [
-        spotify_metadata.get('artist'),
-        deezer_metadata.get('album_artist'),
-        mb_metadata.get('artist'),
-        discogs_metadata[0].get('artist')[0] if discogs_metadata and discogs_metadata[0].get('artist') else None
-    ]
-    final_metadata['contributing_artists'] = next((a for a in artist_candidates if a), None)
+    final_metadata['contributing_artists'] = values['artist']
 
     final_metadata['album_artist'] = final_metadata['contributing_artists']
 
-    album_candidates = [
-        spotify_metadata.get('album'),
-        deezer_metadata.get('album'),
-        mb_metadata.get('album'),
-        discogs_metadata[0].get('title') if discogs_metadata else None
-    ]
-    album = next((a for a in album_candidates if a), None)
+    album = values['album']
     if album:
         album = album.split('(')[0].strip()
     final_metadata['album'] = album
 
-    year_candidates = [
-        spotify_metadata.get('year'),
-        deezer_metadata.get('year'),
-        mb_metadata.get('year'),
-        discogs_metadata[0].get('year') if discogs_metadata else None
-    ]
-    years = [int(y) for y in year_candidates if y and y.isdigit()]
-    final_metadata['year'] = str(min(years)) if years else None
+    final_metadata['year'] = values['year']
 
     final_metadata['genres'] = (
         spotify_metadata.get('genres') or
         deezer_metadata.get('genres') or
+        audiodb_metadata.get('genres') or
         lastfm_tags or
         []
     )
 
+    final_metadata['confidence'] = confidence
+
     return final_metadata
 
 
-def export_raw_and_resolved_metadata_to_json(spotify_metadata, mb_metadata, deezer_metadata, discogs_metadata,
-                                             lastfm_tags, resolved_metadata, track_name):
-    """Export the raw metadata from all sources and the resolved metadata to a JSON file."""
-    # Define the filename, using the track name and current timestamp to avoid overwriting
-    filename = f"{track_name.replace(' ', '_').lower()}_metadata_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-
-    # Path to save the file
-    output_dir = "metadata_exports"
-    os.makedirs(output_dir, exist_ok=True)  # Ensure directory exists
-
-    # Organize the metadata into a dictionary
-    metadata_export = {
-        "spotify_metadata": spotify_metadata,
-        "musicbrainz_metadata": mb_metadata,
-        "deezer_metadata": deezer_metadata,
-        "discogs_metadata": discogs_metadata,
-        "lastfm_tags": lastfm_tags,
-        "resolved_metadata": resolved_metadata  # The final metadata resolved by AI
+def export_metadata(track_name, results, resolved_metadata):
+    """Queue the raw metadata from all sources and the resolved metadata for the export store."""
+    raw_metadata = {
+        "spotify_metadata": results.get('spotify'),
+        "musicbrainz_metadata": results.get('musicbrainz'),
+        "deezer_metadata": results.get('deezer'),
+        "discogs_metadata": results.get('discogs'),
+        "lastfm_tags": results.get('lastfm'),
+        "theaudiodb_metadata": results.get('theaudiodb'),
     }
+    get_export_store().append('lookup', track_name, resolved_metadata, raw=raw_metadata)
 
-    # Write the metadata to a file
-    filepath = os.path.join(output_dir, filename)
-    with open(filepath, 'w') as json_file:
-        json.dump(metadata_export, json_file, indent=4)
-
-    print(f"Raw and resolved metadata for '{track_name}' has been exported to {filepath}")
 
+def fetch_provider(name, fetch, *args, failures=None):
+    """Run a single provider lookup through its circuit breaker, turning errors into an empty result.
 
-def get_music_metadata(track):
-    """Fetch metadata from all sources and combine results with AI."""
-    print(f"Fetching metadata for the song: {track}...")
-
-    # Fetch metadata in the specified order
+    Calls slower than the provider's deadline count as failures, so a provider that keeps timing out
+    is skipped until its breaker's half-open probe succeeds. Rate limiter waits are bounded by the same
+    deadline, so a backlog for one provider gives up its worker instead of holding it. A provider that
+    failed or was skipped is added to `failures`, if given, to tell it from one that found nothing.
+    """
+    start = time.perf_counter()
     try:
-        spotify_metadata = fetch_spotify_metadata(track)
+        with rate_limiter.deadline(PROVIDER_TIMEOUTS[name]):
+            return get_breaker(name, slow_call_seconds=PROVIDER_TIMEOUTS[name]).call(fetch, *args)
+    except RateLimitTimeout as e:
+        provider_errors.inc(name, 'rate_limited')
+        print(f"Skipping {name}: {e}")
+        if failures is not None:
+            failures.add(name)
+        return None
+    except CircuitOpenError as e:
+        provider_errors.inc(name, 'circuit_open')
+        print(f"Skipping {name}: {e}")
+        if failures is not None:
+            failures.add(name)
+        return None
     except Exception as e:
-        print(f"Error fetching Spotify metadata: {e}")
-        spotify_metadata = None
+        provider_errors.inc(name, 'error')
+        # The only place a provider failure is logged; provider modules let their exceptions through
+        print(f"Error fetching {name} metadata: {type(e).__name__}: {e}")
+        if failures is not None:
+            failures.add(name)
+        return None
+    finally:
+        provider_latency.observe(time.perf_counter() - start, name)
 
-    try:
-        deezer_metadata = fetch_deezer_metadata(track)
-    except Exception as e:
-        print(f"Error fetching Deezer metadata: {e}")
-        deezer_metadata = None
 
-    try:
-        discogs_metadata = get_discogs_metadata(track)
-    except Exception as e:
-        print(f"Error fetching Discogs metadata: {e}")
-        discogs_metadata = None
+def artist_from_result(name, metadata):
+    """Pick the artist out of a provider result, if it has one."""
+    if not metadata:
+        return None
+    if name == 'discogs':
+        artists = metadata[0].get('artist') if metadata else None
+        return artists[0] if artists else None
+    if name == 'deezer':
+        return metadata.get('album_artist')
+    return metadata.get('artist')
 
-    try:
-        mb_metadata = fetch_musicbrainz_metadata(track)
-    except Exception as e:
-        print(f"Error fetching MusicBrainz metadata: {e}")
-        mb_metadata = None
 
-    # Get the artist from one of the results (if possible) to improve Last.fm search
-    artist = (spotify_metadata['artist'] if spotify_metadata else
-              (deezer_metadata['album_artist'] if deezer_metadata else
-               (discogs_metadata[0]['artist'] if discogs_metadata and discogs_metadata[0].get('artist') else
-                (mb_metadata['artist'] if mb_metadata else None))))
+def title_from_result(name, metadata):
+    """Pick the title out of a provider result, if it has one."""
+    if not metadata:
+        return None
+    if name == 'discogs':
+        return metadata[0].get('title')
+    return metadata.get('title')
+
+
+def resolve_results(results, track=None):
+    """Resolve whatever provider results have arrived so far."""
+    return ai_resolve_metadata(results.get('musicbrainz'), results.get('spotify'), results.get('deezer'),
+                               results.get('discogs'), results.get('lastfm') or [], results.get('theaudiodb'),
+                               track)
+
+
+def agreement(results, resolved):
+    """Number of providers whose title and artist match the resolved ones."""
+    if not resolved.get('title') or not resolved.get('contributing_artists'):
+        return 0
+    title = normalize_title(resolved['title'])
+    artist = normalize_title(resolved['contributing_artists'])
+
+    count = 0
+    for name in PROVIDERS:
+        provider_title = title_from_result(name, results.get(name))
+        provider_artist = artist_from_result(name, results.get(name))
+        if (provider_title and provider_artist and normalize_title(clean_title(provider_title)) == title
+                and normalize_title(provider_artist) == artist):
+            count += 1
+    return count
+
+
+def is_confident(results, resolved):
+    """Whether every required field is filled and enough providers agree on the track."""
+    return (all(resolved.get(field) for field in REQUIRED_FIELDS)
+            and agreement(results, resolved) >= PLANNER_MIN_AGREEMENT)
+
+
+def plan_tiers():
+    """Provider tiers for one lookup, leaving out providers whose circuit breaker is open or that failed to load."""
+    tiers = []
+    for tier in PROVIDER_TIERS:
+        healthy = [name for name in tier if not PROVIDERS[name].error
+                   and not get_breaker(name, PROVIDER_TIMEOUTS[name]).is_open()]
+        if healthy:
+            tiers.append(healthy)
+    return tiers
+
+
+def hedge_delay(tier):
+    """How long to wait on a tier before also starting the next one: the slowest p95 latency in the tier."""
+    latencies = [get_breaker(name, PROVIDER_TIMEOUTS[name]).latency_percentile(95) for name in tier]
+    latencies = [latency for latency in latencies if latency is not None]
+    delay = max(latencies) if latencies else HEDGE_DEFAULT_DELAY
+    return min(delay, min(PROVIDER_TIMEOUTS[name] for name in tier))
+
+
+def fetch_all_providers(track, artist=None, album=None):
+    """Query providers tier by tier and stop as soon as the merged result is complete and agreed on.
+
+    A tier that runs past its p95 latency gets the next tier started alongside it as a hedge.
+    Last.fm is only asked for tags while no other provider has supplied genres. A known artist or album
+    (from the file's tags or name, see query_planner) narrows every provider's search with structured fields.
+    results['unanswered'] lists the providers that were skipped, failed or timed out.
+    """
+    tiers = plan_tiers()
+    results = dict.fromkeys(TRACK_PROVIDERS)
+    results['lastfm'] = []
+    # Providers left out by an open circuit count as unanswered from the start; unavailable ones are not used at all
+    unanswered = ({name for tier in PROVIDER_TIERS for name in tier if not PROVIDERS[name].error}
+                  - {name for tier in tiers for name in tier})
+    futures = {}
+    deadlines = {}
+    pending = set()
+    hedge_at = None
+    lastfm_started = False
+
+    def launch(name, fetch, *args):
+        future = provider_pool.submit(fetch_provider, name, fetch, *args, failures=unanswered)
+        futures[future] = name
+        deadlines[future] = time.monotonic() + PROVIDER_TIMEOUTS[name]
+        pending.add(future)
+
+    def launch_next_tier():
+        tier = tiers.pop(0)
+        for name in tier:
+            if name == 'theaudiodb':
+                launch(name, PROVIDERS[name], track, artist or resolve_results(results, track)['contributing_artists'])
+            else:
+                launch(name, PROVIDERS[name], track, artist, album)
+        return time.monotonic() + hedge_delay(tier) if tiers else None
+
+    resolved = resolve_results(results, track)
+    while not is_confident(results, resolved):
+        if not pending:
+            if not tiers:
+                break
+            hedge_at = launch_next_tier()
+            continue
+
+        now = time.monotonic()
+        for future in [f for f in pending if now >= deadlines[f]]:
+            print(f"{futures[future]} did not answer within {PROVIDER_TIMEOUTS[futures[future]]}s, skipping it.")
+            future.cancel()
+            pending.discard(future)
+            unanswered.add(futures[future])
+        if not pending:
+            continue
+
+        # Only a tier provider that is still out can trigger the hedge, not a pending Last.fm lookup
+        hedging = hedge_at is not None and any(futures[f] != 'lastfm' for f in pending)
+        wake_at = min(deadlines[f] for f in pending)
+        if hedging:
+            wake_at = min(wake_at, hedge_at)
+        done, _ = wait(pending, timeout=max(wake_at - now, 0), return_when=FIRST_COMPLETED)
+        pending.difference_update(done)
+
+        for future in done:
+            name = futures[future]
+            if name == 'lastfm':
+                results['lastfm'] = future.result() or []
+            else:
+                results[name] = future.result()
+        resolved = resolve_results(results, track)
+
+        if (fetch_lastfm_tags and not lastfm_started and not resolved['genres']
+                and resolved['contributing_artists']):
+            launch('lastfm', fetch_lastfm_tags, track, resolved['contributing_artists'])
+            lastfm_started = True
+
+        if not done and hedging and time.monotonic() >= hedge_at:
+            slow = ", ".join(futures[f] for f in pending if futures[f] != 'lastfm')
+            print(f"{slow} slower than its p95 latency, hedging with {', '.join(tiers[0])}.")
+            hedge_at = launch_next_tier()
+
+    # Providers still running are not needed any more; queued ones are dropped
+    for future in pending:
+        future.cancel()
+
+    queried = sorted(set(futures.values()))
+    print(f"Resolved '{track}' with {len(queried)} provider call(s): {', '.join(queried)}.")
+    results['unanswered'] = sorted(unanswered)
+    return results
+
+
+def get_music_metadata_with_sources(track, artist=None, album=None):
+    """Fetch metadata from all sources and return (resolved, raw provider results).
+
+    Tracks in the offline catalog are answered without any network call. Callers asking for a title
+    that is already being looked up wait for that lookup instead of starting another. An artist the
+    providers already returned is searched with their spelling of it.
+    """
+    artist = canonical_name(artist)
+    catalog = get_catalog()
+    known = catalog.lookup(track, artist) if catalog else None
+    if catalog:
+        catalog_lookups.inc('hit' if known else 'miss')
+    if known:
+        print(f"Found '{track}' in the local catalog.")
+        return known, {'local_catalog': known}
+    key = (normalize_title(track), normalize_title(artist or ''), normalize_title(album or ''))
+    return track_lookups.do(key, resolve_track, track, artist, album)
+
+
+def resolve_track(track, artist=None, album=None):
+    """Run the provider lookup for one track and resolve the results."""
+    print(f"Fetching metadata for the song: {track}...")
 
-    lastfm_tags = fetch_lastfm_tags(track, artist)
+    results = fetch_all_providers(track, artist, album)
+    spotify_metadata = results['spotify']
+    deezer_metadata = results['deezer']
+    discogs_metadata = results['discogs']
+    mb_metadata = results['musicbrainz']
+    audiodb_metadata = results['theaudiodb']
+    lastfm_tags = results['lastfm']
 
     # Combine metadata using AI decision making
     resolved_metadata = ai_resolve_metadata(mb_metadata, spotify_metadata, deezer_metadata, discogs_metadata,
-                                            lastfm_tags)
+                                            lastfm_tags, audiodb_metadata, track)
 
-    # Export both raw and resolved metadata to a JSON file after completion
-    export_raw_and_resolved_metadata_to_json(spotify_metadata, mb_metadata, deezer_metadata, discogs_metadata,
-                                             lastfm_tags, resolved_metadata, track)
+    # Export both raw and resolved metadata; written in the background, off the request path
+    export_metadata(track, results, resolved_metadata)
 
+    if not any(value for field, value in resolved_metadata.items() if field != 'confidence'):
+        return None, results
+    return resolved_metadata, results
+
+
+def get_music_metadata(track, artist=None, album=None):
+    """Fetch metadata from all sources and combine results with AI."""
+    resolved_metadata, _ = get_music_metadata_with_sources(track, artist, album)
     return resolved_metadata
 
 
@@ -0,0 +1,175 @@
+import os
+from collections import Counter
+from dotenv import load_dotenv
+from rapidfuzz import fuzz
+from EzMp3.app.services.ai_services import fetch_provider, fetch_lastfm_tags
+from EzMp3.app.services.artist_cache import get_artist
+from EzMp3.app.services.candidate_scoring import clean_title
+from EzMp3.app.services.metadata_cache import normalize_title
+from EzMp3.app.services.providers import LazyProvider, get_provider
+
+load_dotenv()
+
+ALBUM_MODE = os.getenv("ALBUM_MODE", "True") == "True"  # Resolve files from one album together in batch uploads
+ALBUM_MIN_TRACKS = int(os.getenv("ALBUM_MIN_TRACKS", 3))  # Fewer files than this are looked up one by one
+ALBUM_TITLE_MATCH = int(os.getenv("ALBUM_TITLE_MATCH", 85))  # How closely (0-100) a file must match a track by title
+ALBUM_NUMBER_MATCH = int(os.getenv("ALBUM_NUMBER_MATCH", 50))  # ...or by title when its track number matches too
+ALBUM_RELEASE_SHARE = float(os.getenv("ALBUM_RELEASE_SHARE", 0.5))  # Share of files on its tracklist to call it theirs
+
+# The release and its tracklist come from Deezer, which returns both in one album call
+release_lookup = LazyProvider('deezer', 'EzMp3.app.services.deezer_services', 'fetch_deezer_release')
+
+
+def album_key(folder, query):
+    """Which album a file belongs to, or None to look it up on its own.
+
+    Files group by folder and album (from tags or name). Without an album, files in the same folder
+    group only when they are numbered like tracks of one release.
+    """
+    album = normalize_title(query['album'] or '')
+    if album:
+        return folder, album
+    if folder and query['track_number']:
+        return folder, None
+    return None
+
+
+def group_by_album(files):
+    """Split {file key: (folder, query, tags)} into album groups and files to look up one by one.
+
+    Returns ([[file key, ...] per album], [file key, ...]).
+    """
+    groups = {}
+    for key, (folder, query, tags) in files.items():
+        groups.setdefault(album_key(folder, query), []).append(key)
+    singles = groups.pop(None, [])
+    albums = []
+    for (folder, album), keys in groups.items():
+        # Without an album name, numbered files by different artists are more likely a mix than one release
+        artists = {normalize_title(files[key][2].get('album_artist') or files[key][1]['artist'] or '') for key in keys}
+        if len(keys) >= ALBUM_MIN_TRACKS and (album or len(artists - {''}) <= 1):
+            albums.append(keys)
+        else:
+            singles += keys
+    return albums, singles
+
+
+def most_common(values):
+    values = [value for value in values if value]
+    return Counter(values).most_common(1)[0][0] if values else None
+
+
+def title_score(query, track):
+    return fuzz.token_set_ratio(normalize_title(query['title']), normalize_title(clean_title(track['title'])))
+
+
+def match_tracks(queries, tracks):
+    """Pair files with tracklist positions, locally: {file key: (position, title score)}.
+
+    A file whose track number points at a track with a plausible title takes that track; the rest
+    take the closest title among the tracks still free, if it is close enough.
+    """
+    matches, taken = {}, set()
+    for key, query in queries.items():
+        position = (query['track_number'] or 0) - 1
+        if 0 <= position < len(tracks) and position not in taken:
+            score = title_score(query, tracks[position])
+            if score >= ALBUM_NUMBER_MATCH:
+                matches[key] = (position, score)
+                taken.add(position)
+
+    for key, query in queries.items():
+        if key in matches:
+            continue
+        scores = [(title_score(query, track), position) for position, track in enumerate(tracks) if position not in taken]
+        if scores:
+            score, position = max(scores)
+            if score >= ALBUM_TITLE_MATCH:
+                matches[key] = (position, score)
+                taken.add(position)
+    return matches
+
+
+def release_genres(release, track_title):
+    """The release's genres, else the album artist's cached genres or tags, else its Last.fm tags."""
+    if release['genres']:
+        return release['genres']
+    entry = get_artist(release['artist'])
+    if entry and (entry['genres'] or entry['tags']):
+        return entry['genres'] or entry['tags']
+    if fetch_lastfm_tags and release['artist']:
+        return fetch_provider('lastfm', fetch_lastfm_tags, track_title, release['artist']) or []
+    return []
+
+
+def album_fields(release):
+    """The tags every track of the release shares, so they come out identical on each file."""
+    return {
+        'album_artist': release['artist'],
+        'album': release['title'].split('(')[0].strip() if release['title'] else None,
+        'year': release['release_date'][:4] if release['release_date'] else None,
+    }
+
+
+def same_album(metadata, shared):
+    return fuzz.token_set_ratio(normalize_title(metadata.get('album') or ''),
+                                normalize_title(shared['album'] or '')) >= ALBUM_TITLE_MATCH
+
+
+def resolve_album(queries, lookup):
+    """Resolve the files of one album with a single release lookup.
+
+    queries maps file key -> query (see query_planner); lookup(query) resolves one file the usual
+    way. When no file names the album, the first track is resolved with lookup() to find it. The
+    release's tracklist is fetched in one call and matched to the files locally. Returns
+    {file key: metadata}; files that match no track are resolved with lookup(). When at least
+    ALBUM_RELEASE_SHARE of the files matched, the release is taken to be theirs: those lookups are
+    narrowed to it and every file gets its album, album artist and year. Otherwise only files that
+    matched the tracklist, or whose own lookup found the same album, get them.
+    """
+    album = most_common(query['album'] for query in queries.values())
+    artist = most_common(query['artist'] for query in queries.values())
+    resolved = {}
+    if not album:
+        seed = min(queries, key=lambda key: queries[key]['track_number'] or float('inf'))
+        resolved[seed] = lookup(queries[seed])
+        if resolved[seed]:
+            album = resolved[seed]['album']
+            artist = resolved[seed]['album_artist'] or artist
+
+    release = None
+    if album and get_provider('deezer') and not get_provider('deezer').error:
+        release = fetch_provider('deezer', release_lookup, album, artist)
+    if not release or not release['tracks']:
+        print(f"No release found for '{album}', looking its tracks up one by one.")
+        for key, query in queries.items():
+            if key not in resolved:
+                resolved[key] = lookup(query)
+        return resolved
+
+    shared = album_fields(release)
+    genres = release_genres(release, release['tracks'][0]['title'])
+    pending = {key: query for key, query in queries.items() if key not in resolved}
+    matches = match_tracks(pending, release['tracks'])
+    confirmed = len(matches) >= ALBUM_RELEASE_SHARE * len(pending)
+    for key, (position, score) in matches.items():
+        track = release['tracks'][position]
+        resolved[key] = {
+            'title': clean_title(track['title']),
+            'contributing_artists': track['artist'] or release['artist'],
+            **shared,
+            'genres': genres,
+            'confidence': dict.fromkeys(('title', 'artist', 'album', 'year'), round(score / 100, 3)),
+        }
+
+    for key, query in queries.items():
+        if key not in resolved:
+            # A file the tracklist doesn't account for is looked up on its own, narrowed to the release if it is theirs
+            narrowed = {**query, 'album': shared['album'], 'artist': shared['album_artist'] or query['artist']}
+            resolved[key] = lookup(narrowed if confirmed else query)
+        if resolved[key] and key not in matches and (confirmed or same_album(resolved[key], shared)):
+            # Including the file that found the release: every file on it gets the same album, album artist and year
+            resolved[key] = {**resolved[key], **shared}
+    print(f"Resolved {len(matches)} of {len(queries)} files from the tracklist of '{release['title']}'"
+          f"{'' if confirmed else ', too few to take it as the album of the rest'}.")
+    return resolved
@@ -0,0 +1,87 @@
+import os
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from EzMp3.app.services.metadata_cache import normalize_title
+from EzMp3.app.services.ttl_cache import get_cache
+
+load_dotenv()
+
+# Genres and tags belong to the artist, not the track, so they are looked up once per artist
+ARTIST_CACHE_TTL = int(os.getenv("ARTIST_CACHE_TTL", 7 * 24 * 3600))
+ARTIST_CACHE_SIZE = int(os.getenv("ARTIST_CACHE_SIZE", 20000))  # Keys: one per name and one per provider id
+
+artists = get_cache('artists', ARTIST_CACHE_SIZE, ARTIST_CACHE_TTL)
+_update_lock = threading.Lock()
+_batches = 0
+_batches_lock = threading.Lock()
+
+
+def name_key(name):
+    return ('name', normalize_title(name))
+
+
+def get_artist(name=None, provider=None, artist_id=None):
+    """Return the cached entry for an artist, by provider id or by name, or None.
+
+    An entry is {'name': canonical spelling, 'genres': [...] or None, 'tags': [...] or None,
+    'ids': {provider: artist id}}; None means that field hasn't been looked up yet.
+    """
+    keys = [(provider, artist_id)] if provider and artist_id else []
+    if name:
+        keys.append(name_key(name))
+    for key in keys:
+        found, entry = artists.get(key)
+        if found:
+            return entry
+    return None
+
+
+def remember_artist(name, provider=None, artist_id=None, genres=None, tags=None, alias=None):
+    """Merge what a provider returned for an artist into its entry, reachable by every id and name it has.
+
+    alias is another spelling to find the entry by, e.g. the name that was searched for.
+    """
+    with _update_lock:
+        entry = get_artist(name, provider, artist_id) or {'name': name, 'genres': None, 'tags': None, 'ids': {}}
+        # Entries are shared between their keys, so they are replaced rather than changed in place
+        entry = {**entry, 'ids': dict(entry['ids'])}
+        if provider and artist_id:
+            entry['ids'][provider] = artist_id
+        if genres is not None:
+            entry['genres'] = genres
+        if tags is not None:
+            entry['tags'] = tags
+
+        keys = {name_key(name), name_key(entry['name'])} | set(entry['ids'].items())
+        if alias:
+            keys.add(name_key(alias))
+        for key in keys:
+            artists.put(key, entry)
+    return entry
+
+
+def canonical_name(name):
+    """The provider's spelling of an artist name, e.g. "Queen" for "queen", if the artist is cached."""
+    entry = get_artist(name) if name else None
+    return entry['name'] if entry else name
+
+
+@contextmanager
+def batch_mode():
+    """Mark a batch of lookups (a batch upload, a bulk tagging run) as running.
+
+    While one is, providers may hold artist lookups back briefly and fetch them with bulk endpoints.
+    """
+    global _batches
+    with _batches_lock:
+        _batches += 1
+    try:
+        yield
+    finally:
+        with _batches_lock:
+            _batches -= 1
+
+
+def in_batch_mode():
+    return _batches > 0
@@ -0,0 +1,155 @@
+from functools import lru_cache
+import numpy as np
+from rapidfuzz import fuzz, process
+from EzMp3.app.services.metadata_cache import normalize_title
+
+# How much a provider's candidates count towards the consensus
+SOURCE_WEIGHTS = {
+    'spotify': 1.0,
+    'deezer': 1.0,
+    'musicbrainz': 1.0,
+    'theaudiodb': 0.9,
+    'discogs': 0.7,  # Release search, so its candidates carry no track title
+}
+PICK_BONUS = 2.0  # A provider's own pick (earliest studio album) outweighs the rest of its result list
+COMPILATION_WEIGHT = 0.5  # Hits a provider filtered out (compilations, unofficial releases) still vote, for less
+MATCH_CUTOFF = 80  # Similarity (0-100) at which two values count as the same
+FIELDS = ('title', 'artist', 'album')
+
+# Candidate lists repeat the same few strings many times over, so normalizing is memoized
+normalize = lru_cache(maxsize=16384)(normalize_title)
+
+
+def clean_title(title):
+    """Strip " - Remastered" style suffixes and parenthesised extras from a title."""
+    title = title.split(' - ')[0]
+    return title.split('(')[0].strip()
+
+
+def candidate(source, title=None, artist=None, album=None, year=None, pick=False, compilation=False):
+    """One possible answer for a track, as reported by a provider."""
+    return {
+        'source': source,
+        'title': title,
+        'artist': artist,
+        'album': album,
+        'year': str(year) if year else None,
+        'weight': (SOURCE_WEIGHTS.get(source, 1.0) * (PICK_BONUS if pick else 1.0)
+                   * (COMPILATION_WEIGHT if compilation else 1.0)),
+    }
+
+
+def split_discogs_title(release):
+    """Discogs search titles read "Artist - Release"; return (artist, album)."""
+    artist, _, album = (release.get('title') or '').partition(' - ')
+    if not album:
+        return None, artist or None
+    return artist, album
+
+
+def collect_candidates(sources):
+    """Flatten provider results ({provider: result}) into a list of candidates.
+
+    Providers that return a 'candidates' list contribute every entry in it, with their own pick
+    counted extra and entries marked 'compilation' counted less; Discogs contributes every release
+    it returned.
+    """
+    candidates = []
+    for source, result in sources.items():
+        if not result:
+            continue
+        if source == 'discogs':
+            for release in result:
+                artist, album = split_discogs_title(release)
+                artists = [a for a in release.get('artist') or [] if a != "Unknown"]
+                year = release.get('year')
+                candidates.append(candidate(source, None, artists[0] if artists else artist, album,
+                                            year if year != "Unknown" else None))
+            continue
+
+        artist = result.get('artist') or result.get('album_artist')
+        candidates.append(candidate(source, result.get('title'), artist, result.get('album'),
+                                    result.get('year'), pick=True))
+        for entry in result.get('candidates', []):
+            candidates.append(candidate(source, entry.get('title'), entry.get('artist'), entry.get('album'),
+                                        entry.get('year'), compilation=entry.get('compilation', False)))
+    return candidates
+
+
+def distinct_values(values):
+    """Return the distinct values (in first-seen order) and each value's index into them."""
+    positions = {}
+    inverse = np.fromiter((positions.setdefault(value, len(positions)) for value in values),
+                          dtype=np.intp, count=len(values))
+    return list(positions), inverse
+
+
+def consensus(values, weights):
+    """Pick the value with the most weighted support among similar values.
+
+    Similarities are computed once between the distinct values in a single cdist call; returns
+    (index of the chosen candidate, confidence, row of similarities of every candidate to it).
+    """
+    distinct, inverse = distinct_values(values)
+    empty = np.array([not value for value in distinct])
+    if empty.all():
+        return None, 0.0, np.zeros(len(values))
+
+    distinct_weights = np.bincount(inverse, weights=weights, minlength=len(distinct))
+    distinct_weights[empty] = 0
+    similarity = process.cdist(distinct, distinct, scorer=fuzz.ratio, score_cutoff=MATCH_CUTOFF,
+                               dtype=np.float32) / 100
+    support = similarity @ distinct_weights
+    support[empty] = -1
+
+    best = int(np.argmax(support))
+    total = distinct_weights.sum()
+    confidence = float(support[best] / total) if total else 0.0
+    index = int(np.argmax(inverse == best))
+    return index, min(confidence, 1.0), similarity[best][inverse]
+
+
+def score_candidates(query, candidates):
+    """Resolve title, artist, album and year from every candidate.
+
+    Each candidate is weighted by its provider and by how closely it matches the query (one
+    batched cdist call); each field is then decided by weighted consensus between candidates.
+    Returns {field: value} and {field: confidence between 0 and 1}.
+    """
+    values = dict.fromkeys(FIELDS + ('year',))
+    confidence = dict.fromkeys(FIELDS + ('year',), 0.0)
+    if not candidates:
+        return values, confidence
+
+    # Titles and albums are compared without their "(Remastered)" style extras
+    normalized = {
+        'title': [normalize(clean_title(c['title'])) if c['title'] else '' for c in candidates],
+        'artist': [normalize(c['artist']) if c['artist'] else '' for c in candidates],
+        'album': [normalize(c['album'].split('(')[0]) if c['album'] else '' for c in candidates],
+    }
+    weights = np.array([c['weight'] for c in candidates], dtype=np.float64)
+    if query:
+        # Release-only candidates are matched on their album instead
+        keys, inverse = distinct_values([title or album for title, album in zip(normalized['title'],
+                                                                                normalized['album'])])
+        relevance = process.cdist([normalize(query)], keys, scorer=fuzz.token_set_ratio,
+                                  dtype=np.float32)[0] / 100
+        weights = weights * relevance[inverse] ** 2
+
+    agreement = {}
+    for field in FIELDS:
+        index, confidence[field], agreement[field] = consensus(normalized[field], weights)
+        values[field] = candidates[index][field] if index is not None else None
+
+    # Earliest year among candidates for the chosen artist and track (or album, for release-only results)
+    same_track = agreement['artist'] * np.maximum(agreement['title'], agreement['album'])
+    years = np.array([int(c['year']) if c['year'] and c['year'].isdigit() else 0 for c in candidates])
+    dated = (same_track > 0) & (years > 0)
+    if dated.any():
+        earliest = years[dated].min()
+        values['year'] = str(earliest)
+        dated_weight = (weights * same_track)[dated].sum()
+        if dated_weight:
+            confidence['year'] = float((weights * same_track)[dated & (years == earliest)].sum() / dated_weight)
+
+    return values, {field: round(score, 3) for field, score in confidence.items()}
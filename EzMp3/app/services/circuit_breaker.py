@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from collections import deque
+from dotenv import load_dotenv
+from EzMp3.app.services.rate_limiter import RateLimitTimeout
+
+load_dotenv()
+
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", 60))  # Seconds of call history used for the error rate
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 5))  # Calls needed in the window before it can open
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))  # Failure ratio that opens the breaker
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 30))  # How long to skip a provider before probing
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", 5))  # Slower calls count as failures
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+
+
+class CircuitBreaker:
+    """Tracks a provider's rolling error rate and latency and stops calling it while it is unhealthy.
+
+    Closed: calls go through. Open: calls fail immediately with CircuitOpenError. After
+    BREAKER_OPEN_SECONDS one probe call is let through (half-open); its outcome closes or re-opens
+    the breaker.
+    """
+
+    def __init__(self, name, slow_call_seconds=BREAKER_SLOW_CALL_SECONDS):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._calls = deque()  # (timestamp, ok, latency)
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._calls and self._calls[0][0] < now - BREAKER_WINDOW:
+            self._calls.popleft()
+
+    def allow(self):
+        """Whether a call may go through right now."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= BREAKER_OPEN_SECONDS:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == OPEN:
+                return False
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def is_open(self):
+        """Whether calls are currently being refused, without using up a half-open probe."""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS
+
+    def record(self, ok, latency):
+        """Record the outcome of one call and update the breaker's state."""
+        now = time.monotonic()
+        with self._lock:
+            self._calls.append((now, ok, latency))
+            self._prune(now)
+
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    self.state = CLOSED
+                    self._calls.clear()
+                else:
+                    self.state = OPEN
+                    self.opened_at = now
+                return
+
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            if (self.state == CLOSED and len(self._calls) >= BREAKER_MIN_CALLS
+                    and failures / len(self._calls) >= BREAKER_ERROR_RATE):
+                self.state = OPEN
+                self.opened_at = now
+                print(f"Circuit breaker for {self.name} opened ({failures}/{len(self._calls)} calls failed).")
+
+    def call(self, fn, *args):
+        """Call fn(*args) through the breaker; errors and slow calls count as failures.
+
+        A RateLimitTimeout is our own token bucket giving up before any request was sent, so it says
+        nothing about the provider and is not recorded.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+
+        start = time.monotonic()
+        try:
+            result = fn(*args)
+        except RateLimitTimeout:
+            with self._lock:
+                self._probe_in_flight = False  # A half-open probe that never reached the provider can be retried
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        latency = time.monotonic() - start
+        self.record(latency <= self.slow_call_seconds, latency)
+        return result
+
+    def latency_percentile(self, percentile):
+        """Latency (seconds) at the given percentile over the window, or None without data."""
+        with self._lock:
+            self._prune(time.monotonic())
+            latencies = sorted(latency for _, _, latency in self._calls)
+        if not latencies:
+            return None
+        return latencies[min(int(len(latencies) * percentile / 100), len(latencies) - 1)]
+
+    def snapshot(self):
+        """Current state, error rate and latency of the provider."""
+        with self._lock:
+            self._prune(time.monotonic())
+            calls = len(self._calls)
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            state = self.state
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        return {
+            'state': state,
+            'calls': calls,
+            'failures': failures,
+            'error_rate': round(failures / calls, 4) if calls else 0.0,
+            'latency_p50': round(p50, 4) if p50 is not None else None,
+            'latency_p95': round(p95, 4) if p95 is not None else None,
+        }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, slow_call_seconds=BREAKER_SLOW_CALL_SECONDS):
+    """Return the shared breaker for a provider, creating it on first use."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, slow_call_seconds)
+        return breaker
+
+
+def breaker_states():
+    """Snapshot of every provider's breaker."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
@@ -1,39 +1,203 @@
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import deezer
+import httpx
+from rapidfuzz import fuzz
+from EzMp3.app.services.http_clients import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT
+from EzMp3.app.services.providers import search_limit
+from EzMp3.app.services.metadata_cache import normalize_title
+from EzMp3.app.services.rate_limiter import rate_limiter
+from EzMp3.app.services.single_flight import get_group
+from EzMp3.app.services.ttl_cache import get_cache
 
-client = deezer.Client()
-
-
-def fetch_deezer_metadata(track_name):
-    """Fetch metadata from Deezer for a given track name."""
-    try:
-        # Search for the track by title
-        results = client.search(track_name)
-
-        # Filter for non-compilation albums
-        filtered_tracks = []
-        for track in results:
-            if track.album and 'compilation' not in track.album.title.lower():
-                filtered_tracks.append(track)
-
-        # Prioritize the earliest release
-        earliest_track = None
-        for track in filtered_tracks:
-            if earliest_track is None or (track.album.release_date and track.album.release_date < earliest_track.album.release_date):
-                earliest_track = track
-
-        if earliest_track:
-            # Prepare metadata to return
-            release_year = earliest_track.album.release_date.strftime("%Y") if earliest_track.album.release_date else "Not Available"
-            return {
-                'title': earliest_track.title,
-                'contributing_artists': [artist.name for artist in earliest_track.contributors],
-                'album_artist': earliest_track.artist.name,
-                'album': earliest_track.album.title,
-                'year': release_year,
-                'genres': [genre.name for genre in earliest_track.album.genres] if earliest_track.album.genres else []
-            }
-    except Exception as e:
-        print(f"Deezer error: {e}")
-    return None
\ No newline at end of file
+DEEZER_API_URL = os.getenv("DEEZER_API_URL", "https://api.deezer.com")
+DEEZER_ALBUM_TTL = int(os.getenv("DEEZER_ALBUM_TTL", 86400))  # Seconds an album's details are reused
+DEEZER_ALBUM_CACHE_SIZE = int(os.getenv("DEEZER_ALBUM_CACHE_SIZE", 5000))
+DEEZER_ALBUM_WORKERS = int(os.getenv("DEEZER_ALBUM_WORKERS", 4))  # Albums fetched at once for one lookup
+DEEZER_FINALISTS = int(os.getenv("DEEZER_FINALISTS", 3))  # Albums a lookup fetches at most, to compare release dates
+DEEZER_RELEASE_MATCH = int(os.getenv("DEEZER_RELEASE_MATCH", 85))  # How closely (0-100) a release must match
+
+album_cache = get_cache('deezer_albums', DEEZER_ALBUM_CACHE_SIZE, DEEZER_ALBUM_TTL)
+album_lookups = get_group('deezer_albums')
+album_pool = ThreadPoolExecutor(max_workers=DEEZER_ALBUM_WORKERS, thread_name_prefix="deezer-album")
+
+_deezer_client = None
+_deezer_client_lock = threading.Lock()
+
+
+def get_deezer_client():
+    """Return the shared Deezer client, creating it on first use."""
+    global _deezer_client
+    if _deezer_client is None:
+        with _deezer_client_lock:
+            if _deezer_client is None:
+                # deezer.Client is an httpx.Client, so this one instance keeps its connections alive across lookups
+                client = deezer.Client()
+                client.base_url = DEEZER_API_URL
+                client.timeout = httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+                # Every request the client makes goes through the shared rate limiter
+                client.event_hooks = {
+                    'request': [lambda request: rate_limiter.acquire('deezer')],
+                    'response': [lambda response: rate_limiter.observe_response('deezer', response.status_code,
+                                                                                response.headers)],
+                }
+                _deezer_client = client
+    return _deezer_client
+
+
+def search_query(**fields):
+    """Deezer advanced search syntax, e.g. track:"Bohemian Rhapsody" artist:"Queen"."""
+    return " ".join(f'{field}:"{value}"' for field, value in fields.items() if value)
+
+
+def search_tracks(track_name, artist=None, album=None):
+    """One page of at most search_limit() hits, as plain dicts.
+
+    The client's search() returns a list that pages through every hit, and its resources fetch
+    themselves again whenever a missing field is read; plain dicts can't trigger a request.
+    """
+    hits = get_deezer_client().request("GET", "search", params={
+        'q': search_query(track=track_name, artist=artist, album=album),
+        'limit': search_limit(artist, album),
+    })
+    return [hit.as_dict() for hit in hits]
+
+
+def fetch_album(album_id):
+    # Another lookup may have cached it since this one missed; it is cached before its call stops being in flight
+    found, album = album_cache.get(album_id)
+    if found:
+        return album
+    album = get_deezer_client().request("GET", f"album/{album_id}").as_dict()
+    album = {
+        'title': album.get('title'),
+        'artist': (album.get('artist') or {}).get('name'),
+        'release_date': album.get('release_date'),
+        'genres': [genre['name'] for genre in album.get('genres') or []],
+        # The full tracklist comes with the album, in order
+        'tracks': [{'title': track['title'], 'artist': (track.get('artist') or {}).get('name')}
+                   for track in album.get('tracks') or []],
+    }
+    album_cache.put(album_id, album)
+    return album
+
+
+def load_album(album_id):
+    return album_lookups.do(album_id, fetch_album, album_id)
+
+
+def hydrate_albums(album_ids):
+    """Album details for every id in one step: cached albums from memory, the rest fetched concurrently."""
+    albums, missing = album_cache.get_many(album_ids)
+    albums.update(zip(missing, album_pool.map(load_album, missing)))
+    return albums
+
+
+def on_compilation(hit):
+    return not hit.get('album') or 'compilation' in hit['album']['title'].lower()
+
+
+def pick_finalists(hits, track_name, artist=None):
+    """The hits worth fetching albums for, judged from the search hits alone.
+
+    Compilations are left out (the hit already carries the album title), the rest are ranked by how
+    close their title (and artist, when known) is to the search, ties keeping Deezer's order, and
+    only the hits on the first DEEZER_FINALISTS albums are kept.
+    """
+    title_key = normalize_title(track_name)
+    artist_key = normalize_title(artist) if artist else None
+
+    def closeness(hit):
+        score = fuzz.ratio(normalize_title(hit['title']), title_key)
+        if artist_key:
+            score += fuzz.ratio(normalize_title(hit['artist']['name']), artist_key)
+        return score
+
+    finalists = []
+    album_ids = set()
+    for hit in sorted((hit for hit in hits if not on_compilation(hit)), key=closeness, reverse=True):
+        if hit['album']['id'] not in album_ids:
+            if len(album_ids) == DEEZER_FINALISTS:
+                continue
+            album_ids.add(hit['album']['id'])
+        finalists.append(hit)
+    return finalists
+
+
+def fetch_deezer_metadata(track_name, artist=None, album=None):
+    """Fetch metadata from Deezer for a given track name (and artist and album, when known).
+
+    Costs one search, one fetch per finalist album not cached yet and one track fetch for the contributors.
+    """
+    hits = search_tracks(track_name, artist, album)
+    finalists = pick_finalists(hits, track_name, artist)
+    albums = hydrate_albums([hit['album']['id'] for hit in finalists])
+
+    def release_date(hit):
+        album_id = hit['album']['id'] if hit.get('album') else None
+        return albums[album_id]['release_date'] if album_id in albums else None
+
+    # Every hit is a candidate, those on compilations for less; hits that weren't finalists have no year
+    candidates = [{
+        'title': hit['title'],
+        'artist': hit['artist']['name'],
+        'album': hit['album']['title'] if hit.get('album') else None,
+        'year': release_date(hit)[:4] if release_date(hit) else None,
+        'compilation': on_compilation(hit),
+    } for hit in hits]
+    if not finalists:
+        return {'candidates': candidates} if candidates else None
+
+    # Prioritize the earliest release
+    dated = [hit for hit in finalists if release_date(hit)]
+    earliest_track = min(dated, key=release_date) if dated else finalists[0]
+    earliest_album = albums[earliest_track['album']['id']]
+    details = get_deezer_client().request("GET", f"track/{earliest_track['id']}").as_dict()
+
+    # Prepare metadata to return
+    return {
+        'title': earliest_track['title'],
+        'contributing_artists': [contributor['name'] for contributor in details.get('contributors') or []]
+        or [earliest_track['artist']['name']],
+        'album_artist': earliest_track['artist']['name'],
+        'album': earliest_track['album']['title'],
+        'year': earliest_album['release_date'][:4] if earliest_album['release_date'] else "Not Available",
+        'genres': earliest_album['genres'],
+        'candidates': candidates
+    }
+
+
+def fetch_deezer_release(album, artist=None):
+    """Find an album (by title, and artist when known) and return it with its full tracklist.
+
+    Costs one album search and one album fetch, unless the album is cached. Hits are scored against
+    the album title and the artist; the closest one is taken only if both are within
+    DEEZER_RELEASE_MATCH. Returns
+    {'id', 'title', 'artist', 'release_date', 'genres', 'tracks': [{'title', 'artist'}]} or None.
+    """
+    hits = get_deezer_client().request("GET", "search/album", params={
+        'q': search_query(artist=artist, album=album),
+        'limit': search_limit(artist, album),
+    })
+
+    def score(hit):
+        # token_set_ratio, so an edition suffix like "(Deluxe Remastered Version)" doesn't count against a hit
+        album_score = fuzz.token_set_ratio(normalize_title(hit.get('title') or ''), normalize_title(album))
+        if not artist:
+            return album_score
+        artist_score = fuzz.ratio(normalize_title((hit.get('artist') or {}).get('name') or ''), normalize_title(artist))
+        return min(album_score, artist_score)
+
+    # Compilations carry the same songs but aren't the release the files came from
+    hits = [hit.as_dict() for hit in hits]
+    scored = [(score(hit), -index, hit) for index, hit in enumerate(hits) if hit.get('record_type') != 'compile']
+    if not scored:
+        return None
+    best, _, hit = max(scored, key=lambda entry: entry[:2])
+    if best < DEEZER_RELEASE_MATCH:
+        print(f"No Deezer release matches '{album}' closely enough (best: '{hit.get('title')}', {best:.0f}).")
+        return None
+    release_id = hit['id']
+    return {'id': release_id, **hydrate_albums([release_id])[release_id]}
@@ -1,10 +1,11 @@
 import json
 import os
-import sys
 from urllib import request
-from urllib.parse import parse_qsl
+from urllib.parse import parse_qsl, urlencode
 import oauth2 as oauth
 from dotenv import load_dotenv
+from EzMp3.app.services.http_clients import get_session
+from EzMp3.app.services.providers import search_limit
 import pickle
 
 load_dotenv()
@@ -12,21 +13,27 @@ load_dotenv()
 consumer_key = os.getenv('CONSUMER_KEY')
 consumer_secret = os.getenv('CONSUMER_SECRET')
 
-request_token_url = "https://api.discogs.com/oauth/request_token"
+DISCOGS_API_URL = os.getenv('DISCOGS_API_URL', "https://api.discogs.com")
+
+request_token_url = f"{DISCOGS_API_URL}/oauth/request_token"
 authorize_url = "https://www.discogs.com/oauth/authorize"
-access_token_url = "https://api.discogs.com/oauth/access_token"
+access_token_url = f"{DISCOGS_API_URL}/oauth/access_token"
 
 user_agent = "ezmp3/1.0"
 token_file = 'discogs_token.pkl'
 
 
+class DiscogsError(Exception):
+    """Raised when the Discogs API answers with an error, or when there is no access token to search with."""
+
+
 def get_request_token():
     consumer = oauth.Consumer(consumer_key, consumer_secret)
     client = oauth.Client(consumer)
     resp, content = client.request(request_token_url, "POST", headers={"User-Agent": user_agent})
 
     if resp["status"] != "200":
-        sys.exit(f"Invalid response {resp['status']}")
+        raise DiscogsError(f"Invalid response {resp['status']}")
 
     return dict(parse_qsl(content.decode("utf-8")))
 
@@ -40,7 +47,7 @@ def authorize_request(request_token):
         oauth_verifier = input("Enter the verification code: ")
         return oauth_verifier
     else:
-        sys.exit("Authorization not completed.")
+        raise DiscogsError("Authorization not completed.")
 
 
 def get_access_token(request_token, oauth_verifier):
@@ -50,7 +57,7 @@ def get_access_token(request_token, oauth_verifier):
     resp, content = client.request(access_token_url, "POST", headers={"User-Agent": user_agent})
 
     if resp["status"] != "200":
-        sys.exit(f"Invalid response {resp['status']}")
+        raise DiscogsError(f"Invalid response {resp['status']}")
 
     return dict(parse_qsl(content.decode("utf-8")))
 
@@ -69,18 +76,26 @@ def save_access_token(access_token):
         pickle.dump(access_token, f)
 
 
-def search_discogs(access_token, song_name):
+def search_discogs(access_token, song_name, artist=None, album=None):
+    consumer = oauth.Consumer(consumer_key, consumer_secret)
     token = oauth.Token(key=access_token["oauth_token"], secret=access_token["oauth_token_secret"])
-    client = oauth.Client(oauth.Consumer(consumer_key, consumer_secret), token)
 
-    search_params = f"release_title={song_name.replace(' ', '+')}"
-    search_query = f'https://api.discogs.com/database/search?{search_params}'
-    resp, content = client.request(search_query, headers={"User-Agent": user_agent})
+    # Structured fields: the song is a track on the release, so it is searched as one
+    fields = {'track': song_name, 'artist': artist, 'release_title': album}
+    search_params = urlencode({**{field: value for field, value in fields.items() if value},
+                               'per_page': search_limit(artist, album)})
+    search_query = f'{DISCOGS_API_URL}/database/search?{search_params}'
 
-    if resp["status"] != "200":
-        sys.exit(f"Invalid API response {resp['status']}")
+    # Sign the request with OAuth and send it over the shared keep-alive session
+    oauth_request = oauth.Request.from_consumer_and_token(consumer, token=token, http_method="GET",
+                                                          http_url=search_query)
+    oauth_request.sign_request(oauth.SignatureMethod_HMAC_SHA1(), consumer, token)
+    resp = get_session('discogs').get(oauth_request.to_url(), headers={"User-Agent": user_agent})
 
-    results = json.loads(content.decode("utf-8"))
+    if resp.status_code != 200:
+        raise DiscogsError(f"Invalid API response {resp.status_code}")
+
+    results = resp.json()
     filtered_results = []
 
     # Filtering for official non-compilation albums
@@ -109,21 +124,36 @@ def print_discogs_results(results):
         print(f'\tGenre\t\t: {", ".join(release["genre"])}')
 
 
-def get_discogs_metadata(song_name):
-    """Get Discogs metadata for a song."""
+def authorize():
+    """Go through the OAuth process on the command line and save the access token."""
+    request_token = get_request_token()
+    oauth_verifier = authorize_request(request_token)
+    access_token = get_access_token(request_token, oauth_verifier)
+    save_access_token(access_token)  # Save the new access token
+    return access_token
+
+
+def unavailable():
+    """Why Discogs can't be searched, or None; the provider registry leaves it out while this says so."""
+    if not os.path.exists(token_file):
+        return f"no access token in {token_file}, run `python -m EzMp3.app.services.discog_services` to authorize"
+    return None
+
+
+def get_discogs_metadata(song_name, artist=None, album=None):
+    """Get Discogs metadata for a song, narrowed to the artist and album when they are known."""
     access_token = load_access_token()
 
-    # If no access token is found, go through the OAuth process
+    # Authorizing needs someone at a terminal, so lookups never start it
     if access_token is None:
-        request_token = get_request_token()
-        oauth_verifier = authorize_request(request_token)
-        access_token = get_access_token(request_token, oauth_verifier)
-        save_access_token(access_token)  # Save the new access token
+        raise DiscogsError(unavailable())
 
-    return search_discogs(access_token, song_name)
+    return search_discogs(access_token, song_name, artist, album)
 
 
 if __name__ == "__main__":
+    if load_access_token() is None:
+        authorize()
     song_name = "Your Song Name Here"  # Replace with an actual song name for testing
     discogs_results = get_discogs_metadata(song_name)
     print_discogs_results(discogs_results)
@@ -0,0 +1,449 @@
+import argparse
+import atexit
+import gzip
+import json
+import os
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from EzMp3.app.services.metadata_cache import normalize_title
+
+'''
+how to run:
+python -m EzMp3.app.services.export_store query --title "Bohemian Rhapsody"
+python -m EzMp3.app.services.export_store query --audio-hash 3f2a...
+python -m EzMp3.app.services.export_store compact --retention-days 30
+python -m EzMp3.app.services.export_store selftest
+
+Exported metadata is appended by a background thread, in batches, to gzip-compressed JSONL segments
+(segment-00000001.jsonl.gz, ...) next to an SQLite index by title and audio hash. Every batch is one
+gzip member, so a segment is still a plain .jsonl.gz (zcat works) and a record is read back by
+seeking to its member.
+
+Several processes (server workers, the bulk tagger, this CLI) may share one directory: every append
+and compaction runs inside a write transaction on the index, which holds SQLite's lock on it, so
+writers take turns and each one picks the segment and offset from the index, not from memory.
+'''
+
+load_dotenv()
+
+EXPORT_STORE_DIR = os.getenv("EXPORT_DIRECTORY", "app/services/metadata_exports/")
+EXPORT_SEGMENT_BYTES = int(os.getenv("EXPORT_SEGMENT_BYTES", 16 << 20))  # Compressed size before starting a new segment
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 256))  # Records written per batch at most
+EXPORT_FLUSH_INTERVAL = float(os.getenv("EXPORT_FLUSH_INTERVAL", 1.0))  # Seconds a record may wait for its batch
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", 10000))  # Records waiting to be written before new ones are dropped
+EXPORT_FSYNC = os.getenv("EXPORT_FSYNC", "True") == "True"  # One fsync per batch, not per record
+EXPORT_RETENTION_DAYS = float(os.getenv("EXPORT_RETENTION_DAYS", 90))  # 0 keeps records forever
+EXPORT_KEEP_VERSIONS = int(os.getenv("EXPORT_KEEP_VERSIONS", 3))  # Newest records kept per kind and title/audio hash
+EXPORT_COMPACT_INTERVAL = float(os.getenv("EXPORT_COMPACT_INTERVAL", 6 * 3600))  # Seconds between automatic compactions
+EXPORT_COMPACT_RATIO = 0.5  # Segments with a smaller share of live records are rewritten
+EXPORT_LOCK_TIMEOUT = 30  # Seconds to wait for another process's write to the index
+EXPORT_READ_ATTEMPTS = 3  # Reads retried when a compaction moved the records after the index was read
+
+
+def read_member(path, offset):
+    """Decompress the single gzip member starting at offset and return its lines."""
+    decompressor = zlib.decompressobj(wbits=31)
+    data = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while not decompressor.eof:
+            chunk = f.read(1 << 16)
+            if not chunk:
+                break
+            data.append(decompressor.decompress(chunk))
+    return b''.join(data).decode('utf-8').splitlines()
+
+
+class ExportStore:
+    """Append-only store of exported track metadata, written in the background and indexed in SQLite."""
+
+    def __init__(self, directory=EXPORT_STORE_DIR, segment_bytes=EXPORT_SEGMENT_BYTES, batch_size=EXPORT_BATCH_SIZE,
+                 flush_interval=EXPORT_FLUSH_INTERVAL, fsync=EXPORT_FSYNC, compact_interval=EXPORT_COMPACT_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.compact_interval = compact_interval
+        self.stats = {'written': 0, 'batches': 0, 'dropped': 0, 'errors': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # Held while this process writes, with the writer connection
+        self._lock = threading.Lock()  # Guards the reader connection
+        index_path = os.path.join(directory, "index.db")
+        self._conn = sqlite3.connect(index_path, timeout=EXPORT_LOCK_TIMEOUT, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                title TEXT,
+                title_key TEXT,
+                audio_hash TEXT,
+                created_at REAL NOT NULL,
+                segment TEXT NOT NULL,
+                member_offset INTEGER NOT NULL,
+                line INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_title ON records (title_key, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_hash ON records (audio_hash, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_segment ON records (segment)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_created ON records (created_at)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS segments (
+                seq INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                records INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            )
+        """)
+        self._conn.commit()
+        # Transactions on this one are explicit (BEGIN IMMEDIATE), so readers never wait on a write in progress
+        self._writer = sqlite3.connect(index_path, timeout=EXPORT_LOCK_TIMEOUT, isolation_level=None,
+                                       check_same_thread=False)
+        self._last_compaction = time.monotonic()
+
+    def append(self, kind, title, resolved, raw=None, audio_hash=None):
+        """Queue a record for writing; never blocks the caller on disk."""
+        record = {
+            'kind': kind,
+            'title': title,
+            'audio_hash': audio_hash,
+            'created_at': time.time(),
+            'resolved': resolved,
+            'raw': raw,
+        }
+        self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            print(f"Export queue is full, dropping the {kind} record for '{title}'.")
+
+    def _start(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="export-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Error writing {len(batch)} export records: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if self.compact_interval and time.monotonic() - self._last_compaction >= self.compact_interval:
+                self._last_compaction = time.monotonic()
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"Error compacting the export store: {e}")
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the index's write lock, shared with every process using this directory, and commit at the end."""
+        with self._write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.execute("ROLLBACK")
+                raise
+            self._writer.execute("COMMIT")
+
+    def _append(self, conn, data):
+        """Append one gzip member to the newest segment, starting a new one when it is full; returns (name, offset).
+
+        Must run inside _transaction(). The segment and its size are re-read from the index every time,
+        since another process may have appended since.
+        """
+        row = conn.execute("SELECT seq, name, bytes FROM segments ORDER BY seq DESC LIMIT 1").fetchone()
+        if row is None or (row[2] and row[2] + len(data) > self.segment_bytes):
+            seq = row[0] + 1 if row else 1
+            row = (seq, f"segment-{seq:08d}.jsonl.gz", 0)
+            conn.execute("INSERT INTO segments (seq, name, records, bytes) VALUES (?, ?, 0, 0)", row[:2])
+        seq, name, offset = row
+
+        path = os.path.join(self.directory, name)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+            # Bytes past the indexed size were left by a writer that failed before committing
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        conn.execute("UPDATE segments SET bytes = ? WHERE seq = ?", (offset + len(data), seq))
+        return name, offset
+
+    def _write_batch(self, records):
+        """Append records to the current segment as one gzip member and index them; returns their locations."""
+        lines = "".join(json.dumps(record, separators=(',', ':'), default=str) + "\n" for record in records)
+        data = gzip.compress(lines.encode('utf-8'))
+        with self._transaction() as conn:
+            name, offset = self._append(conn, data)
+            conn.executemany(
+                "INSERT INTO records (kind, title, title_key, audio_hash, created_at, segment, member_offset, line) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(record['kind'], record['title'], normalize_title(record['title']) if record['title'] else None,
+                  record['audio_hash'], record['created_at'], name, offset, line)
+                 for line, record in enumerate(records)]
+            )
+            conn.execute("UPDATE segments SET records = records + ? WHERE name = ?", (len(records), name))
+        self.stats['written'] += len(records)
+        self.stats['batches'] += 1
+        return name, offset
+
+    def flush(self):
+        """Wait until every queued record has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _load(self, rows):
+        """Read the records at the given (segment, member_offset, line) locations, one decompression per member."""
+        members = {}
+        records = []
+        for segment, offset, line in rows:
+            key = (segment, offset)
+            if key not in members:
+                members[key] = read_member(os.path.join(self.directory, segment), offset)
+            records.append(json.loads(members[key][line]))
+        return records
+
+    def query(self, title=None, audio_hash=None, kind=None, since=None, limit=100):
+        """Return the newest matching records first, filtered by title, audio hash, kind and creation time."""
+        clauses, params = [], []
+        if title:
+            clauses.append("title_key = ?")
+            params.append(normalize_title(title))
+        if audio_hash:
+            clauses.append("audio_hash = ?")
+            params.append(audio_hash)
+        if kind:
+            clauses.append("kind = ?")
+            params.append(kind)
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        for attempt in range(EXPORT_READ_ATTEMPTS):
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT segment, member_offset, line FROM records {where} "
+                    f"ORDER BY created_at DESC, id DESC LIMIT ?", (*params, limit)
+                ).fetchall()
+            try:
+                return self._load(rows)
+            except (OSError, zlib.error, IndexError):
+                # A compaction, maybe in another process, moved these records after the index was read
+                if attempt == EXPORT_READ_ATTEMPTS - 1:
+                    raise
+
+    def latest(self, title=None, audio_hash=None, kind=None):
+        """Return the newest matching record, or None."""
+        records = self.query(title, audio_hash, kind, limit=1)
+        return records[0] if records else None
+
+    def compact(self, retention_days=EXPORT_RETENTION_DAYS, keep_versions=EXPORT_KEEP_VERSIONS):
+        """Drop expired and superseded records, then delete or rewrite segments that are mostly dead.
+
+        Records older than retention_days go, as do all but the newest keep_versions records per kind
+        and title/audio hash. Segments left empty are deleted; segments with less than half their records
+        live have the live ones copied to the current segment first. Returns what was removed.
+        """
+        result = {'expired': 0, 'superseded': 0, 'segments_deleted': 0, 'segments_rewritten': 0}
+        removed = []
+        with self._transaction() as conn:
+            if retention_days:
+                cutoff = time.time() - retention_days * 86400
+                result['expired'] = conn.execute("DELETE FROM records WHERE created_at < ?", (cutoff,)).rowcount
+            if keep_versions:
+                result['superseded'] = conn.execute("""
+                    DELETE FROM records WHERE id IN (
+                        SELECT id FROM (
+                            SELECT id, ROW_NUMBER() OVER (
+                                PARTITION BY kind, COALESCE(audio_hash, title_key) ORDER BY created_at DESC, id DESC
+                            ) AS version FROM records
+                        ) WHERE version > ?
+                    )
+                """, (keep_versions,)).rowcount
+            segments = conn.execute(
+                "SELECT s.seq, s.name, s.records, COUNT(r.id) FROM segments s "
+                "LEFT JOIN records r ON r.segment = s.name GROUP BY s.seq ORDER BY s.seq"
+            ).fetchall()
+
+            current = segments[-1][0] if segments else None  # The newest segment is still being appended to
+            for seq, name, total, live in segments:
+                if seq == current or (total and live / total >= EXPORT_COMPACT_RATIO):
+                    continue
+                if live:
+                    self._rewrite_segment(conn, name)
+                    result['segments_rewritten'] += 1
+                else:
+                    result['segments_deleted'] += 1
+                conn.execute("DELETE FROM segments WHERE seq = ?", (seq,))
+                removed.append(os.path.join(self.directory, name))
+
+        # Only once the index no longer points at them; readers that looked before retry
+        for path in removed:
+            if os.path.exists(path):
+                os.remove(path)
+        return result
+
+    def _rewrite_segment(self, conn, name):
+        """Copy a segment's live records into the current segment and repoint their index rows."""
+        rows = conn.execute("SELECT id, segment, member_offset, line FROM records WHERE segment = ? ORDER BY id",
+                            (name,)).fetchall()
+        records = self._load([row[1:] for row in rows])
+        lines = "".join(json.dumps(record, separators=(',', ':'), default=str) + "\n" for record in records)
+        current, offset = self._append(conn, gzip.compress(lines.encode('utf-8')))
+        conn.executemany("UPDATE records SET segment = ?, member_offset = ?, line = ? WHERE id = ?",
+                         [(current, offset, line, row[0]) for line, row in enumerate(rows)])
+        conn.execute("UPDATE segments SET records = records + ? WHERE name = ?", (len(rows), current))
+
+    def queue_depth(self):
+        """Records waiting for the writer."""
+        return self._queue.qsize()
+
+    def get_stats(self):
+        """Record, segment and byte counts, plus writer counters."""
+        with self._lock:
+            records = self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+            segments, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM segments").fetchone()
+        return {**self.stats, 'records': records, 'segments': segments, 'bytes': size,
+                'queued': self.queue_depth()}
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+        with self._write_lock:
+            self._writer.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_export_store():
+    """Return the shared export store, opening it on first use; queued records are flushed at exit."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ExportStore()
+                atexit.register(_store.flush)
+    return _store
+
+
+def selftest():
+    """Write, read back and compact records in a temporary store."""
+    with tempfile.TemporaryDirectory() as directory:
+        store = ExportStore(directory, segment_bytes=4096, flush_interval=0.05, fsync=False, compact_interval=0)
+        start = time.perf_counter()
+        for i in range(2000):
+            resolved = {'title': f"Song {i % 500}", 'contributing_artists': "Queen", 'year': "1975"}
+            store.append('lookup', f"Song {i % 500}", resolved, raw={'spotify': resolved})
+            store.append('tagged', f"Song {i % 500}", resolved, audio_hash=f"{i % 500:032x}")
+        store.flush()
+        write_us = (time.perf_counter() - start) / 4000 * 1e6
+
+        stats = store.get_stats()
+        assert stats['records'] == 4000 and stats['dropped'] == 0, stats
+        assert stats['segments'] > 1, "segments were not rotated"
+        newest = store.latest(title="song_42", kind='lookup')
+        assert newest['resolved']['title'] == "Song 42" and newest['raw']['spotify']['year'] == "1975", newest
+        assert store.latest(audio_hash=f"{499:032x}")['title'] == "Song 499"
+        assert len(store.query(title="Song 42")) == 8
+
+        start = time.perf_counter()
+        for i in range(1000):
+            store.latest(title=f"Song {i % 500}")
+        read_us = (time.perf_counter() - start) / 1000 * 1e6
+
+        compacted = store.compact(retention_days=0, keep_versions=1)
+        assert compacted['superseded'] == 3000, compacted
+        assert compacted['segments_deleted'] + compacted['segments_rewritten'] > 0, compacted
+        assert len(store.query(title="Song 42")) == 2  # The newest lookup and the newest tag write
+        assert store.latest(title="Song 42", kind='lookup')['raw']['spotify']['title'] == "Song 42"
+        after = store.get_stats()
+
+        # A second writer on the same directory, as another worker process would have
+        other = ExportStore(directory, segment_bytes=4096, flush_interval=0.01, fsync=False, compact_interval=0)
+        for i in range(200):
+            resolved = {'title': f"Other {i}", 'contributing_artists': "Queen"}
+            (store if i % 2 else other).append('lookup', f"Other {i}", resolved)
+            if i % 50 == 49:
+                store.flush()
+                other.flush()
+        store.flush()
+        other.flush()
+        assert store.stats['errors'] == other.stats['errors'] == 0, (store.stats, other.stats)
+        assert all(other.latest(title=f"Other {i}")['title'] == f"Other {i}" for i in range(200))
+        assert store.compact(retention_days=0, keep_versions=1)['segments_rewritten'] >= 0
+        assert all(other.latest(title=f"Other {i}")['title'] == f"Other {i}" for i in range(200))
+        assert other.latest(title="Song 42", kind='lookup')['resolved']['title'] == "Song 42"
+        other.close()
+        store.close()
+
+    print(f"Export store selftest passed: {write_us:.1f} us per write, {read_us:.1f} us per read, "
+          f"{stats['segments']} -> {after['segments']} segments, {stats['bytes']} -> {after['bytes']} bytes.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read and maintain the metadata export store.")
+    parser.add_argument("--directory", default=EXPORT_STORE_DIR, help="Export store directory.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    query_parser = commands.add_parser("query", help="Print matching records, newest first.")
+    query_parser.add_argument("--title")
+    query_parser.add_argument("--audio-hash")
+    query_parser.add_argument("--kind", choices=("lookup", "tagged"))
+    query_parser.add_argument("--limit", type=int, default=10)
+    compact_parser = commands.add_parser("compact", help="Drop expired and superseded records.")
+    compact_parser.add_argument("--retention-days", type=float, default=EXPORT_RETENTION_DAYS)
+    compact_parser.add_argument("--keep-versions", type=int, default=EXPORT_KEEP_VERSIONS)
+    commands.add_parser("stats", help="Print record and segment counts.")
+    commands.add_parser("selftest", help="Check the store in a temporary directory.")
+    args = parser.parse_args(argv)
+
+    if args.command == "selftest":
+        selftest()
+        return 0
+
+    store = ExportStore(args.directory, compact_interval=0)
+    if args.command == "query":
+        print(json.dumps(store.query(args.title, args.audio_hash, args.kind, limit=args.limit), indent=4))
+    elif args.command == "compact":
+        print(json.dumps(store.compact(args.retention_days, args.keep_versions), indent=4))
+    else:
+        print(json.dumps(store.get_stats(), indent=4))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
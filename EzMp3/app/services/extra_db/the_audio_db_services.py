@@ -1,6 +1,8 @@
 import requests
 import sys
 import os
+from EzMp3.app.services.http_clients import get_session
+THEAUDIODB_API_URL = os.getenv("THEAUDIODB_API_URL", "https://www.theaudiodb.com/api/v1/json")
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(parent_dir)
 #import mp3_name
@@ -18,7 +20,7 @@ def search_audiodb(title):
     }
 
     try:
-        response = requests.get(base_url, params=params)
+        response = get_session('theaudiodb').get(base_url, params=params)
         response.raise_for_status()  # Raise an error for bad responses
 
         data = response.json()
@@ -45,4 +47,29 @@ def search_audiodb(title):
     except requests.RequestException as e:
         print(f"An error occurred: {e}")
 
+
+def fetch_audiodb_metadata(title, artist=None):
+    """Fetch metadata for a track from TheAudioDB; its track search needs the artist as well as the title."""
+    if not artist:
+        return None
+
+    api_key = "2"
+    base_url = f"{THEAUDIODB_API_URL}/{api_key}/searchtrack.php"
+
+    response = get_session('theaudiodb').get(base_url, params={'s': artist, 't': title})
+    response.raise_for_status()
+    tracks = response.json().get('track') or []
+
+    if not tracks:
+        return None
+    track = tracks[0]
+    return {
+        'title': track.get('strTrack'),
+        'artist': track.get('strArtist'),
+        'album_artist': track.get('strAlbumArtist') or track.get('strArtist'),
+        'album': track.get('strAlbum'),
+        'year': str(track['intYearReleased']) if track.get('intYearReleased') else None,
+        'genres': [track['strGenre']] if track.get('strGenre') else []
+    }
+
 # search_audiodb(song_name)
\ No newline at end of file
@@ -0,0 +1,82 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from EzMp3.app.services.rate_limiter import rate_limiter
+
+load_dotenv()
+
+# Connection pool limits per provider; one pool is shared by every request and worker thread
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 4))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 16))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+HTTP_CONNECT_RETRIES = int(os.getenv("HTTP_CONNECT_RETRIES", 2))
+HTTP_THROTTLE_RETRIES = int(os.getenv("HTTP_THROTTLE_RETRIES", 3))  # Re-queues after a 429/503 before giving up
+
+USER_AGENT = "ezmp3/1.0"
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTP adapter that applies a default timeout and the provider's rate limit to every request.
+
+    Each request waits for a token from the shared rate limiter. A 429/503 answer pushes the
+    provider's bucket back by Retry-After and the request is queued again instead of failing.
+    """
+
+    def __init__(self, *args, provider=None, timeout=None, **kwargs):
+        self.provider = provider
+        self.timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+
+        for attempt in range(HTTP_THROTTLE_RETRIES + 1):
+            rate_limiter.acquire(self.provider)
+            response = super().send(request, **kwargs)
+            rate_limiter.observe_response(self.provider, response.status_code, response.headers)
+            if response.status_code not in (429, 503) or attempt == HTTP_THROTTLE_RETRIES:
+                return response
+            response.close()
+
+
+def build_session(provider=None):
+    """Create a keep-alive session with bounded connection pools and connect retries."""
+    session = requests.Session()
+    adapter = TimeoutHTTPAdapter(
+        provider=provider,
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=Retry(total=HTTP_CONNECT_RETRIES, connect=HTTP_CONNECT_RETRIES, read=0, status=0,
+                          backoff_factor=0.3),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+def get_session(provider):
+    """Return the shared HTTP session for a provider, creating it on first use."""
+    session = _sessions.get(provider)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider)
+            if session is None:
+                session = _sessions[provider] = build_session(provider)
+    return session
+
+
+def close_sessions():
+    """Close every pooled session, e.g. when a worker shuts down."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", 100))  # Queued + running jobs before uploads are refused
+JOB_TTL = int(os.getenv("JOB_TTL", 3600))  # How long finished jobs stay queryable, in seconds
+
+
+class JobQueue:
+    """Bounded worker pool that runs background jobs and keeps their state for status polling."""
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, ttl=JOB_TTL):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) and return its job id, or None if the queue is full."""
+        if not self._slots.acquire(blocking=False):
+            return None
+
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge_expired()
+            self._jobs[job_id] = {'id': job_id, 'state': 'queued', 'created_at': time.time()}
+        self._executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id, fn, args):
+        self._update(job_id, state='running', started_at=time.time())
+        try:
+            result = fn(*args)
+            self._update(job_id, state='done', finished_at=time.time(), **(result or {}))
+        except Exception as e:
+            self._update(job_id, state='failed', finished_at=time.time(), error=str(e))
+        finally:
+            self._slots.release()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.get('finished_at', time.time()) < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Return a snapshot of a job's state, or None if it is unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def is_full(self):
+        """Whether submit() would refuse a job right now; it can still fill up before the next submit()."""
+        depth = self.depth()
+        return depth['queued'] + depth['running'] >= self.max_pending
+
+    def depth(self):
+        """Return how many jobs are waiting and running."""
+        with self._lock:
+            states = [job['state'] for job in self._jobs.values()]
+        return {'queued': states.count('queued'), 'running': states.count('running')}
@@ -1,59 +1,69 @@
 import os
-import pylast
-import httpx
 from dotenv import load_dotenv
-from urllib3.util.retry import Retry
+from EzMp3.app.services.artist_cache import get_artist, remember_artist
+from EzMp3.app.services.http_clients import get_session
+from EzMp3.app.services.single_flight import get_group
 
 load_dotenv()
 
-# API Credentials
+# API Credentials; reading tags only needs the API key, so there is no login
 LASTFM_API_KEY = os.getenv("LASTFM_API_KEY")
-LASTFM_API_SECRET = os.getenv("LASTFM_API_SECRET")
-LASTFM_USERNAME = os.getenv("LASTFM_USERNAME")
-LASTFM_PASSWORD = pylast.md5(os.getenv("LASTFM_PASSWORD"))
+LASTFM_API_URL = os.getenv("LASTFM_API_URL", "https://ws.audioscrobbler.com/2.0/")
+LASTFM_NOT_FOUND = 6  # The only API error that says something about the artist rather than the request or service
 
+tag_lookups = get_group('lastfm_tags')
 
-def initialize_lastfm_client():
-    if not LASTFM_API_KEY or not LASTFM_API_SECRET or not LASTFM_USERNAME or not LASTFM_PASSWORD:
-        raise ValueError("Missing Last.fm API credentials in environment variables.")
 
-    # Retry logic at the application level using httpx
-    def retry_client():
-        retries = 3  # Retry up to 3 times
-        for attempt in range(retries):
-            try:
-                client = httpx.Client(timeout=10.0, verify=False)  # Disable SSL verification for now
-                return client
-            except httpx.RequestError as e:
-                if attempt < retries - 1:  # Retry until max retries reached
-                    print(f"Retrying... (attempt {attempt + 1})")
-                else:
-                    raise e
+class LastFMError(Exception):
+    """Raised when Last.fm answers with an HTTP error or an API error other than "not found"."""
 
-    client = retry_client()  # Create an HTTPX client with retry logic
 
-    return pylast.LastFMNetwork(
-        api_key=LASTFM_API_KEY,
-        api_secret=LASTFM_API_SECRET,
-        username=LASTFM_USERNAME,
-        password_hash=LASTFM_PASSWORD
-    )
+def fetch_lastfm_tags(track, artist):
+    """Fetch tags from Last.fm for the track's artist.
 
+    Tags describe the artist rather than one track, so they are cached per artist and every track
+    by it shares one request.
+    """
+    entry = get_artist(artist)
+    if entry and entry['tags'] is not None:
+        return entry['tags']
+    return tag_lookups.do(artist.lower(), fetch_top_tags, artist)
 
-lastfm = initialize_lastfm_client()
 
+def fetch_top_tags(artist):
+    """Fetch the top tags for an artist from Last.fm and cache them with its corrected spelling."""
+    # Another lookup may have cached it since this one missed; it is cached before its call stops being in flight
+    entry = get_artist(artist)
+    if entry and entry['tags'] is not None:
+        return entry['tags']
+    if not LASTFM_API_KEY:
+        print("Last.fm API key is missing!")
+        return []
 
-def fetch_lastfm_tags(track, artist):
-    """Fetch tags from Last.fm."""
-    try:
-        # Use the Last.fm client to get track information
-        track_obj = lastfm.get_track(artist, track)
-        tags = track_obj.get_top_tags(limit=5)  # Fetch top 5 tags
-        return [tag.item.name for tag in tags]  # Return list of tag names
-    except pylast.NetworkError as e:
-        print(f"Network error: {e}")
-    except pylast.WSError as e:
-        print(f"Last.fm API error: {e}")
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-    return []
+    response = get_session('lastfm').get(LASTFM_API_URL, params={
+        'method': 'artist.getTopTags',
+        'artist': artist,
+        'autocorrect': 1,
+        'api_key': LASTFM_API_KEY,
+        'format': 'json',
+    })
+    if response.status_code >= 500:
+        raise LastFMError(f"Invalid API response {response.status_code}")
+
+    data = response.json()
+    if 'error' in data:
+        if data['error'] != LASTFM_NOT_FOUND:
+            # Rate limited (29), a bad or suspended key (10, 26), or the service is down (11, 16): not cacheable
+            raise LastFMError(f"API error {data['error']}: {data.get('message')}")
+        # The artist isn't on Last.fm, which stays true for a while
+        print(f"Last.fm API error: {data.get('message')}")
+        remember_artist(artist, tags=[])
+        return []
+
+    toptags = data.get('toptags', {})
+    tags = toptags.get('tag', [])
+    if isinstance(tags, dict):  # A single tag comes back as an object rather than a list
+        tags = [tags]
+    tags = [tag['name'] for tag in tags[:5]]  # The top 5 tag names
+    remember_artist(toptags.get('@attr', {}).get('artist') or artist, tags=tags, alias=artist)
+    return tags
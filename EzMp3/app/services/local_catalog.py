@@ -0,0 +1,391 @@
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from dotenv import load_dotenv
+from rapidfuzz import fuzz
+from EzMp3.app.services.metadata_cache import normalize_title
+
+'''
+how to run:
+python -m EzMp3.app.services.local_catalog import EzMp3/app/services/metadata_exports dump.jsonl
+python -m EzMp3.app.services.local_catalog lookup "Bohemian Rhapsody"
+python -m EzMp3.app.services.local_catalog selftest
+
+Importing only re-reads sources whose size or mtime changed since the last import; --rebuild
+starts from an empty catalog. selftest builds a throwaway catalog from the bundled fixture dump.
+'''
+
+load_dotenv()
+
+CATALOG_PATH = os.getenv("LOCAL_CATALOG_PATH", "app/local_catalog.db")
+CATALOG_ENABLED = os.getenv("LOCAL_CATALOG_ENABLED", "True") == "True"
+CATALOG_MIN_SCORE = int(os.getenv("LOCAL_CATALOG_MIN_SCORE", 90))  # Fuzzy matches below this go to the providers
+CATALOG_FUZZY_LIMIT = 20  # Full-text hits re-scored per lookup
+FIXTURE_DUMP = os.path.join(os.path.dirname(__file__), "fixtures", "catalog_dump.jsonl")
+
+
+def earliest_album_release(releases):
+    """Earliest official, non-compilation album among a MusicBrainz recording's releases."""
+    best = None
+    for release in releases:
+        if release.get('status') not in (None, 'Official') or not release.get('date'):
+            continue
+        group = release.get('release-group') or {}
+        secondary_types = [t.lower() for t in group.get('secondary-types') or []]
+        if "compilation" in secondary_types or "soundtrack" in secondary_types:
+            continue
+        if group.get('primary-type') not in (None, 'Album'):
+            continue
+        if best is None or release['date'] < best['date']:
+            best = release
+    return best
+
+
+def artist_credit_name(credits):
+    """Join a MusicBrainz artist-credit list into a display name."""
+    if not credits:
+        return None
+    return "".join((credit.get('name') or credit.get('artist', {}).get('name', '')) + credit.get('joinphrase', '')
+                   for credit in credits) or None
+
+
+def track_from_recording(recording):
+    """Turn one line of a MusicBrainz JSON recording dump into a catalog track, or None."""
+    title = recording.get('title')
+    artist = artist_credit_name(recording.get('artist-credit'))
+    if not title or not artist:
+        return None
+    release = earliest_album_release(recording.get('releases') or [])
+    genres = sorted(recording.get('genres') or recording.get('tags') or [], key=lambda g: -g.get('count', 0))
+    return {
+        'title': title,
+        'contributing_artists': artist,
+        'album_artist': artist_credit_name(release.get('artist-credit')) or artist if release else artist,
+        'album': release.get('title') if release else None,
+        'year': release['date'][:4] if release else None,
+        'genres': [genre['name'] for genre in genres[:5]],
+    }
+
+
+def catalog_track(resolved):
+    """The catalog fields of resolved metadata, or None if it lacks a title or artist."""
+    if resolved and resolved.get('title') and resolved.get('contributing_artists'):
+        return {field: resolved.get(field) for field in
+                ('title', 'contributing_artists', 'album_artist', 'album', 'year', 'genres')}
+    return None
+
+
+def read_source(path):
+    """Yield the catalog tracks in one source file: an export store segment (.jsonl.gz), a legacy
+    export (.json) or a recording dump (.jsonl).
+
+    Only 'lookup' records are read from segments: 'tagged' ones may be a file's own tags passed through
+    unchecked, which must not answer other users' lookups. Legacy exports come in two shapes:
+    ai_services wrapped the result under 'resolved_metadata', save_metadata() in api_routes wrote the
+    resolved dict itself; both were resolved by the providers.
+    """
+    if path.endswith('.jsonl.gz'):
+        with gzip.open(path, 'rt', encoding='utf-8') as segment:
+            for line in segment:
+                record = json.loads(line) if line.strip() else {}
+                track = catalog_track(record.get('resolved')) if record.get('kind') == 'lookup' else None
+                if track:
+                    yield track
+        return
+
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as dump:
+            for line in dump:
+                if line.strip():
+                    track = track_from_recording(json.loads(line))
+                    if track:
+                        yield track
+        return
+
+    with open(path, encoding='utf-8') as export:
+        data = json.load(export)
+    track = catalog_track(data.get('resolved_metadata', data))
+    if track:
+        yield track
+
+
+def iter_source_files(paths):
+    """Expand files and directories into the .json/.jsonl/.jsonl.gz files to import."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(('.json', '.jsonl', '.jsonl.gz')):
+                    yield os.path.join(path, name)
+        elif os.path.isfile(path):
+            yield path
+
+
+class LocalCatalog:
+    """SQLite index of known tracks, searched by normalized title and by trigram full-text match."""
+
+    def __init__(self, path=CATALOG_PATH, min_score=CATALOG_MIN_SCORE):
+        self.min_score = min_score
+        self.stats = {'hits': 0, 'fuzzy_hits': 0, 'ambiguous': 0, 'misses': 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL,
+                artist_key TEXT NOT NULL,
+                source TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                UNIQUE (key, artist_key)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_source ON tracks (source)")
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(key, tokenize='trigram')")
+        # Source files already imported, so a rebuild only re-reads what changed
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                tracks INTEGER NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def _remove_source(self, source):
+        self._conn.execute("DELETE FROM tracks_fts WHERE rowid IN (SELECT id FROM tracks WHERE source = ?)",
+                           (source,))
+        self._conn.execute("DELETE FROM tracks WHERE source = ?", (source,))
+
+    def _add_track(self, source, track):
+        key = normalize_title(track['title'])
+        artist_key = normalize_title(track['contributing_artists'])
+        if not key:
+            return False
+        # A track seen in several sources keeps the most recently imported version
+        row = self._conn.execute("SELECT id FROM tracks WHERE key = ? AND artist_key = ?", (key, artist_key)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM tracks_fts WHERE rowid = ?", (row[0],))
+            self._conn.execute("DELETE FROM tracks WHERE id = ?", (row[0],))
+        cursor = self._conn.execute(
+            "INSERT INTO tracks (key, artist_key, source, metadata) VALUES (?, ?, ?, ?)",
+            (key, artist_key, source, json.dumps(track))
+        )
+        self._conn.execute("INSERT INTO tracks_fts (rowid, key) VALUES (?, ?)", (cursor.lastrowid, key))
+        return True
+
+    def import_sources(self, paths, rebuild=False):
+        """Import export files and recording dumps, skipping sources unchanged since the last import.
+
+        Returns (sources read, sources skipped, tracks imported).
+        """
+        read = skipped = imported = 0
+        with self._lock:
+            if rebuild:
+                self._conn.execute("DELETE FROM tracks")
+                self._conn.execute("DELETE FROM tracks_fts")
+                self._conn.execute("DELETE FROM sources")
+
+            known = {path: (size, mtime_ns) for path, size, mtime_ns in
+                     self._conn.execute("SELECT path, size, mtime_ns FROM sources")}
+            for source in iter_source_files(paths):
+                source = os.path.abspath(source)
+                stat = os.stat(source)
+                if known.get(source) == (stat.st_size, stat.st_mtime_ns):
+                    skipped += 1
+                    continue
+
+                self._remove_source(source)
+                try:
+                    count = sum(self._add_track(source, track) for track in read_source(source))
+                except (ValueError, OSError, EOFError, AttributeError, TypeError) as e:
+                    # AttributeError and TypeError: valid JSON of the wrong shape, e.g. a list instead of an object
+                    self._conn.rollback()
+                    print(f"Skipping unreadable catalog source {source}: {e}")
+                    continue
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sources (path, size, mtime_ns, tracks) VALUES (?, ?, ?, ?)",
+                    (source, stat.st_size, stat.st_mtime_ns, count)
+                )
+                self._conn.commit()
+                read += 1
+                imported += count
+        return read, skipped, imported
+
+    def lookup(self, title, artist=None):
+        """Return catalog metadata for a title (and optionally artist), or None when nothing matches well.
+
+        Without an artist, a title only matches when a single artist in the catalog has it.
+        """
+        key = normalize_title(title)
+        if not key:
+            return None
+        artist_key = normalize_title(artist) if artist else None
+
+        with self._lock:
+            rows = self._conn.execute("SELECT artist_key, metadata FROM tracks WHERE key = ?", (key,)).fetchall()
+            if artist_key:
+                rows = [row for row in rows if row[0] == artist_key]
+            if len(rows) > 1:
+                # Several artists have a track by this name ("Yesterday", "Hello"); without one, ask the providers
+                self.stats['ambiguous'] += 1
+                return None
+            if rows:
+                self.stats['hits'] += 1
+                return self._answer(rows[0][1], 1.0)
+
+            # No exact key: gather full-text candidates sharing a word with the title and re-score them
+            words = [word for word in key.split() if len(word) >= 3]
+            rows = []
+            if words:
+                match = " OR ".join(f'"{word}"' for word in words)
+                rows = self._conn.execute(
+                    "SELECT t.key, t.artist_key, t.metadata FROM tracks_fts f JOIN tracks t ON t.id = f.rowid "
+                    "WHERE tracks_fts MATCH ? ORDER BY rank LIMIT ?", (match, CATALOG_FUZZY_LIMIT)
+                ).fetchall()
+
+        best_score, best, best_artists = 0, None, set()
+        for row_key, row_artist, metadata in rows:
+            if artist_key and fuzz.ratio(artist_key, row_artist) < self.min_score:
+                continue
+            score = fuzz.ratio(key, row_key)
+            if score > best_score:
+                best_score, best, best_artists = score, metadata, {row_artist}
+            elif score == best_score:
+                best_artists.add(row_artist)
+        if best is not None and best_score >= self.min_score and len(best_artists) > 1:
+            self.stats['ambiguous'] += 1
+            return None
+        if best is not None and best_score >= self.min_score:
+            self.stats['fuzzy_hits'] += 1
+            return self._answer(best, best_score / 100)
+        self.stats['misses'] += 1
+        return None
+
+    @staticmethod
+    def _answer(metadata, score):
+        resolved = json.loads(metadata)
+        resolved['confidence'] = dict.fromkeys(('title', 'artist', 'album', 'year'), round(score, 3))
+        return resolved
+
+    def get_stats(self):
+        """Catalog size and hit/miss counters."""
+        with self._lock:
+            tracks = self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+            sources = self._conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+        return {**self.stats, 'tracks': tracks, 'sources': sources}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Return the shared catalog, opening it on first use; None when it is disabled."""
+    global _catalog
+    if not CATALOG_ENABLED:
+        return None
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = LocalCatalog()
+    return _catalog
+
+
+def selftest():
+    """Build a catalog from the fixture dump in a temporary file and check lookups against it."""
+    with tempfile.TemporaryDirectory() as directory:
+        catalog = LocalCatalog(os.path.join(directory, "catalog.db"))
+        read, skipped, imported = catalog.import_sources([FIXTURE_DUMP])
+        assert (read, skipped) == (1, 0) and imported > 0, (read, skipped, imported)
+        assert catalog.import_sources([FIXTURE_DUMP]) == (0, 1, 0), "unchanged source was re-read"
+
+        exact = catalog.lookup("Bohemian Rhapsody")
+        assert exact['contributing_artists'] == "Queen" and exact['album'] == "A Night at the Opera", exact
+        assert exact['year'] == "1975", exact
+        assert catalog.lookup("bohemian_rhapsody")['title'] == "Bohemian Rhapsody"
+        assert catalog.lookup("Bohemian Rhapsodyy")['title'] == "Bohemian Rhapsody"
+        assert catalog.lookup("Gonna Fly Now", artist="Bill Conti")['album'] == "Rocky"
+        assert catalog.lookup("Gonna Fly Now", artist="Someone Else") is None
+        assert catalog.lookup("A Song Nobody Has Heard Of") is None
+        assert catalog.lookup("Hallelujah") is None, "a title two artists share matched one of them"
+        assert catalog.lookup("Hallelujah", artist="Jeff Buckley")['contributing_artists'] == "Jeff Buckley"
+
+        # Both legacy export shapes are read; JSON of the wrong shape is skipped, not fatal
+        exports = os.path.join(directory, "exports")
+        os.makedirs(exports)
+        legacy = {'title': "Heroes", 'contributing_artists': "David Bowie", 'album': "Heroes", 'year': "1977"}
+        for name, data in (("wrapped.json", {'resolved_metadata': {**legacy, 'title': "Changes"}}),
+                           ("flat.json", legacy), ("list.json", [legacy])):
+            with open(os.path.join(exports, name), 'w') as f:
+                json.dump(data, f)
+        assert catalog.import_sources([exports]) == (2, 0, 2)
+        assert catalog.lookup("Heroes")['year'] == "1977" and catalog.lookup("Changes") is not None
+
+        # From export store segments only provider lookups are taken, never a file's own tags
+        with gzip.open(os.path.join(exports, "segment-00000001.jsonl.gz"), 'wt', encoding='utf-8') as segment:
+            for kind, title in (('lookup', "Starman"), ('tagged', "Untrusted Title")):
+                segment.write(json.dumps({'kind': kind, 'resolved': {**legacy, 'title': title}}) + "\n")
+        assert catalog.import_sources([exports])[2] == 1  # The unreadable list.json is read again too
+        assert catalog.lookup("Starman") is not None and catalog.lookup("Untrusted Title") is None
+
+        rounds = 10000
+        start = time.perf_counter()
+        for _ in range(rounds):
+            catalog.lookup("Bohemian Rhapsody")
+        exact_us = (time.perf_counter() - start) / rounds * 1e6
+        start = time.perf_counter()
+        for _ in range(rounds // 10):
+            catalog.lookup("Bohemian Rhapsodyy")
+        fuzzy_us = (time.perf_counter() - start) / (rounds // 10) * 1e6
+        catalog.close()
+
+    print(f"Catalog selftest passed: {imported} tracks, exact lookup {exact_us:.1f} us, "
+          f"fuzzy lookup {fuzzy_us:.1f} us.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the offline track catalog.")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="Catalog database file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Import export directories, export files or .jsonl dumps.")
+    import_parser.add_argument("paths", nargs="+")
+    import_parser.add_argument("--rebuild", action="store_true", help="Drop the catalog before importing.")
+    lookup_parser = commands.add_parser("lookup", help="Look up a title.")
+    lookup_parser.add_argument("title")
+    lookup_parser.add_argument("--artist")
+    commands.add_parser("selftest", help="Check the catalog against the bundled fixture dump.")
+    args = parser.parse_args(argv)
+
+    if args.command == "selftest":
+        selftest()
+        return 0
+
+    catalog = LocalCatalog(args.catalog)
+    if args.command == "import":
+        start = time.monotonic()
+        read, skipped, imported = catalog.import_sources(args.paths, rebuild=args.rebuild)
+        print(f"Imported {imported} tracks from {read} sources ({skipped} unchanged) "
+              f"in {time.monotonic() - start:.2f}s; catalog now {catalog.get_stats()['tracks']} tracks.")
+    else:
+        print(json.dumps(catalog.lookup(args.title, args.artist), indent=4))
+    catalog.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
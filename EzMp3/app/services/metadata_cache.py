@@ -0,0 +1,175 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_PATH = os.getenv("METADATA_CACHE_PATH", "app/metadata_cache.db")
+CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL", 7 * 24 * 3600))  # Resolved tracks, in seconds
+CACHE_NEGATIVE_TTL = int(os.getenv("METADATA_CACHE_NEGATIVE_TTL", 3600))  # "No metadata found" results
+CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", 50000))
+
+
+def normalize_title(title):
+    """Normalize a track title so that trivially different spellings share a cache key."""
+    title = title.replace('_', ' ').lower()
+    title = re.sub(r"[^\w\s]", " ", title)
+    return " ".join(title.split())
+
+
+class MetadataCache:
+    """SQLite-backed cache of resolved and raw provider metadata, keyed by normalized title."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, negative_ttl=CACHE_NEGATIVE_TTL,
+                 max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'content_hits': 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS metadata_cache (
+                key TEXT PRIMARY KEY,
+                resolved TEXT,
+                raw TEXT,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_metadata_cache_access ON metadata_cache (last_access)")
+        # Resolved metadata keyed by the hash of a file's audio payload, so re-uploads skip every lookup
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS content_cache (
+                audio_hash TEXT PRIMARY KEY,
+                resolved TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(content_cache)")}
+        if 'last_access' not in columns:  # Created before content entries expired
+            self._conn.execute("ALTER TABLE content_cache ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_content_cache_access ON content_cache (last_access)")
+        self._conn.commit()
+        # Kept up to date on every write, so inserts don't have to count the tables
+        self._count = self._conn.execute("SELECT COUNT(*) FROM metadata_cache").fetchone()[0]
+        self._content_count = self._conn.execute("SELECT COUNT(*) FROM content_cache").fetchone()[0]
+
+    def get(self, title):
+        """Return (found, resolved, raw). A found entry with resolved=None is a cached miss."""
+        key = normalize_title(title)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resolved, raw, created_at FROM metadata_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return False, None, None
+
+            resolved, raw, created_at = row
+            ttl = self.ttl if resolved is not None else self.negative_ttl
+            if now - created_at > ttl:
+                self._count -= self._conn.execute("DELETE FROM metadata_cache WHERE key = ?", (key,)).rowcount
+                self._conn.commit()
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return False, None, None
+
+            self._conn.execute("UPDATE metadata_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats['hits' if resolved is not None else 'negative_hits'] += 1
+
+        return True, json.loads(resolved) if resolved is not None else None, json.loads(raw) if raw else None
+
+    def put(self, title, resolved, raw=None):
+        """Store a lookup result; pass resolved=None to remember that nothing was found."""
+        key = normalize_title(title)
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM metadata_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata_cache (key, resolved, raw, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(resolved) if resolved is not None else None,
+                 json.dumps(raw) if raw is not None else None, now, now)
+            )
+            if not exists:
+                self._count += 1
+            self._evict()
+            self._conn.commit()
+
+    def get_content(self, audio_hash):
+        """Return the metadata last written to a file with this audio hash, or None.
+
+        Entries expire and are evicted like resolved lookups (ttl, max_entries).
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resolved, created_at FROM content_cache WHERE audio_hash = ?", (audio_hash,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._content_count -= self._conn.execute(
+                    "DELETE FROM content_cache WHERE audio_hash = ?", (audio_hash,)).rowcount
+                self._conn.commit()
+                self.stats['expired'] += 1
+                return None
+            self._conn.execute("UPDATE content_cache SET last_access = ? WHERE audio_hash = ?", (now, audio_hash))
+            self._conn.commit()
+            self.stats['content_hits'] += 1
+        return json.loads(row[0])
+
+    def put_content(self, audio_hash, resolved):
+        """Remember the metadata written to a file with this audio hash."""
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM content_cache WHERE audio_hash = ?", (audio_hash,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content_cache (audio_hash, resolved, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (audio_hash, json.dumps(resolved), now, now)
+            )
+            if not exists:
+                self._content_count += 1
+            self._content_count -= self._evict_table('content_cache', 'audio_hash', self._content_count)
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop the least recently used entries once the cache is over its size cap."""
+        self._count -= self._evict_table('metadata_cache', 'key', self._count)
+
+    def _evict_table(self, table, key, count):
+        """Delete a table's least recently used rows beyond max_entries; returns how many were deleted."""
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return 0
+        evicted = self._conn.execute(
+            f"DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM {table} ORDER BY last_access LIMIT ?)",
+            (overflow,)
+        ).rowcount
+        self.stats['evictions'] += evicted
+        return evicted
+
+    def get_stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            # Other worker processes write to the same database, so the running count is corrected here
+            size = self._count = self._conn.execute("SELECT COUNT(*) FROM metadata_cache").fetchone()[0]
+            content_size = self._content_count = self._conn.execute("SELECT COUNT(*) FROM content_cache").fetchone()[0]
+        lookups = self.stats['hits'] + self.stats['negative_hits'] + self.stats['misses']
+        hit_rate = (self.stats['hits'] + self.stats['negative_hits']) / lookups if lookups else 0.0
+        return {**self.stats, 'size': size, 'content_size': content_size, 'max_entries': self.max_entries,
+                'hit_rate': round(hit_rate, 4)}
@@ -0,0 +1,102 @@
+import importlib
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# provider: (module, lookup function); a module and its client library are only imported on first use
+PROVIDER_MODULES = {
+    'spotify': ('EzMp3.app.services.spotify_services', 'fetch_spotify_metadata'),
+    'deezer': ('EzMp3.app.services.deezer_services', 'fetch_deezer_metadata'),
+    'discogs': ('EzMp3.app.services.discog_services', 'get_discogs_metadata'),
+    'musicbrainz': ('EzMp3.app.services.musicbrainz_services', 'fetch_musicbrainz_metadata'),
+    'theaudiodb': ('EzMp3.app.services.extra_db.the_audio_db_services', 'fetch_audiodb_metadata'),
+    'lastfm': ('EzMp3.app.services.lastfm_services', 'fetch_lastfm_tags'),
+}
+
+ENABLED_PROVIDERS = [name.strip() for name in os.getenv("ENABLED_PROVIDERS", ",".join(PROVIDER_MODULES)).split(',')
+                     if name.strip() in PROVIDER_MODULES]
+PRELOAD_PROVIDERS = os.getenv("PRELOAD_PROVIDERS", "False") == "True"  # Import everything at startup instead
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", 5))  # Results asked for when searching by title alone
+HINTED_SEARCH_LIMIT = int(os.getenv("HINTED_SEARCH_LIMIT", 3))  # When the artist or album is known too, so few results are needed
+
+
+class LazyProvider:
+    """A provider lookup function that imports its module on the first call.
+
+    If the module can't be imported (e.g. its client library isn't installed), or its unavailable()
+    function gives a reason it can't be used (e.g. Discogs without an access token), the provider is
+    reported as unavailable until restart and every call returns None instead of failing the lookup.
+    """
+
+    def __init__(self, name, module, function):
+        self.name = name
+        self.module = module
+        self.function = function
+        self.error = None
+        self._fetch = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._fetch is not None
+
+    def load(self):
+        """Import the provider module and return its lookup function, or None if it is unavailable."""
+        if self._fetch is None and self.error is None:
+            with self._lock:
+                if self._fetch is None and self.error is None:
+                    try:
+                        module = importlib.import_module(self.module)
+                    except ImportError as e:
+                        print(f"Provider {self.name} is unavailable: {e}")
+                        self.error = str(e)
+                        return None
+                    reason = module.unavailable() if hasattr(module, 'unavailable') else None
+                    if reason:
+                        print(f"Provider {self.name} is unavailable: {reason}")
+                        self.error = reason
+                        return None
+                    self._fetch = getattr(module, self.function)
+        return self._fetch
+
+    def __call__(self, *args):
+        fetch = self.load()
+        return fetch(*args) if fetch else None
+
+
+providers = {name: LazyProvider(name, *PROVIDER_MODULES[name]) for name in ENABLED_PROVIDERS}
+
+
+def search_limit(artist=None, album=None):
+    """How many results to ask a provider for; a search narrowed to an artist or album needs only a few."""
+    return HINTED_SEARCH_LIMIT if artist or album else SEARCH_LIMIT
+
+
+def get_provider(name):
+    """Return the lookup function for an enabled provider, or None if it is disabled."""
+    return providers.get(name)
+
+
+def load_providers():
+    """Import every enabled provider now, e.g. in a server that forks workers after loading the app."""
+    for provider in providers.values():
+        provider.load()
+
+
+def provider_registry_status():
+    """Whether each known provider is enabled, imported, or failed to import."""
+    status = {}
+    for name in PROVIDER_MODULES:
+        provider = providers.get(name)
+        status[name] = {
+            'enabled': provider is not None,
+            'loaded': bool(provider and provider.loaded),
+            'error': provider.error if provider else None,
+        }
+    return status
+
+
+if PRELOAD_PROVIDERS:
+    load_providers()
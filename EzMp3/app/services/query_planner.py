@@ -0,0 +1,214 @@
+import re
+from EzMp3.app.services.metadata_cache import normalize_title
+
+'''
+how to run:
+python -m EzMp3.app.services.query_planner "03 - Queen - Bohemian Rhapsody (Remastered 2011)"
+python -m EzMp3.app.services.query_planner selftest
+
+Turns a file name (and whatever tags the file has) into a structured query: title, artist, album,
+track number, featured artists and version. Providers search on the title, artist and album fields
+instead of the raw file name. When that finds nothing, fallback_queries() gives looser readings of
+the name to try instead.
+'''
+
+# "01 - Title", "1. Title", "01 Title"; a "-" after an unpadded number needs a space, so "1-800-273-8255" stays a title
+TRACK_NUMBER = re.compile(r"^\s*(?:(?:cd|disc)\s*\d+\s*[-.]?\s*)?"
+                          r"(?:(\d{1,3})\s*[.)]\s*|(\d{1,3})\s*-\s+|(0\d{1,2})\s*-\s*|(0\d)\s+)(?=\S)", re.I)
+FEATURING = re.compile(r"\s*[(\[]?\s*\b(?:feat|ft|featuring)\b\.?\s+([^)\]]+?)\s*[)\]]?\s*$", re.I)
+# Bracketed or " - " suffixes naming a version of the recording
+VERSION = re.compile(r"\b(?:remix|mix|edit|version|remaster(?:ed)?|live|acoustic|demo|mono|stereo|instrumental|"
+                     r"radio|extended|unplugged|cover)\b", re.I)
+# A " - " suffix that can't be a title, unlike e.g. "Live Forever"
+VERSION_SUFFIX = re.compile(r"\b(?:remix|mix|edit|version|remaster(?:ed)?|mono|stereo|live (?:at|from|in))\b", re.I)
+NOISE = re.compile(r"\b(?:official|lyrics?|audio|video|visualizer|hq|hd|explicit|clean)\b", re.I)
+BRACKETED = re.compile(r"\s*[(\[]([^)\]]*)[)\]]")
+SEPARATOR = re.compile(r"\s+[-–—]\s+")
+ARTIST_SEPARATORS = re.compile(r"\s*(?:,|&|\band\b|\bx\b|\bvs\.?)\s*", re.I)
+
+
+def clean_name(name):
+    """File-name spelling to plain text: underscores and repeated spaces become single spaces."""
+    return " ".join(name.replace('_', ' ').split())
+
+
+def split_artists(text):
+    return [artist for artist in ARTIST_SEPARATORS.split(text) if artist]
+
+
+def strip_extras(text):
+    """Split "Title (feat. X) [Remix]" into (title, featured artists, version)."""
+    featured, version = [], None
+    for extra in BRACKETED.findall(text):
+        if FEATURING.match(f"({extra})"):
+            featured += split_artists(FEATURING.match(f"({extra})").group(1))
+        elif VERSION.search(extra):
+            version = version or extra.strip()
+        elif not NOISE.search(extra):
+            continue  # Part of the title, e.g. "(I Can't Get No) Satisfaction"
+        text = text.replace(f"({extra})", " ").replace(f"[{extra}]", " ")
+
+    match = FEATURING.search(text)
+    if match:
+        featured += split_artists(match.group(1))
+        text = text[:match.start()]
+    return " ".join(text.split()), featured, version
+
+
+def parse_filename(name):
+    """Parse common file name patterns into a structured query.
+
+    Handles "Artist - Title", "01 Title" / "01 - Title" / "1. Title", "Artist - Album - 03 - Title",
+    "feat."/"ft." credits and "(... Remix)" / " - Live" style version suffixes. A bare leading number
+    only counts as a track number when zero-padded, so titles like "99 Luftballons" survive.
+    readings lists other (title, artist) pairs the name could mean, for fallback_queries().
+    """
+    text = clean_name(name)
+    track_number = None
+    match = TRACK_NUMBER.match(text)
+    if match and match.end() < len(text):
+        track_number = int(next(group for group in match.groups() if group))
+        text = text[match.end():]
+
+    parts = [part for part in SEPARATOR.split(text) if part]
+    version = None
+    # A last part like "Remastered 2011" or "Live at Wembley" names a version, not the title
+    last = BRACKETED.sub("", parts[-1]) if parts else ""
+    if len(parts) > 1 and (VERSION_SUFFIX.search(last) or len(parts) > 2 and VERSION.search(last)):
+        version = parts.pop()
+    # "Artist - Album - 03 - Title": a numeric part in the middle is the track number
+    for index, part in enumerate(parts[:-1]):
+        if part.isdigit() and len(part) <= 3:
+            track_number = track_number or int(part)
+            del parts[index]
+            break
+
+    artist = album = None
+    readings = []
+    if len(parts) >= 3:
+        artist, album, title = parts[0], " - ".join(parts[1:-1]), parts[-1]
+    elif len(parts) == 2:
+        artist, title = parts
+        readings.append((parts[0], parts[1]))  # "Title - Artist"
+    else:
+        title = parts[0] if parts else text
+        if version and len(parts) == 1:
+            readings.append((version, title))  # "Pink Floyd - Live at Pompeii" names a title, not a version
+
+    title, featured, title_version = strip_extras(title)
+    if artist:
+        artist, artist_featured, _ = strip_extras(artist)
+        featured = artist_featured + featured
+    return {
+        'title': title or clean_name(name),
+        'artist': artist or None,
+        'album': album,
+        'track_number': track_number,
+        'featured': featured,
+        'version': version or title_version,
+        'readings': [(strip_extras(title)[0], strip_extras(artist)[0]) for title, artist in readings],
+        'from_tags': [],
+    }
+
+
+def plan_query(song_title, tags=None):
+    """Build the query for a file from its name and existing tags; tag values win over parsed ones.
+
+    from_tags lists the fields (title, artist, album) taken from tags rather than the file name.
+    """
+    query = parse_filename(song_title)
+    tags = tags or {}
+    if tags.get('title'):
+        title, featured, version = strip_extras(tags['title'])
+        query['title'] = title or query['title']
+        query['featured'] = query['featured'] or featured
+        query['version'] = query['version'] or version
+        query['from_tags'].append('title')
+    artist = tags.get('contributing_artists') or tags.get('album_artist')
+    if artist:
+        artist, featured, _ = strip_extras(artist)
+        query['artist'] = artist
+        query['featured'] = query['featured'] or featured
+        query['from_tags'].append('artist')
+    if tags.get('album'):
+        query['album'] = tags['album']
+        query['from_tags'].append('album')
+    return query
+
+
+def fallback_queries(query):
+    """Looser queries to try, in order, when a query finds nothing.
+
+    Fields parsed from the file name may be wrong, so they are dropped first (the title alone), then
+    the name's other readings are tried ("Title - Artist" swapped, "Artist - Live at ..." as a title).
+    Fields from tags are kept in every fallback.
+    """
+    tagged = query.get('from_tags', [])
+    artist = query['artist'] if 'artist' in tagged else None
+    album = query['album'] if 'album' in tagged else None
+    candidates = [(query['title'], artist)]
+    if 'title' not in tagged:
+        candidates += [(title, artist or reading_artist) for title, reading_artist in query.get('readings', [])]
+
+    fallbacks = []
+    seen = {query_key(query)}
+    for title, fallback_artist in candidates:
+        fallback = dict(query, title=title, artist=fallback_artist, album=album)
+        if title and query_key(fallback) not in seen:
+            seen.add(query_key(fallback))
+            fallbacks.append(fallback)
+    return fallbacks
+
+
+def query_key(query):
+    """Files whose queries share this key need only one lookup between them."""
+    return tuple(normalize_title(query[field] or '') for field in ('title', 'artist', 'album'))
+
+
+def selftest():
+    """Check the parser against the file name patterns it is meant to handle."""
+    cases = {
+        "03 - Queen - Bohemian Rhapsody (Remastered 2011)": ("Bohemian Rhapsody", "Queen", None, 3),
+        "01 Yesterday": ("Yesterday", None, None, 1),
+        "1. Yesterday": ("Yesterday", None, None, 1),
+        "99 Luftballons": ("99 Luftballons", None, None, None),
+        "Queen_-_Under_Pressure_(feat._David_Bowie)": ("Under Pressure", "Queen", None, None),
+        "Avicii - Levels (Skrillex Remix)": ("Levels", "Avicii", None, None),
+        "Oasis - Live Forever": ("Live Forever", "Oasis", None, None),
+        "The Beatles - Abbey Road - 07 - Here Comes the Sun": ("Here Comes the Sun", "The Beatles", "Abbey Road", 7),
+        "(I Can't Get No) Satisfaction": ("(I Can't Get No) Satisfaction", None, None, None),
+        "1-800-273-8255": ("1-800-273-8255", None, None, None),
+        "01-Yesterday": ("Yesterday", None, None, 1),
+        "1 - Yesterday": ("Yesterday", None, None, 1),
+    }
+    for name, expected in cases.items():
+        query = parse_filename(name)
+        found = (query['title'], query['artist'], query['album'], query['track_number'])
+        assert found == expected, (name, found)
+    assert parse_filename("Daft Punk - Get Lucky ft. Pharrell Williams & Nile Rodgers")['featured'] == \
+        ["Pharrell Williams", "Nile Rodgers"]
+    query = plan_query("Under Pressure", {'title': "Under Pressure", 'contributing_artists': "Queen", 'album': "Hot Space"})
+    assert (query['artist'], query['album']) == ("Queen", "Hot Space"), query
+
+    fallbacks = [(q['title'], q['artist'], q['album']) for q in fallback_queries(plan_query("Yesterday - The Beatles"))]
+    assert fallbacks == [("The Beatles", None, None), ("Yesterday", "The Beatles", None)], fallbacks
+    fallbacks = [(q['title'], q['artist']) for q in fallback_queries(plan_query("Pink Floyd - Live at Pompeii"))]
+    assert fallbacks == [("Live at Pompeii", "Pink Floyd")], fallbacks
+    # Tag fields stay in every fallback; a tagged title is never swapped for a reading of the name
+    fallbacks = fallback_queries(plan_query("Hot Space - Under Pressure", {'title': "Under Pressure",
+                                                                          'contributing_artists': "Queen"}))
+    assert fallbacks == [], fallbacks
+    query = plan_query("Bowie - Under Pressure", {'album': "Hot Space"})
+    fallbacks = [(q['title'], q['artist'], q['album']) for q in fallback_queries(query)]
+    assert fallbacks == [("Under Pressure", None, "Hot Space"), ("Bowie", "Under Pressure", "Hot Space")], fallbacks
+    print(f"Query planner selftest passed ({len(cases) + 6} cases).")
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    if sys.argv[1:] == ["selftest"]:
+        selftest()
+    else:
+        for name in sys.argv[1:]:
+            print(json.dumps(parse_filename(name), indent=4))
@@ -0,0 +1,207 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Shared by every thread and every process on this machine that points at the same file
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", os.path.join(tempfile.gettempdir(), "ezmp3_rate_limits.db"))
+MAX_WAIT_STEP = 1.0  # Longest single sleep while queued, so penalties set by other processes are picked up
+
+# provider: (requests per second, burst size)
+DEFAULT_LIMITS = {
+    'musicbrainz': (1.0, 1),  # ~1 request per second
+    'discogs': (1.0, 5),  # 60 per minute for authenticated requests
+    'spotify': (10.0, 10),
+    'deezer': (10.0, 10),  # 50 per 5 seconds
+    'lastfm': (5.0, 5),
+    'theaudiodb': (2.0, 2),
+}
+
+
+def load_limits():
+    """Default limits, overridable with <PROVIDER>_RATE_LIMIT (requests/second) and <PROVIDER>_RATE_BURST."""
+    limits = {}
+    for provider, (rate, burst) in DEFAULT_LIMITS.items():
+        rate = float(os.getenv(f"{provider.upper()}_RATE_LIMIT", rate))
+        burst = int(os.getenv(f"{provider.upper()}_RATE_BURST", burst))
+        limits[provider] = (rate, max(burst, 1))
+    return limits
+
+
+def parse_retry_after(value):
+    """Turn a Retry-After header (seconds or an HTTP date) into a number of seconds."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a provider's token would not be free before the caller's deadline."""
+
+
+class RateLimiter:
+    """Token bucket per provider, kept in a local SQLite file so threads and processes share it.
+
+    acquire() blocks until a token is free, so calls queue up behind the limit, but not past the
+    deadline a caller has set with deadline().
+    """
+
+    def __init__(self, path=RATE_LIMIT_STORE, limits=None):
+        self.path = path
+        self.limits = limits or load_limits()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._waiting = dict.fromkeys(self.limits, 0)
+        self.stats = {provider: {'acquired': 0, 'wait_seconds': 0.0, 'throttled': 0, 'timed_out': 0}
+                      for provider in self.limits}
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Every token is a commit; losing the last few to a crash only refills the buckets early
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    provider TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    blocked_until REAL NOT NULL
+                )
+            """)
+            self._local.conn = conn
+        return conn
+
+    def _update_bucket(self, provider, change):
+        """Refill the provider's bucket, let change(tokens, blocked_until, now) adjust it, and save it atomically."""
+        rate, burst = self.limits[provider]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated_at, blocked_until FROM buckets WHERE provider = ?", (provider,)
+            ).fetchone()
+            tokens, updated_at, blocked_until = row if row else (burst, now, 0.0)
+            tokens = min(burst, tokens + max(now - updated_at, 0.0) * rate)
+            tokens, blocked_until, result = change(tokens, blocked_until, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (provider, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?)",
+                (provider, tokens, now, blocked_until)
+            )
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _try_acquire(self, provider):
+        """Take a token if one is free; otherwise return how long to wait before trying again."""
+        rate, _ = self.limits[provider]
+
+        def take(tokens, blocked_until, now):
+            if now < blocked_until:
+                return tokens, blocked_until, blocked_until - now
+            if tokens >= 1:
+                return tokens - 1, blocked_until, 0.0
+            return tokens, blocked_until, (1 - tokens) / rate
+
+        return self._update_bucket(provider, take)
+
+    @contextmanager
+    def deadline(self, seconds):
+        """Bound every acquire() on this thread to `seconds` from now, e.g. for one provider lookup."""
+        previous = getattr(self._local, 'deadline', None)
+        self._local.deadline = time.monotonic() + seconds
+        try:
+            yield
+        finally:
+            self._local.deadline = previous
+
+    def acquire(self, provider):
+        """Block until the provider may be called again.
+
+        Raises RateLimitTimeout, without taking a token, when the wait would run past the thread's deadline.
+        """
+        if provider not in self.limits:
+            return
+        deadline = getattr(self._local, 'deadline', None)
+        with self._lock:
+            self._waiting[provider] += 1
+        start = time.monotonic()
+        acquired = False
+        try:
+            while (wait := self._try_acquire(provider)) > 0:
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    raise RateLimitTimeout(f"No {provider} rate limit token before the lookup's deadline")
+                time.sleep(min(wait, MAX_WAIT_STEP))
+            acquired = True
+        finally:
+            with self._lock:
+                self._waiting[provider] -= 1
+                self.stats[provider]['acquired' if acquired else 'timed_out'] += 1
+                self.stats[provider]['wait_seconds'] += time.monotonic() - start
+
+    def penalize(self, provider, seconds):
+        """Hold every caller of a provider back for the given number of seconds."""
+        if provider not in self.limits:
+            return
+        self._update_bucket(provider, lambda tokens, blocked_until, now:
+                            (tokens, max(blocked_until, now + seconds), None))
+        with self._lock:
+            self.stats[provider]['throttled'] += 1
+
+    def drain(self, provider):
+        """Empty a provider's bucket, e.g. when it reports no remaining quota."""
+        if provider in self.limits:
+            self._update_bucket(provider, lambda tokens, blocked_until, now: (min(tokens, 0.0), blocked_until, None))
+
+    def observe_response(self, provider, status_code, headers):
+        """Adjust the bucket from a provider's response: Retry-After on 429/503, and remaining-quota headers."""
+        if status_code in (429, 503):
+            retry_after = parse_retry_after(headers.get('Retry-After'))
+            rate, _ = self.limits.get(provider, (1.0, 1))
+            self.penalize(provider, retry_after if retry_after is not None else 1.0 / rate)
+            return
+
+        remaining = headers.get('X-Discogs-Ratelimit-Remaining') or headers.get('X-RateLimit-Remaining')
+        if remaining is not None and remaining.strip() == '0':
+            self.drain(provider)
+
+    def queue_depth(self):
+        """Number of callers in this process currently waiting on each provider."""
+        with self._lock:
+            return dict(self._waiting)
+
+    def get_stats(self):
+        """Limits, queue depth and wait totals per provider."""
+        with self._lock:
+            return {
+                provider: {
+                    'rate_per_second': rate,
+                    'burst': burst,
+                    'queue_depth': self._waiting[provider],
+                    'acquired': self.stats[provider]['acquired'],
+                    'wait_seconds': round(self.stats[provider]['wait_seconds'], 3),
+                    'throttled': self.stats[provider]['throttled'],
+                    'timed_out': self.stats[provider]['timed_out'],
+                }
+                for provider, (rate, burst) in self.limits.items()
+            }
+
+
+rate_limiter = RateLimiter()
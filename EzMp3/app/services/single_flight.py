@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key.
+
+    The first caller for a key runs the call; callers arriving while it is in flight wait for the
+    same result (or exception) instead of making their own call. Nothing is kept once the call
+    finishes, so this is not a cache.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # key -> Future of the call in flight
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'coalesced': 0}
+
+    def do(self, key, fn, *args):
+        """Return fn(*args), sharing the call with any caller already running it for this key."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.stats['calls'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self):
+        """Number of keys currently being looked up."""
+        with self._lock:
+            return len(self._calls)
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name):
+    """Return the shared single-flight group with this name, creating it on first use."""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight(name)
+        return group
+
+
+def single_flight_stats():
+    """Calls made and calls coalesced per group."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: {**group.stats, 'in_flight': group.in_flight()} for group in groups}
@@ -1,61 +1,197 @@
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 import os
+import threading
+from concurrent.futures import Future
 from dotenv import load_dotenv
+from EzMp3.app.services.artist_cache import get_artist, remember_artist, in_batch_mode
+from EzMp3.app.services.http_clients import get_session, HTTP_READ_TIMEOUT
+from EzMp3.app.services.single_flight import get_group
+from EzMp3.app.services.providers import search_limit
 
 
 load_dotenv()
 SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
+# Overridable so the service can be pointed at a local stand-in, e.g. for benchmarks
+SPOTIFY_API_URL = os.getenv('SPOTIFY_API_URL', "https://api.spotify.com/v1/")
+SPOTIFY_TOKEN_URL = os.getenv('SPOTIFY_TOKEN_URL', "https://accounts.spotify.com/api/token")
+# In batch mode, artist ids asked for within this many seconds share one several-artists call
+SPOTIFY_ARTIST_BATCH_WINDOW = float(os.getenv('SPOTIFY_ARTIST_BATCH_WINDOW', 0.05))
+SPOTIFY_ARTIST_BATCH_SIZE = 50  # The most ids the several-artists endpoint takes
+
+_spotify_client = None
+_spotify_client_lock = threading.Lock()
+artist_lookups = get_group('spotify_artists')
 
 
 def get_spotify_client():
-    """Create a Spotify client with proper authentication."""
+    """Return the shared Spotify client, creating it with proper authentication on first use."""
+    global _spotify_client
     if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
         print("Spotify credentials are missing!")
         return None
 
-    # Authenticate using the Client Credentials Flow
-    client_credentials_manager = SpotifyClientCredentials(
-        client_id=SPOTIFY_CLIENT_ID,
-        client_secret=SPOTIFY_CLIENT_SECRET
-    )
-    return spotipy.Spotify(client_credentials_manager=client_credentials_manager)
-
-
-def fetch_spotify_metadata(track):
-    """Fetch metadata from Spotify using only track name, prioritize original studio album."""
-    try:
-        sp = get_spotify_client()
-        if not sp:
-            return None
-
-        result = sp.search(q=f"track:{track}", type="track", limit=10)  # Fetch up to 10 results
-        earliest_album = None
-        selected_track = None
-        for track_info in result['tracks']['items']:
-            album_info = track_info['album']
-            # Filter for non-compilation studio albums and prioritize the earliest release
-            if album_info['album_type'] == 'album' and "compilation" not in album_info['name'].lower() and "best of" not in album_info['name'].lower():
-                if earliest_album is None or album_info['release_date'] < earliest_album['release_date']:
-                    earliest_album = album_info
-                    selected_track = track_info
-
-        if earliest_album and selected_track:
-            # Fetch genres for the primary artist
-            artist_info = sp.artist(selected_track['artists'][0]['id'])
-            genres = artist_info['genres'] if artist_info and artist_info.get('genres') else []
-
-            return {
-                'title': selected_track['name'],
-                'artist': selected_track['artists'][0]['name'],
-                'contributing_artists': [artist['name'] for artist in selected_track['artists']],
-                'album': earliest_album['name'],
-                'album_artist': earliest_album['artists'][0]['name'],
-                'year': earliest_album['release_date'][:4] if earliest_album['release_date'] else None,
-                'popularity': selected_track['popularity'],
-                'genres': genres
-            }
-    except Exception as e:
-        print(f"Spotify error: {e}")
+    if _spotify_client is None:
+        with _spotify_client_lock:
+            if _spotify_client is None:
+                session = get_session('spotify')
+                # Authenticate using the Client Credentials Flow; the token is cached and refreshed by the manager
+                client_credentials_manager = SpotifyClientCredentials(
+                    client_id=SPOTIFY_CLIENT_ID,
+                    client_secret=SPOTIFY_CLIENT_SECRET,
+                    requests_session=session,
+                    requests_timeout=HTTP_READ_TIMEOUT
+                )
+                client_credentials_manager.OAUTH_TOKEN_URL = SPOTIFY_TOKEN_URL
+                client = spotipy.Spotify(client_credentials_manager=client_credentials_manager,
+                                         requests_session=session,
+                                         requests_timeout=HTTP_READ_TIMEOUT)
+                client.prefix = SPOTIFY_API_URL
+                _spotify_client = client
+    return _spotify_client
+
+
+class ArtistBatcher:
+    """Gathers the artist ids that concurrent lookups ask for and fetches them with one several-artists call.
+
+    The first id starts a short window; the ids that arrive within it, up to 50, share the call.
+    Each caller waits for its own artist (or None if Spotify doesn't know the id).
+    """
+
+    def __init__(self, window, size=SPOTIFY_ARTIST_BATCH_SIZE):
+        self.window = window
+        self.size = size
+        self._pending = {}  # artist id -> Future of the artist
+        self._timer = None
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'artists': 0}
+
+    def get(self, artist_id):
+        with self._lock:
+            future = self._pending.get(artist_id)
+            if future is None:
+                future = self._pending[artist_id] = Future()
+            full = len(self._pending) >= self.size
+            if not full and self._timer is None:
+                self._start_timer()
+        if full:
+            self.flush()
+        return future.result()
+
+    def _start_timer(self):
+        self._timer = threading.Timer(self.window, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Fetch up to `size` of the waiting ids now."""
+        with self._lock:
+            ids = list(self._pending)[:self.size]
+            batch = {artist_id: self._pending.pop(artist_id) for artist_id in ids}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending:
+                self._start_timer()
+        if not batch:
+            return
+
+        try:
+            found = get_spotify_client().artists(ids)['artists']
+        except BaseException as e:
+            for future in batch.values():
+                future.set_exception(e)
+            return
+        self.stats['calls'] += 1
+        self.stats['artists'] += len(ids)
+        # Artists come back in the order asked for, with null for unknown ids
+        found = dict(zip(ids, found))
+        for artist_id, future in batch.items():
+            future.set_result(found.get(artist_id))
+
+
+artist_batcher = ArtistBatcher(SPOTIFY_ARTIST_BATCH_WINDOW)
+
+
+def fetch_artist(artist_id):
+    """Look an artist up and cache it; it is cached before its call stops being in flight."""
+    entry = get_artist(provider='spotify', artist_id=artist_id)
+    if entry and entry['genres'] is not None:
+        return entry
+    artist = artist_batcher.get(artist_id) if in_batch_mode() else get_spotify_client().artist(artist_id)
+    if not artist:
         return None
+    return remember_artist(artist['name'], 'spotify', artist_id, genres=artist.get('genres') or [])
+
+
+def artist_genres(artist_id):
+    """Genres of an artist, from the artist cache when possible, so an album's tracks cost one lookup.
+
+    Only the Spotify id is trusted here: another artist may share the name.
+    """
+    entry = get_artist(provider='spotify', artist_id=artist_id)
+    if not entry or entry['genres'] is None:
+        entry = artist_lookups.do(artist_id, fetch_artist, artist_id)
+    return entry['genres'] if entry else []
+
+
+def field_query(**fields):
+    """Spotify field filters, e.g. track:"Bohemian Rhapsody" artist:"Queen"; quotes keep multi-word values together."""
+    filters = []
+    for field, value in fields.items():
+        if value:
+            value = value.replace('"', '')
+            filters.append(f'{field}:"{value}"')
+    return " ".join(filters)
+
+
+def is_studio_album(album_info):
+    name = album_info['name'].lower()
+    return album_info['album_type'] == 'album' and "compilation" not in name and "best of" not in name
+
+
+def fetch_spotify_metadata(track, artist=None, album=None):
+    """Fetch metadata from Spotify by track name (and artist and album, when known), prioritize original studio album."""
+    sp = get_spotify_client()
+    if not sp:
+        return None
+
+    query = field_query(track=track, artist=artist, album=album)
+    result = sp.search(q=query, type="track", limit=search_limit(artist, album))
+    earliest_album = None
+    selected_track = None
+    for track_info in result['tracks']['items']:
+        album_info = track_info['album']
+        # Filter for non-compilation studio albums and prioritize the earliest release
+        if is_studio_album(album_info):
+            if earliest_album is None or album_info['release_date'] < earliest_album['release_date']:
+                earliest_album = album_info
+                selected_track = track_info
+
+    # All of the search's hits; the ones on compilations count for less in the consensus
+    candidates = [{
+        'title': item['name'],
+        'artist': item['artists'][0]['name'] if item['artists'] else None,
+        'album': item['album']['name'],
+        'year': item['album']['release_date'][:4] if item['album']['release_date'] else None,
+        'compilation': not is_studio_album(item['album']),
+    } for item in result['tracks']['items']]
+
+    if earliest_album and selected_track:
+        # Genres belong to the primary artist
+        genres = artist_genres(selected_track['artists'][0]['id'])
+
+        return {
+            'title': selected_track['name'],
+            'artist': selected_track['artists'][0]['name'],
+            'contributing_artists': [artist['name'] for artist in selected_track['artists']],
+            'album': earliest_album['name'],
+            'album_artist': earliest_album['artists'][0]['name'],
+            'year': earliest_album['release_date'][:4] if earliest_album['release_date'] else None,
+            'popularity': selected_track['popularity'],
+            'genres': genres,
+            'candidates': candidates
+        }
+    # Without a studio album there is no pick, but the hits still count towards the consensus
+    return {'candidates': candidates} if candidates else None
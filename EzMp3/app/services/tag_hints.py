@@ -0,0 +1,59 @@
+import os
+import threading
+from dotenv import load_dotenv
+from rapidfuzz import fuzz
+from EzMp3.app.services.metadata_cache import normalize_title
+from EzMp3.app.services.query_planner import plan_query
+
+load_dotenv()
+
+TRUST_COMPLETE_TAGS = os.getenv("TRUST_COMPLETE_TAGS", "True") == "True"  # Keep complete tags instead of looking up
+TAG_TITLE_MATCH = int(os.getenv("TAG_TITLE_MATCH", 80))  # How closely (0-100) the title tag must match the file name
+COMPLETE_FIELDS = ('title', 'contributing_artists', 'album', 'year', 'genres')
+
+_stats = {'complete': 0, 'hinted': 0, 'plain': 0}
+_stats_lock = threading.Lock()
+
+
+def count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def tag_stats():
+    """Files answered from their own tags (lookups avoided), looked up with a known artist, or by title alone."""
+    with _stats_lock:
+        return {'lookups_avoided': _stats['complete'], 'hinted_lookups': _stats['hinted'],
+                'plain_lookups': _stats['plain']}
+
+
+def title_matches(tag_title, song_title):
+    """Whether the title tag plausibly belongs to the file, judging by its name."""
+    return fuzz.token_set_ratio(normalize_title(tag_title), normalize_title(song_title)) >= TAG_TITLE_MATCH
+
+
+def is_complete(tags):
+    """Whether every field we would write is already tagged, with a four digit year."""
+    return (all(tags.get(field) for field in COMPLETE_FIELDS)
+            and tags['year'].isdigit() and len(tags['year']) == 4)
+
+
+def plan_from_tags(tags, song_title):
+    """Decide how to resolve a file from the tags it already has and its file name.
+
+    Returns (metadata, query). metadata is set when the tags are complete and their title matches the
+    file name, and then no lookup is needed at all. Otherwise query is what to look up (see
+    query_planner.plan_query): parsed from the file name, with a title tag that matches the file name
+    replacing the parsed title, and artist and album tags narrowing every provider search.
+    """
+    tags = tags or {}
+    consistent = bool(tags.get('title')) and title_matches(tags['title'], song_title)
+    if TRUST_COMPLETE_TAGS and consistent and is_complete(tags):
+        count('complete')
+        metadata = dict(tags)
+        metadata['album_artist'] = metadata.get('album_artist') or metadata['contributing_artists']
+        return metadata, plan_query(song_title, tags)
+
+    query = plan_query(song_title, tags if consistent else {k: v for k, v in tags.items() if k != 'title'})
+    count('hinted' if query['artist'] else 'plain')
+    return None, query
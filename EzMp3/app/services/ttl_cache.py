@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """An in-process cache whose entries expire after `ttl` seconds.
+
+    Past `maxsize` entries the least recently used one is evicted. Lookups that found nothing can be
+    cached too (put(key, None)), so get() returns (found, value) to tell them from misses.
+    """
+
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        """Return (found, value); expired entries count as misses."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return True, entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def get_many(self, keys):
+        """Return ({key: value} for the cached keys, [keys that are missing])."""
+        found, missing = {}, []
+        for key in dict.fromkeys(keys):
+            hit, value = self.get(key)
+            if hit:
+                found[key] = value
+            else:
+                missing.append(key)
+        return found, missing
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, maxsize, ttl):
+    """Return the shared cache with this name, creating it on first use."""
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = TTLCache(name, maxsize, ttl)
+        return cache
+
+
+def ttl_cache_stats():
+    """Hits, misses, evictions and size per cache."""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: {**cache.stats, 'size': cache.size()} for cache in caches}
@@ -0,0 +1,215 @@
+import argparse
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from EzMp3.app.services.ai_services import get_music_metadata_with_sources
+from EzMp3.app.services.artist_cache import batch_mode
+from EzMp3.app.services.query_planner import fallback_queries
+from EzMp3.app.services.tag_hints import plan_from_tags
+from EzMp3.app.utils.music_tag_editor import change_mp3_metadata, read_mp3_tags
+from EzMp3.app.utils.mp3_name import iter_mp3_entries
+from EzMp3.app.utils.library_manifest import LibraryManifest
+
+'''
+how to run:
+python -m EzMp3.app.utils.bulk_tagger /path/to/library --lookup-workers 16 --tag-workers 4
+
+Progress is kept in a manifest (default: <library>/.ezmp3_manifest.db), so re-running only
+processes new or modified files and an interrupted run resumes where it stopped.
+'''
+
+load_dotenv()
+
+LOOKUP_WORKERS = int(os.getenv("BULK_LOOKUP_WORKERS", 16))
+TAG_WORKERS = int(os.getenv("BULK_TAG_WORKERS", os.cpu_count() or 2))
+MANIFEST_NAME = ".ezmp3_manifest.db"
+PROGRESS_INTERVAL = 1.0  # Seconds between progress lines
+
+
+def ignore_sigint():
+    """Let the parent process handle Ctrl-C; tag workers just finish their current file."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def write_tags(file_path, metadata):
+    """Write resolved metadata to one file and return the bytes written. Runs inside a tag worker process."""
+    return change_mp3_metadata(
+        file_path,
+        metadata.get('title'),
+        metadata.get('contributing_artists'),
+        metadata.get('album_artist'),
+        metadata.get('album'),
+        metadata.get('year'),
+        ', '.join(metadata.get('genres', []))
+    )
+
+
+def lookup_file(file_path):
+    """Resolve metadata for one file and return (metadata, from_tags, unanswered).
+
+    Files without complete tags are looked up by title, narrowed by the artist and album from their
+    tags or parsed from their name; when that finds nothing, the query's fallbacks are tried in turn.
+    from_tags says the metadata is the file's own complete tags. unanswered lists the providers that
+    failed, timed out or were skipped when nothing was found, in which case the miss is worth retrying.
+    """
+    song_title = os.path.splitext(os.path.basename(file_path))[0]
+    tag_metadata, query = plan_from_tags(read_mp3_tags(file_path), song_title)
+    if tag_metadata is not None:
+        return tag_metadata, True, []
+    unanswered = set()
+    for attempt in [query, *fallback_queries(query)]:
+        metadata, raw_metadata = get_music_metadata_with_sources(attempt['title'], attempt['artist'], attempt['album'])
+        if metadata:
+            return metadata, False, []
+        unanswered.update(raw_metadata.get('unanswered') or [])
+    return None, False, sorted(unanswered)
+
+
+class Progress:
+    """Counts processed files and prints throughput at a fixed interval."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.last_report = self.start
+        self.found = 0
+        self.skipped = 0
+        self.already_tagged = 0
+        self.tagged = 0
+        self.not_found = 0
+        self.failed = 0
+        self.bytes_written = 0
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        done = self.already_tagged + self.tagged + self.not_found + self.failed
+        rate = done / (now - self.start) if now > self.start else 0.0
+        sys.stderr.write(f"\r{done}/{self.found} files, {self.skipped} unchanged, {self.already_tagged} already "
+                         f"tagged, {self.tagged} tagged, "
+                         f"{self.not_found} no metadata, {self.failed} failed, {rate:.1f} files/s")
+        sys.stderr.flush()
+
+
+def bulk_tag(directory, lookup_workers=LOOKUP_WORKERS, tag_workers=TAG_WORKERS, max_in_flight=None,
+             manifest=None):
+    """Stream MP3 paths into the lookup and tag pools, keeping a bounded number of files in flight.
+
+    When a LibraryManifest is given, unchanged files that were already processed are skipped and
+    every outcome is recorded in it.
+    """
+    max_in_flight = max_in_flight or lookup_workers * 4
+    progress = Progress()
+    lookup_pool = ThreadPoolExecutor(max_workers=lookup_workers, thread_name_prefix="lookup")
+    tag_pool = ProcessPoolExecutor(max_workers=tag_workers, initializer=ignore_sigint)
+    in_flight = {}  # future -> (stage, file path, resolved metadata)
+
+    def record(file_path, status, metadata=None):
+        if manifest is not None:
+            try:
+                manifest.record(file_path, status, metadata)
+            except OSError as e:
+                print(f"\nCould not record '{file_path}' in manifest: {e}", file=sys.stderr)
+
+    def drain(return_when):
+        done, _ = wait(in_flight, return_when=return_when)
+        for future in done:
+            stage, file_path, metadata = in_flight.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"\nFailed to {stage} '{file_path}': {e}", file=sys.stderr)
+                progress.failed += 1
+                record(file_path, 'failed')
+                continue
+
+            if stage == 'look up':
+                result, from_tags, unanswered = result
+                if from_tags:
+                    # Complete tags are kept as they are: no lookup was made and nothing needs writing
+                    progress.already_tagged += 1
+                    record(file_path, 'tagged', result)
+                elif result:
+                    in_flight[tag_pool.submit(write_tags, file_path, result)] = ('tag', file_path, result)
+                elif unanswered:
+                    # Not found only because providers didn't answer: 'failed' is retried on the next scan
+                    progress.failed += 1
+                    record(file_path, 'failed')
+                else:
+                    progress.not_found += 1
+                    record(file_path, 'no_metadata')
+            else:
+                progress.tagged += 1
+                progress.bytes_written += result or 0
+                record(file_path, 'tagged', metadata)
+        progress.report()
+
+    interrupted = False
+    try:
+        # Artist genres for concurrent lookups are fetched with bulk calls for the whole run
+        with batch_mode():
+            for entry in iter_mp3_entries(directory):
+                progress.found += 1
+                if manifest is not None and manifest.is_unchanged(entry):
+                    progress.skipped += 1
+                    progress.report()
+                    continue
+                in_flight[lookup_pool.submit(lookup_file, entry.path)] = ('look up', entry.path, None)
+                while len(in_flight) >= max_in_flight:
+                    drain(FIRST_COMPLETED)
+            while in_flight:
+                drain(FIRST_COMPLETED)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\nInterrupted, waiting for running files to finish...", file=sys.stderr)
+    finally:
+        lookup_pool.shutdown(wait=True, cancel_futures=True)
+        tag_pool.shutdown(wait=True, cancel_futures=True)
+        # Record files whose tag write finished while we were shutting down
+        for future, (stage, file_path, metadata) in in_flight.items():
+            if stage == 'tag' and future.done() and not future.cancelled() and future.exception() is None:
+                progress.tagged += 1
+                progress.bytes_written += future.result() or 0
+                record(file_path, 'tagged', metadata)
+        if manifest is not None:
+            manifest.commit()
+
+    progress.report(force=True)
+    print(file=sys.stderr)
+    return progress, interrupted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up and tag every MP3 file in a music library.")
+    parser.add_argument("directory", nargs="?", default=os.getenv("MP3_DIR"), help="Library root (default: MP3_DIR)")
+    parser.add_argument("--lookup-workers", type=int, default=LOOKUP_WORKERS, help="Threads for metadata lookups")
+    parser.add_argument("--tag-workers", type=int, default=TAG_WORKERS, help="Processes for tag writes")
+    parser.add_argument("--manifest", help=f"Manifest path (default: <directory>/{MANIFEST_NAME})")
+    parser.add_argument("--no-manifest", action="store_true", help="Process every file and keep no manifest")
+    args = parser.parse_args(argv)
+
+    if not args.directory or not os.path.isdir(args.directory):
+        parser.error(f"Directory does not exist: {args.directory}")
+
+    manifest = None
+    if not args.no_manifest:
+        manifest = LibraryManifest(args.manifest or os.path.join(args.directory, MANIFEST_NAME))
+
+    try:
+        progress, interrupted = bulk_tag(args.directory, args.lookup_workers, args.tag_workers, manifest=manifest)
+    finally:
+        if manifest is not None:
+            manifest.close()
+    elapsed = time.monotonic() - progress.start
+    print(f"Tagged {progress.tagged} of {progress.found} files in {elapsed:.1f}s "
+          f"({progress.skipped} unchanged files skipped, {progress.already_tagged} already fully tagged, "
+          f"{progress.bytes_written} bytes written).")
+    return 130 if interrupted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import json
+import os
+import sqlite3
+import time
+from EzMp3.app.utils.mp3_hashing import tag_hash
+
+# Files in these states are skipped on the next scan as long as their size and mtime are unchanged
+FINISHED_STATES = ('tagged', 'no_metadata')  # 'failed' (including lookups providers never answered) is retried
+COMMIT_EVERY = 200  # Records per transaction; an interrupted run loses at most this many results
+
+
+class LibraryManifest:
+    """SQLite record of every library file's size, mtime, tag hash and last resolved metadata."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                tag_hash TEXT,
+                metadata TEXT,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._pending_writes = 0
+
+        # One query up front so a rescan only costs a stat() and a dict lookup per file
+        self._known = {
+            path: (size, mtime_ns, status)
+            for path, size, mtime_ns, status in self._conn.execute("SELECT path, size, mtime_ns, status FROM files")
+        }
+
+    def is_unchanged(self, entry):
+        """Whether a scanned os.DirEntry was already processed and has not changed since."""
+        known = self._known.get(entry.path)
+        if known is None or known[2] not in FINISHED_STATES:
+            return False
+        stat = entry.stat()
+        return known[0] == stat.st_size and known[1] == stat.st_mtime_ns
+
+    def record(self, file_path, status, metadata=None):
+        """Store the outcome for a file, using its size and mtime after any tag write."""
+        stat = os.stat(file_path)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, tag_hash, metadata, status, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (file_path, stat.st_size, stat.st_mtime_ns, tag_hash(file_path),
+             json.dumps(metadata) if metadata is not None else None, status, time.time())
+        )
+        self._known[file_path] = (stat.st_size, stat.st_mtime_ns, status)
+        self._pending_writes += 1
+        if self._pending_writes >= COMMIT_EVERY:
+            self.commit()
+
+    def get_metadata(self, file_path):
+        """Return the last resolved metadata for a file, if any."""
+        row = self._conn.execute("SELECT metadata FROM files WHERE path = ?", (file_path,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def commit(self):
+        self._conn.commit()
+        self._pending_writes = 0
+
+    def close(self):
+        self.commit()
+        self._conn.close()
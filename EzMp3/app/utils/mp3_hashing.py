@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+ID3V2_HEADER_SIZE = 10
+ID3V1_SIZE = 128
+
+
+def id3v2_tag_size(header):
+    """Return the total size of the ID3v2 tag described by the first 10 bytes of a file, or 0 if there is none."""
+    if len(header) < ID3V2_HEADER_SIZE or header[:3] != b'ID3':
+        return 0
+    # The tag size is stored as a 28-bit "syncsafe" integer (7 bits per byte)
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    footer = ID3V2_HEADER_SIZE if header[5] & 0x10 else 0
+    return ID3V2_HEADER_SIZE + size + footer
+
+
+def tag_hash(file_path):
+    """Hash the ID3v2 and ID3v1 tag bytes of a file, without reading the audio in between."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        header = f.read(ID3V2_HEADER_SIZE)
+        size = id3v2_tag_size(header)
+        if size:
+            digest.update(header)
+            digest.update(f.read(size - ID3V2_HEADER_SIZE))
+
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size - size >= ID3V1_SIZE:
+            f.seek(file_size - ID3V1_SIZE)
+            trailer = f.read(ID3V1_SIZE)
+            if trailer[:3] == b'TAG':
+                digest.update(trailer)
+    return digest.hexdigest()
+
+
+class AudioHasher:
+    """Incrementally hash an MP3's audio payload, leaving out a leading ID3v2 and a trailing ID3v1 tag.
+
+    Feed it the file in chunks with update(); the result does not change when only the tags do.
+    """
+
+    def __init__(self):
+        self._digest = hashlib.blake2b(digest_size=16)
+        self._head = b''
+        self._skip = None  # ID3v2 bytes still to skip, None until the header has been seen
+        self._tail = b''  # Last bytes seen, held back in case they are an ID3v1 tag
+
+    def update(self, chunk):
+        if self._skip is None:
+            self._head += chunk
+            if len(self._head) < ID3V2_HEADER_SIZE:
+                return
+            chunk, self._head = self._head, b''
+            self._skip = id3v2_tag_size(chunk)
+
+        if self._skip:
+            skipped = min(self._skip, len(chunk))
+            chunk = chunk[skipped:]
+            self._skip -= skipped
+
+        data = self._tail + chunk
+        self._digest.update(data[:-ID3V1_SIZE])
+        self._tail = data[-ID3V1_SIZE:]
+
+    def hexdigest(self):
+        digest = self._digest.copy()
+        # Files too short to carry an ID3v2 header are all audio
+        digest.update(self._head)
+        if not (len(self._tail) == ID3V1_SIZE and self._tail[:3] == b'TAG'):
+            digest.update(self._tail)
+        return digest.hexdigest()
+
+
+def audio_hash(file_path, chunk_size=1 << 16):
+    """Hash the audio payload of a file on disk, ignoring its tags."""
+    hasher = AudioHasher()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -5,10 +5,31 @@ from dotenv import load_dotenv
 load_dotenv()
 MP3_PATH = os.getenv("MP3_DIR")
 
-if not os.path.exists(MP3_PATH):
+if MP3_PATH and not os.path.exists(MP3_PATH):
     print("Directory does not exist:", MP3_PATH)
 
 
+def iter_mp3_entries(directory):
+    """Lazily yield os.DirEntry objects for MP3 files under the directory, without building a list."""
+    stack = [directory]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.mp3') and entry.is_file():
+                        yield entry
+        except OSError as e:
+            print(f"Skipping unreadable directory: {e}")
+
+
+def iter_mp3_files(directory):
+    """Lazily yield the paths of MP3 files under the directory."""
+    for entry in iter_mp3_entries(directory):
+        yield entry.path
+
+
 def find_mp3_files(directory):
     """Searches the specified directory and subdirectories for MP3 files and returns a list of file paths."""
     mp3_files = []
@@ -27,15 +48,14 @@ def extract_mp3_name(mp3_path=None):
     """Extracts the name of the first MP3 file found in the specified path or returns None if no MP3 files are found."""
     # Use the provided path or fall back to the environment variable
     directory_to_search = mp3_path if mp3_path else MP3_PATH
-    mp3_files = find_mp3_files(directory_to_search)
 
-    if not mp3_files:
+    # Get the full path of the first MP3 file; no need to walk the rest of the tree
+    full_mp3_path = next(iter_mp3_files(directory_to_search), None)
+
+    if not full_mp3_path:
         print("No MP3 files found in the specified directory.")
         return None
 
-    # Get the full path of the first MP3 file
-    full_mp3_path = mp3_files[0]
-
     # Extract the base name (file name with extension)
     base_name = os.path.basename(full_mp3_path)
 
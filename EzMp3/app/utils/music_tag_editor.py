@@ -1,54 +1,114 @@
 import os
-from mutagen.mp3 import MP3
 from mutagen.id3 import ID3, ID3NoHeaderError, TIT2, TPE1, TPE2, TALB, TYER, TCON
+from mutagen import MutagenError
 import logging
-from app.utils.mp3_name import extract_mp3_name  # Importing the function to get the MP3 name
+from EzMp3.app.utils.mp3_name import extract_mp3_name  # Importing the function to get the MP3 name
+from EzMp3.app.utils.mp3_hashing import id3v2_tag_size, ID3V2_HEADER_SIZE
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
+# Padding reserved when a tag has to grow, so that later edits fit in place
+TAG_PADDING = int(os.getenv("ID3_PADDING", 4096))
+
+
+def keep_padding(info):
+    """Reuse whatever padding the tag already has; only reserve TAG_PADDING when the tag must grow."""
+    return info.padding if info.padding >= 0 else TAG_PADDING
+
+
+def read_tag_size(file_path):
+    """Return the size of the file's ID3v2 tag in bytes, or 0 if it has none."""
+    with open(file_path, 'rb') as f:
+        return id3v2_tag_size(f.read(ID3V2_HEADER_SIZE))
+
+
+def frame_text(tags, frame_id):
+    """First non-empty text value of a frame, or None."""
+    frame = tags.get(frame_id)
+    if frame is None:
+        return None
+    values = [str(value).strip() for value in frame.text if str(value).strip()]
+    return values[0] if values else None
+
+
+def read_mp3_tags(file_path):
+    """Read the title, artist, album artist, album, year and genres already tagged in a file.
+
+    Only the ID3 tag is read. Missing frames are None (genres an empty list); a file without a tag,
+    or with an unreadable one, gives an empty dict.
+    """
+    try:
+        tags = ID3(file_path)
+    except ID3NoHeaderError:
+        return {}
+    except MutagenError as e:
+        logging.warning(f"Could not read the tags of '{file_path}': {e}")
+        return {}
+
+    # mutagen upgrades ID3v2.3 TYER frames to TDRC when it loads them
+    year = frame_text(tags, "TDRC") or frame_text(tags, "TYER")
+    genres = []
+    if "TCON" in tags:
+        genres = [genre.strip() for value in tags["TCON"].genres for genre in value.split(',') if genre.strip()]
+    return {
+        'title': frame_text(tags, "TIT2"),
+        'contributing_artists': frame_text(tags, "TPE1"),
+        'album_artist': frame_text(tags, "TPE2"),
+        'album': frame_text(tags, "TALB"),
+        'year': year[:4] if year else None,
+        'genres': genres,
+    }
+
 
 def change_mp3_metadata(file_path, new_title, new_contributing_artist, new_album_artist, new_album, new_year,
                         new_genre):
+    """Write the tags to the file and return how many bytes were written, or None on failure.
+
+    Only the ID3 tag is read, never the MPEG frames. When the new tag fits in the existing one
+    (padding included) it is rewritten in place; otherwise the file is rewritten once with
+    TAG_PADDING bytes to spare.
+    """
     # Check if the file exists
     if not os.path.isfile(file_path):
         logging.error(f"File '{file_path}' does not exist.")
-        return
+        return None
 
     try:
-        # Load the MP3 file
-        audio = MP3(file_path, ID3=ID3)
+        old_tag_size = read_tag_size(file_path)
 
-        # Set the ID3 tags
-        if audio.tags is None:
-            audio.add_tags()  # Create tags if they don't exist
+        # Load just the ID3 tag
+        try:
+            tags = ID3(file_path)
+        except ID3NoHeaderError:
+            logging.warning("No ID3 header found. Adding one now.")
+            tags = ID3()
 
         # Update the tags if they already exist or add them if not
-        audio.tags["TIT2"] = TIT2(encoding=3, text=new_title)  # Title
-        audio.tags["TPE1"] = TPE1(encoding=3, text=new_contributing_artist)  # Contributing Artist
-        audio.tags["TPE2"] = TPE2(encoding=3, text=new_album_artist)  # Album Artist
-        audio.tags["TALB"] = TALB(encoding=3, text=new_album)  # Album
-        audio.tags["TYER"] = TYER(encoding=3, text=str(new_year))  # Year
-        audio.tags["TCON"] = TCON(encoding=3, text=new_genre)  # Genre
+        tags["TIT2"] = TIT2(encoding=3, text=new_title)  # Title
+        tags["TPE1"] = TPE1(encoding=3, text=new_contributing_artist)  # Contributing Artist
+        tags["TPE2"] = TPE2(encoding=3, text=new_album_artist)  # Album Artist
+        tags["TALB"] = TALB(encoding=3, text=new_album)  # Album
+        tags["TYER"] = TYER(encoding=3, text=str(new_year))  # Year
+        tags["TCON"] = TCON(encoding=3, text=new_genre)  # Genre
 
         # Save changes
-        audio.save()
-        logging.info(f"Successfully updated '{file_path}' with new metadata.")
+        tags.save(file_path, padding=keep_padding)
 
-    except ID3NoHeaderError:
-        logging.warning("No ID3 header found. Adding one now.")
-        audio.add_tags()
-        audio.tags["TIT2"] = TIT2(encoding=3, text=new_title)
-        audio.tags["TPE1"] = TPE1(encoding=3, text=new_contributing_artist)
-        audio.tags["TPE2"] = TPE2(encoding=3, text=new_album_artist)
-        audio.tags["TALB"] = TALB(encoding=3, text=new_album)
-        audio.tags["TYER"] = TYER(encoding=3, text=str(new_year))
-        audio.tags["TCON"] = TCON(encoding=3, text=new_genre)
-        audio.save()
-        logging.info(f"Successfully added ID3 tags to '{file_path}' with new metadata.")
+        new_tag_size = read_tag_size(file_path)
+        if old_tag_size and new_tag_size == old_tag_size:
+            bytes_written = new_tag_size
+            logging.info(f"Successfully updated '{file_path}' in place ({bytes_written} bytes written).")
+        else:
+            # The audio had to move to make room, so the whole file was rewritten
+            bytes_written = os.path.getsize(file_path)
+            logging.info(f"Successfully updated '{file_path}' with new metadata "
+                         f"({bytes_written} bytes written, tag grew to {new_tag_size} bytes).")
+        return bytes_written
 
     except Exception as e:
         logging.error(f"An error occurred while updating metadata: {e}")
+        return None
 
 
 if __name__ == "__main__":
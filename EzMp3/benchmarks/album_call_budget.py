@@ -0,0 +1,118 @@
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import zipfile
+from mutagen.id3 import ID3, TPE1
+
+'''
+how to run:
+python -m EzMp3.benchmarks.album_call_budget --max-calls 12
+
+Uploads a 12-track album ("01 - Death on Two Legs.mp3" ... in one folder of a zip, some files tagged
+with the artist) through /api/upload/batch against benchmarks/stub_providers.py, once with album mode
+off and once with it on, each in a fresh process so no cache carries over. Reports the provider calls
+each made and whether album, album artist and year came out the same on every file. Exits with
+status 1 when album mode makes more than --max-calls calls or tags the files inconsistently.
+'''
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+EZMP3_DIR = os.path.dirname(BENCHMARK_DIR)
+REPO_DIR = os.path.dirname(EZMP3_DIR)
+TRACKS = ["Death on Two Legs", "Lazing on a Sunday Afternoon", "I'm in Love with My Car", "You're My Best Friend",
+          "'39", "Sweet Lady", "Seaside Rendezvous", "The Prophet's Song", "Love of My Life", "Good Company",
+          "Bohemian Rhapsody", "God Save the Queen"]
+FOLDER = "Queen - A Night at the Opera"
+
+
+def album_archive(seed=0):
+    """A zip holding the album's files in one folder, named "NN - Title.mp3", every other one tagged with the artist."""
+    from EzMp3.benchmarks.corpus import mp3_bytes
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf, tempfile.TemporaryDirectory() as directory:
+        for number, title in enumerate(TRACKS, 1):
+            file_path = os.path.join(directory, "track.mp3")
+            with open(file_path, 'wb') as f:
+                f.write(mp3_bytes(rng, 20))
+            if number % 2:
+                tags = ID3()
+                tags.add(TPE1(encoding=3, text="Queen"))
+                tags.save(file_path)
+            zf.write(file_path, f"{FOLDER}/{number:02d} - {title}.mp3")
+    buffer.seek(0)
+    return buffer
+
+
+def run_upload(album_mode):
+    """Upload the album once in this process and return the provider calls and the resulting tags."""
+    from EzMp3.benchmarks.run_benchmark import configure_environment
+    from EzMp3.benchmarks.stub_providers import StubProviders
+
+    stub = StubProviders().start()
+    try:
+        configure_environment(stub.env(), tempfile.mkdtemp(prefix="ezmp3-album-"), False)
+        from app import create_app
+        client = create_app().test_client()
+        response = client.post("/api/upload/batch", data={'archive': (album_archive(), "album.zip"),
+                                                          'album_mode': str(album_mode)},
+                               content_type="multipart/form-data")
+        body = response.get_json()
+        tags = []
+        for entry in body['files']:
+            if 'download_url' not in entry:
+                tags.append(None)
+                continue
+            with tempfile.NamedTemporaryFile(suffix=".mp3") as f:
+                f.write(client.get(entry['download_url']).get_data())
+                f.flush()
+                id3 = ID3(f.name)
+                tags.append({frame: str(id3.get(frame, '')) for frame in ('TIT2', 'TALB', 'TPE2', 'TDRC')})
+        return {'calls': stub.stats()['providers'], 'albums': body.get('albums', 0), 'tags': tags}
+    finally:
+        stub.stop()
+
+
+def measure(album_mode):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR, EZMP3_DIR, os.environ.get('PYTHONPATH', '')]))
+    output = subprocess.run([sys.executable, "-m", "EzMp3.benchmarks.album_call_budget", "--run", str(album_mode)],
+                            cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check how many provider calls tagging a whole album makes.")
+    parser.add_argument("--max-calls", type=int, default=12, help="Fail if album mode makes more calls than this.")
+    parser.add_argument("--run", choices=("True", "False"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run:
+        print(json.dumps(run_upload(args.run == "True")))
+        return 0
+
+    failed = False
+    for album_mode in (False, True):
+        result = measure(album_mode)
+        calls = sum(result['calls'].values())
+        tagged = [tags for tags in result['tags'] if tags]
+        consistent = len({(tags['TALB'], tags['TPE2'], tags['TDRC']) for tags in tagged}) == 1
+        print(f"Album mode {'on ' if album_mode else 'off'}: {calls} provider calls "
+              f"({', '.join(f'{name} {count}' for name, count in sorted(result['calls'].items()))}), "
+              f"{len(tagged)}/{len(TRACKS)} files tagged, album tags {'consistent' if consistent else 'inconsistent'}")
+        if album_mode:
+            for tags in tagged:
+                print(f"\t{tags['TIT2']} | {tags['TALB']} | {tags['TPE2']} | {tags['TDRC']}")
+            if calls > args.max_calls or not consistent or len(tagged) < len(TRACKS):
+                failed = True
+
+    if failed:
+        print(f"FAIL: album mode should tag every file consistently within {args.max_calls} provider calls.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
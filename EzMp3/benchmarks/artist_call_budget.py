@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+how to run:
+python -m EzMp3.benchmarks.artist_call_budget --tracks 12 --concurrency 8
+
+Re-tags an album's worth of tracks by one artist against benchmarks/stub_providers.py, once one track
+at a time and once concurrently in batch mode, and counts the artist-level calls: Spotify artist
+lookups for genres and Last.fm tag lookups. Genres and tags belong to the artist, so each run may
+cost one of each whatever the number of tracks. Exits with status 1 otherwise.
+'''
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+EZMP3_DIR = os.path.dirname(BENCHMARK_DIR)
+REPO_DIR = os.path.dirname(EZMP3_DIR)
+ARTIST_ROUTES = ("spotify spotify_artist.json", "spotify spotify_artists.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check how many artist lookups re-tagging an album makes.")
+    parser.add_argument("--tracks", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    for path in (REPO_DIR, EZMP3_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    from EzMp3.benchmarks.corpus import song_titles
+    from EzMp3.benchmarks.stub_providers import StubProviders
+
+    stub = StubProviders().start()
+    failed = False
+    try:
+        # The provider modules read their settings on import, so the environment has to be set first
+        os.environ.update(stub.env())
+        work_dir = tempfile.mkdtemp(prefix="ezmp3-artist-")
+        os.chdir(work_dir)  # Spotify's client caches its token in the working directory
+        os.environ.update({'RATE_LIMIT_STORE': os.path.join(work_dir, "limits.db"),
+                           'SPOTIFY_CLIENT_ID': "benchmark", 'SPOTIFY_CLIENT_SECRET': "benchmark",
+                           'LASTFM_API_KEY': "benchmark"})
+        for provider in ('spotify', 'lastfm'):
+            os.environ[f"{provider.upper()}_RATE_LIMIT"] = "10000"
+            os.environ[f"{provider.upper()}_RATE_BURST"] = "10000"
+        from EzMp3.app.services.artist_cache import artists, batch_mode
+        from EzMp3.app.services.lastfm_services import fetch_lastfm_tags
+        from EzMp3.app.services.spotify_services import fetch_spotify_metadata
+
+        def retag(title):
+            metadata = fetch_spotify_metadata(title, "Queen")
+            fetch_lastfm_tags(title, "Queen")
+            return metadata
+
+        titles = song_titles(args.tracks)
+        for mode in ("one at a time", "batch"):
+            artists.clear()
+            stub.reset()
+            if mode == "batch":
+                with batch_mode(), ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    results = list(pool.map(retag, titles))
+            else:
+                results = [retag(title) for title in titles]
+            routes = stub.stats()['routes']
+            artist_calls = sum(routes.get(route, 0) for route in ARTIST_ROUTES)
+            tag_calls = routes.get("lastfm lastfm_toptags.json", 0)
+            genres = sum(1 for result in results if result and result['genres'])
+            print(f"{mode.capitalize()}: {args.tracks} tracks, {genres} with genres, "
+                  f"{artist_calls} Spotify artist call(s), {tag_calls} Last.fm tag call(s)")
+            if artist_calls > 1 or tag_calls > 1:
+                failed = True
+    finally:
+        stub.stop()
+
+    if failed:
+        print("FAIL: re-tagging an album looked its artist up more than once.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
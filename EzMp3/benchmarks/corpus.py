@@ -0,0 +1,94 @@
+import argparse
+import os
+import random
+from mutagen.id3 import ID3, TIT2, TPE1, TPE2, TALB, TDRC, TCON
+
+'''
+how to run:
+python -m EzMp3.benchmarks.corpus /tmp/corpus --files 200 --tagged 0.3 --complete 0.1
+
+Writes synthetic MP3 files named after made-up song titles. The audio is a run of silent-header MPEG-1
+Layer III frames (128 kbit/s, 44.1 kHz) with a seeded random payload, so every file has a distinct
+audio hash and the upload path never short-circuits on a duplicate. A share of the files get a
+partial ID3 tag (title, sometimes artist or album) like files ripped by other tools, and another
+share a complete one, which the app keeps without a lookup.
+'''
+
+FRAME_HEADER = bytes.fromhex("FFFB9000")  # MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, no padding
+FRAME_SIZE = 417  # 144 * 128000 // 44100
+ADJECTIVES = ["Midnight", "Golden", "Electric", "Silent", "Crimson", "Wandering", "Hollow", "Velvet",
+              "Broken", "Neon", "Distant", "Paper", "Burning", "Frozen", "Secret", "Restless"]
+NOUNS = ["Harbor", "Highway", "Letters", "Garden", "Skyline", "River", "Echoes", "Mirrors",
+         "Lanterns", "Satellites", "Tides", "Avenue", "Thunder", "Fireflies", "Horizon", "Parade"]
+ARTISTS = ["Queen", "The Night Owls", "Marla Vance", "Static Bloom", "Hollow Pines"]
+
+
+def song_titles(count, seed=0):
+    """Distinct, plausible song titles; a number is appended once the word pairs run out."""
+    rng = random.Random(seed)
+    pairs = [f"{adjective} {noun}" for adjective in ADJECTIVES for noun in NOUNS]
+    rng.shuffle(pairs)
+    return [pairs[i % len(pairs)] + (f" {i // len(pairs) + 1}" if i >= len(pairs) else "") for i in range(count)]
+
+
+def mp3_bytes(rng, frames):
+    """Audio for one file: MPEG frames with random payloads."""
+    return b''.join(FRAME_HEADER + rng.randbytes(FRAME_SIZE - len(FRAME_HEADER)) for _ in range(frames))
+
+
+def write_partial_tag(file_path, title, rng):
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=title))
+    if rng.random() < 0.5:
+        tags.add(TPE1(encoding=3, text=rng.choice(ARTISTS)))
+    if rng.random() < 0.3:
+        tags.add(TALB(encoding=3, text=f"{title} (Single)"))
+    tags.save(file_path)
+
+
+def write_complete_tag(file_path, title, rng):
+    tags = ID3()
+    artist = rng.choice(ARTISTS)
+    tags.add(TIT2(encoding=3, text=title))
+    tags.add(TPE1(encoding=3, text=artist))
+    tags.add(TPE2(encoding=3, text=artist))
+    tags.add(TALB(encoding=3, text=f"{title} (Single)"))
+    tags.add(TDRC(encoding=3, text=str(rng.randint(1970, 2020))))
+    tags.add(TCON(encoding=3, text="Rock"))
+    tags.save(file_path)
+
+
+def generate(directory, count, frames=40, tagged=0.3, seed=0, complete=0.0):
+    """Write `count` MP3 files to `directory` and return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for title in song_titles(count, seed):
+        file_path = os.path.join(directory, f"{title}.mp3")
+        with open(file_path, 'wb') as f:
+            f.write(mp3_bytes(rng, frames))
+        draw = rng.random()
+        if draw < complete:
+            write_complete_tag(file_path, title, rng)
+        elif draw < complete + tagged:
+            write_partial_tag(file_path, title, rng)
+        paths.append(file_path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic MP3 corpus.")
+    parser.add_argument("directory")
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--frames", type=int, default=40, help="MPEG frames per file (about 26 ms each).")
+    parser.add_argument("--tagged", type=float, default=0.3, help="Share of files given a partial ID3 tag.")
+    parser.add_argument("--complete", type=float, default=0.0, help="Share of files given a complete ID3 tag.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    paths = generate(args.directory, args.files, args.frames, args.tagged, args.seed, args.complete)
+    print(f"Wrote {len(paths)} files to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+how to run:
+python -m EzMp3.benchmarks.deezer_call_budget --lookups 50 --concurrency 8 --finalists 1
+
+Runs Deezer lookups of distinct titles against benchmarks/stub_providers.py and counts the HTTP calls
+they make. Each lookup may cost one search and one track fetch; an album is fetched once however
+many lookups hit it, since album details are cached, and only albums of the finalist hits are
+fetched at all (DEEZER_FINALISTS, set by --finalists). Exits with status 1 when a lookup pages through
+results, fetches an album again or fetches one that wasn't a finalist, so a regression fails the run
+instead of going unnoticed.
+'''
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+EZMP3_DIR = os.path.dirname(BENCHMARK_DIR)
+REPO_DIR = os.path.dirname(EZMP3_DIR)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check how many HTTP calls a Deezer lookup makes.")
+    parser.add_argument("--lookups", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--finalists", type=int, default=1, help="DEEZER_FINALISTS for the run")
+    args = parser.parse_args(argv)
+
+    for path in (REPO_DIR, EZMP3_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    from EzMp3.benchmarks.corpus import song_titles
+    from EzMp3.benchmarks.stub_providers import StubProviders, load_fixtures
+
+    stub = StubProviders().start()
+    try:
+        # The provider module reads its settings on import, so the environment has to be set first
+        os.environ.update(stub.env())
+        os.environ.update({'RATE_LIMIT_STORE': os.path.join(tempfile.mkdtemp(prefix="ezmp3-deezer-"), "limits.db"),
+                           'DEEZER_RATE_LIMIT': "10000", 'DEEZER_RATE_BURST': "10000",
+                           'DEEZER_FINALISTS': str(args.finalists)})
+        from EzMp3.app.services.deezer_services import fetch_deezer_metadata
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(fetch_deezer_metadata, song_titles(args.lookups)))
+        routes = stub.stats()['routes']
+    finally:
+        stub.stop()
+
+    # Every search answers with the same fixture hits, and the closest of them are the same finalists every time
+    albums = len({hit['album']['id'] for hit in json.loads(load_fixtures()['deezer_search.json'])['data']})
+    albums = min(albums, args.finalists)
+    calls = {
+        'search': routes.get("deezer deezer_search.json", 0),
+        'album': routes.get("deezer deezer_album.json", 0),
+        'track': routes.get("deezer deezer_track.json", 0),
+    }
+    budget = {'search': args.lookups, 'album': albums, 'track': args.lookups}
+
+    print(f"{args.lookups} Deezer lookups, {sum(1 for result in results if result)} resolved, "
+          f"{sum(calls.values()) / args.lookups:.2f} HTTP calls per lookup")
+    failed = False
+    for kind, count in calls.items():
+        print(f"{kind.capitalize()}\t: {count} calls (budget {budget[kind]})")
+        if count > budget[kind]:
+            failed = True
+    if failed:
+        print("FAIL: Deezer lookups made more HTTP calls than budgeted.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
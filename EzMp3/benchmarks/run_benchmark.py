@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import pickle
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+'''
+how to run:
+python -m EzMp3.benchmarks.run_benchmark --files 200 --concurrency 8 --latency default=0.05 --label baseline
+python -m EzMp3.benchmarks.run_benchmark --files 200 --concurrency 8 --latency default=0.05 --compare EzMp3/benchmarks/results/baseline.json
+
+Uploads a synthetic corpus through /api/upload and downloads every result through /api/download, with
+all providers answered by benchmarks/stub_providers.py, so nothing leaves the machine. Reports
+p50/p95/p99 latency per endpoint, files per second, peak RSS and provider calls, and saves the run as
+JSON under benchmarks/results/ for comparing before and after a change.
+'''
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+EZMP3_DIR = os.path.dirname(BENCHMARK_DIR)
+REPO_DIR = os.path.dirname(EZMP3_DIR)
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+PERCENTILES = (50, 95, 99)
+
+
+def start_stub(args):
+    """Run the stub providers in their own process, so their threads don't compete with the app for the GIL."""
+    command = [sys.executable, "-m", "EzMp3.benchmarks.stub_providers", "--jitter", str(args.jitter),
+               "--seed", str(args.seed)]
+    for latency in args.latency or []:
+        command += ["--latency", latency]
+    for error_rate in args.error_rate or []:
+        command += ["--error-rate", error_rate]
+    process = subprocess.Popen(command, cwd=REPO_DIR, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("READY "):
+        process.kill()
+        raise RuntimeError("Stub providers failed to start.")
+    _, url, env = line.split(" ", 2)
+    return process, url, json.loads(env)
+
+
+def configure_environment(stub_env, work_dir, real_rate_limits):
+    """Point the app at the stub and at throwaway storage; must run before the app is imported."""
+    os.environ.update(stub_env)
+    os.environ.update({
+        'SPOTIFY_CLIENT_ID': "benchmark",
+        'SPOTIFY_CLIENT_SECRET': "benchmark",
+        'CONSUMER_KEY': "benchmark",
+        'CONSUMER_SECRET': "benchmark",
+        'LASTFM_API_KEY': "benchmark",
+        'MP3_DIRECTORY': os.path.join(work_dir, "music"),
+        'EXPORT_DIRECTORY': os.path.join(work_dir, "exports"),
+        'METADATA_CACHE_PATH': os.path.join(work_dir, "metadata_cache.db"),
+        'RATE_LIMIT_STORE': os.path.join(work_dir, "rate_limits.db"),
+        'LOCAL_CATALOG_ENABLED': "False",
+    })
+    if not real_rate_limits:
+        for provider in ('spotify', 'deezer', 'discogs', 'musicbrainz', 'lastfm', 'theaudiodb'):
+            os.environ[f"{provider.upper()}_RATE_LIMIT"] = "10000"
+            os.environ[f"{provider.upper()}_RATE_BURST"] = "10000"
+
+    # The app reads the Discogs token and writes exports relative to the working directory
+    os.chdir(work_dir)
+    with open("discogs_token.pkl", 'wb') as f:
+        pickle.dump({'oauth_token': "benchmark", 'oauth_token_secret': "benchmark"}, f)
+    for path in (REPO_DIR, EZMP3_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def percentiles(samples):
+    if not samples:
+        return {f"p{p}": None for p in PERCENTILES}
+    ordered = sorted(samples)
+    return {f"p{p}": round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 2)
+            for p in PERCENTILES}
+
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix="ezmp3-bench-")
+    stub, stub_url, stub_env = start_stub(args)
+    try:
+        configure_environment(stub_env, work_dir, args.real_rate_limits)
+        from EzMp3.benchmarks.corpus import generate
+        from app import create_app
+
+        files = generate(os.path.join(work_dir, "corpus"), args.files, args.frames, args.tagged, args.seed,
+                         args.complete)
+        app = create_app()
+        local = threading.local()
+        latencies = {'upload': [], 'download': []}
+        statuses = {}
+        lock = threading.Lock()
+
+        def record(endpoint, elapsed, status):
+            with lock:
+                latencies[endpoint].append(elapsed)
+                statuses[f"{endpoint} {status}"] = statuses.get(f"{endpoint} {status}", 0) + 1
+
+        def process(path):
+            if not hasattr(local, 'client'):
+                local.client = app.test_client()
+            client = local.client
+            with open(path, 'rb') as f:
+                start = time.perf_counter()
+                response = client.post("/api/upload", data={'file': (f, os.path.basename(path))},
+                                       content_type="multipart/form-data")
+                record('upload', time.perf_counter() - start, response.status_code)
+            if response.status_code != 200:
+                return
+            for _ in range(args.downloads):
+                start = time.perf_counter()
+                download = client.get(response.get_json()['download_url'])
+                download.get_data()
+                record('download', time.perf_counter() - start, download.status_code)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(process, files))
+        elapsed = time.perf_counter() - start
+
+        with urlopen(f"{stub_url}/_stats") as response:
+            provider_calls = json.load(response)
+        existing_tags = app.test_client().get("/api/cache/stats").get_json()['existing_tags']
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    return {
+        'label': args.label,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'settings': {'files': args.files, 'concurrency': args.concurrency, 'downloads': args.downloads,
+                     'frames': args.frames, 'tagged': args.tagged, 'complete': args.complete,
+                     'latency': args.latency or [], 'error_rate': args.error_rate or [],
+                     'real_rate_limits': args.real_rate_limits},
+        'elapsed_seconds': round(elapsed, 3),
+        'files_per_second': round(len(files) / elapsed, 2),
+        'latency_ms': {endpoint: percentiles(samples) for endpoint, samples in latencies.items()},
+        'statuses': statuses,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'provider_calls': provider_calls['providers'],
+        'provider_routes': provider_calls['routes'],
+        'existing_tags': existing_tags,
+    }
+
+
+def print_report(result, baseline=None):
+    def delta(value, old):
+        if baseline is None or value is None or not old:
+            return ""
+        return f" ({(value - old) / old:+.1%})"
+
+    print(f"\n== Benchmark: {result['label']} ==")
+    print(f"Files/s\t\t: {result['files_per_second']}{delta(result['files_per_second'], baseline and baseline['files_per_second'])}")
+    for endpoint, values in result['latency_ms'].items():
+        old_values = baseline['latency_ms'].get(endpoint, {}) if baseline else {}
+        text = ", ".join(f"{name} {value} ms{delta(value, old_values.get(name))}" for name, value in values.items())
+        print(f"{endpoint.capitalize()}\t\t: {text}")
+    print(f"Peak RSS\t: {result['peak_rss_mb']} MB{delta(result['peak_rss_mb'], baseline and baseline['peak_rss_mb'])}")
+    print(f"Statuses\t: {result['statuses']}")
+    if 'existing_tags' in result:
+        print(f"Existing tags\t: {result['existing_tags']}")
+    old_calls = baseline['provider_calls'] if baseline else {}
+    print("Provider calls\t: " + ", ".join(f"{provider} {count}{delta(count, old_calls.get(provider))}"
+                                          for provider, count in sorted(result['provider_calls'].items())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of upload and download.")
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--downloads", type=int, default=1, help="Downloads per uploaded file.")
+    parser.add_argument("--frames", type=int, default=40, help="MPEG frames per synthetic file.")
+    parser.add_argument("--tagged", type=float, default=0.3, help="Share of files with a partial ID3 tag.")
+    parser.add_argument("--complete", type=float, default=0.0, help="Share of files with a complete ID3 tag.")
+    parser.add_argument("--latency", action="append", metavar="PROVIDER=SECONDS",
+                        help="Stub response latency; 'default=' sets every provider.")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", action="append", metavar="PROVIDER=RATE",
+                        help="Share of stub responses that are HTTP 500.")
+    parser.add_argument("--real-rate-limits", action="store_true",
+                        help="Keep the providers' production rate limits instead of lifting them.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="Where to save the result (default: benchmarks/results/<label>.json).")
+    parser.add_argument("--compare", help="Earlier result file to compare against.")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.abspath(args.compare)) as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, f"{args.label}.json"))
+
+    result = run(args)
+    print_report(result, baseline)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=4)
+    print(f"\nResult saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+'''
+how to run:
+python -m EzMp3.benchmarks.startup_bench --runs 10 --max-ms 600
+
+Imports the API module in fresh interpreters, as a worker does when it starts, and reports the import
+time and which provider client libraries got loaded. Also imports the command line tools with only
+the repo root on the path, as their documented "python -m EzMp3..." commands do. Exits with status 1
+if a provider library was imported eagerly, the median import time is over --max-ms or a tool fails
+to import, so a regression fails the run instead of going unnoticed.
+'''
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+EZMP3_DIR = os.path.dirname(BENCHMARK_DIR)
+REPO_DIR = os.path.dirname(EZMP3_DIR)
+
+# Loaded on a provider's first lookup, never at startup
+PROVIDER_LIBRARIES = ('spotipy', 'deezer', 'oauth2', 'musicbrainzngs', 'httpx', 'pylast', 'fuzzywuzzy', 'requests')
+
+# Run as "python -m EzMp3..." from the repo root, so everything they import must go through EzMp3.app
+CLI_MODULES = ('EzMp3.app.utils.bulk_tagger', 'EzMp3.app.services.export_store', 'EzMp3.app.services.local_catalog',
+               'EzMp3.app.services.query_planner')
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.api.api_routes
+elapsed = time.perf_counter() - start
+print(json.dumps({'ms': elapsed * 1000, 'modules': [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure(module_names):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR, EZMP3_DIR, os.environ.get('PYTHONPATH', '')]))
+    output = subprocess.run([sys.executable, "-c", PROBE % (module_names,)], cwd=EZMP3_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_error(module_name):
+    """The error importing a module from the repo root with nothing else on the path, or None."""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    result = subprocess.run([sys.executable, "-c", f"import {module_name}"], cwd=REPO_DIR, env=env,
+                            capture_output=True, text=True)
+    return result.stderr.strip().splitlines()[-1] if result.returncode else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how long the API takes to import.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, help="Fail if the median import time is above this.")
+    args = parser.parse_args(argv)
+
+    measure(PROVIDER_LIBRARIES)  # Warm the bytecode cache so the first run isn't an outlier
+    runs = [measure(PROVIDER_LIBRARIES) for _ in range(args.runs)]
+    times = sorted(run['ms'] for run in runs)
+    eager = sorted({module for run in runs for module in run['modules']})
+    median = statistics.median(times)
+
+    print(f"Import app.api.api_routes: median {median:.1f} ms, min {times[0]:.1f} ms, max {times[-1]:.1f} ms "
+          f"over {args.runs} runs")
+    print(f"Provider libraries imported at startup: {', '.join(eager) or 'none'}")
+
+    broken = {name: error for name in CLI_MODULES if (error := import_error(name))}
+    print(f"Command line tools that fail to import from the repo root: "
+          f"{', '.join(f'{name} ({error})' for name, error in broken.items()) or 'none'}")
+
+    failed = False
+    if broken:
+        print("FAIL: command line tools must import through EzMp3.app only.")
+        failed = True
+    if eager:
+        print("FAIL: provider libraries must only be imported on first use.")
+        failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"FAIL: median import time is over the {args.max_ms} ms budget.")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from xml.sax.saxutils import escape
+
+'''
+how to run:
+python -m EzMp3.benchmarks.stub_providers --port 8900 --latency default=0.05 --latency musicbrainz=0.3 --error-rate deezer=0.1
+
+Local stand-ins for Spotify, Deezer, MusicBrainz, Discogs, Last.fm and TheAudioDB. Each answers with a
+recorded response from benchmarks/fixtures, with the searched title substituted in, after the
+configured latency. GET /_stats returns request counts per provider and route; POST /_reset clears them.
+'''
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+PROVIDER_NAMES = ('spotify', 'deezer', 'musicbrainz', 'discogs', 'lastfm', 'theaudiodb')
+
+# (provider, path pattern, fixture file, query parameter holding the searched title)
+ROUTES = [
+    ('spotify', re.compile(r"^/spotify/api/token$"), "spotify_token.json", None),
+    ('spotify', re.compile(r"^/spotify/v1/search$"), "spotify_search.json", 'q'),
+    ('spotify', re.compile(r"^/spotify/v1/artists/?$"), "spotify_artists.json", None),
+    ('spotify', re.compile(r"^/spotify/v1/artists/[^/]+$"), "spotify_artist.json", None),
+    ('deezer', re.compile(r"^/deezer/search/?$"), "deezer_search.json", 'q'),
+    ('deezer', re.compile(r"^/deezer/search/album/?$"), "deezer_album_search.json", None),
+    ('deezer', re.compile(r"^/deezer/album/\d+$"), "deezer_album.json", None),
+    ('deezer', re.compile(r"^/deezer/track/\d+$"), "deezer_track.json", None),
+    ('musicbrainz', re.compile(r"^/ws/2/recording/?$"), "musicbrainz_recordings.xml", 'query'),
+    ('discogs', re.compile(r"^/discogs/database/search$"), "discogs_search.json", 'track'),
+    ('lastfm', re.compile(r"^/lastfm/2\.0/?$"), "lastfm_toptags.json", 'track'),
+    ('theaudiodb', re.compile(r"^/theaudiodb/api/v1/json/[^/]+/searchtrack\.php$"), "theaudiodb_track.json", 't'),
+]
+DEFAULT_TITLE = "Bohemian Rhapsody"
+
+
+def load_fixtures():
+    fixtures = {}
+    for _, _, name, _ in ROUTES:
+        with open(os.path.join(FIXTURE_DIR, name), encoding='utf-8') as fixture:
+            fixtures[name] = fixture.read()
+    return fixtures
+
+
+def searched_title(value):
+    """Pull the title out of provider query syntax: recording:(...) (MusicBrainz), track:"..." (Deezer)
+    or track:... artist:... (Spotify)."""
+    match = (re.search(r'recording:\(((?:\\.|[^)])*)\)', value) or re.search(r'track:"((?:\\.|[^"])*)"', value)
+             or re.search(r"track:(.*?)(?=\s+\w+:|$)", value))
+    if match:
+        value = match.group(1)
+    return re.sub(r"\\(.)", r"\1", value).strip('"').strip() or DEFAULT_TITLE
+
+
+def parse_settings(values, default):
+    """Turn ["default=0.05", "musicbrainz=0.3"] into {provider: float}."""
+    settings = dict.fromkeys(PROVIDER_NAMES, default)
+    for value in values or []:
+        name, _, number = value.partition('=')
+        if name == 'default':
+            settings = {provider: float(number) for provider in settings} | {
+                provider: setting for provider, setting in settings.items() if setting != default}
+        else:
+            settings[name] = float(number)
+    return settings
+
+
+class StubProviders:
+    """Threaded HTTP server replaying provider responses with injected latency and errors."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, jitter=0.2, error_rate=None, seed=None):
+        self.latency = latency or dict.fromkeys(PROVIDER_NAMES, 0.0)
+        self.error_rate = error_rate or dict.fromkeys(PROVIDER_NAMES, 0.0)
+        self.jitter = jitter  # Latency varies by +/- this fraction
+        self.fixtures = load_fixtures()
+        self.random = random.Random(seed)
+        self.counts = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment variables that point every provider module at this server."""
+        host, port = self.server.server_address[:2]
+        return {
+            'SPOTIFY_API_URL': f"{self.url}/spotify/v1/",
+            'SPOTIFY_TOKEN_URL': f"{self.url}/spotify/api/token",
+            'DEEZER_API_URL': f"{self.url}/deezer",
+            'DISCOGS_API_URL': f"{self.url}/discogs",
+            'MUSICBRAINZ_HOST': f"{host}:{port}",
+            'MUSICBRAINZ_HTTPS': "False",
+            'LASTFM_API_URL': f"{self.url}/lastfm/2.0/",
+            'THEAUDIODB_API_URL': f"{self.url}/theaudiodb/api/v1/json",
+        }
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        per_provider = {}
+        for (provider, _), count in counts.items():
+            per_provider[provider] = per_provider.get(provider, 0) + count
+        return {'providers': per_provider, 'routes': {f"{p} {r}": c for (p, r), c in counts.items()}}
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-providers", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, path, query):
+        """Return (status, content type, body) for one request, after the provider's latency."""
+        for provider, pattern, fixture, parameter in ROUTES:
+            if pattern.match(path):
+                break
+        else:
+            return 404, "application/json", json.dumps({"error": f"No stub for {path}"})
+
+        with self._lock:
+            self.counts[(provider, fixture)] = self.counts.get((provider, fixture), 0) + 1
+            delay = self.latency[provider] * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+            failed = self.random.random() < self.error_rate[provider]
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            return 500, "application/json", json.dumps({"error": "Injected failure"})
+
+        title = searched_title(query.get(parameter, [DEFAULT_TITLE])[0]) if parameter else DEFAULT_TITLE
+        body = self.fixtures[fixture]
+        if fixture.endswith('.xml'):
+            return 200, "application/xml; charset=utf-8", body.replace("{query}", escape(title))
+        return 200, "application/json", body.replace("{query}", json.dumps(title)[1:-1])
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+
+            def _send(self, status, content_type, body):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    query.update(parse_qs(self.rfile.read(length).decode('utf-8')))
+
+                if url.path == "/_stats":
+                    return self._send(200, "application/json", json.dumps(stub.stats()))
+                if url.path == "/_reset":
+                    stub.reset()
+                    return self._send(200, "application/json", "{}")
+                self._send(*stub.respond(url.path, query))
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run local stand-ins for the metadata providers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port.")
+    parser.add_argument("--latency", action="append", metavar="PROVIDER=SECONDS",
+                        help="Mean response latency; 'default=' sets every provider.")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency varies by +/- this fraction.")
+    parser.add_argument("--error-rate", action="append", metavar="PROVIDER=RATE",
+                        help="Share of requests answered with HTTP 500; 'default=' sets every provider.")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    stub = StubProviders(args.host, args.port, parse_settings(args.latency, 0.0), args.jitter,
+                         parse_settings(args.error_rate, 0.0), args.seed).start()
+    # The benchmark runner reads this line to find the server
+    print(f"READY {stub.url} {json.dumps(stub.env())}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())